@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmark_habit_tracker import summarize
+
+SERVICE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "habit_service.py")
+
+
+def free_port():
+    """
+    Finds a local port nothing listens on.
+
+    Returns:
+        int: The port.
+    """
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_service(data_file, port, journal, batch_window):
+    """
+    Starts habit_service.py in a separate process and waits until it accepts connections.
+
+    Returns:
+        subprocess.Popen: The service process.
+    """
+    command = [sys.executable, SERVICE, "--data-file", data_file, "--port", str(port),
+               "--batch-window", str(batch_window)]
+    if not journal:
+        command.append("--no-journal")
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("The service did not start")
+
+
+async def request(reader, writer, method, path, payload=None):
+    """
+    Sends one request on a keep-alive connection and reads the response.
+
+    Returns:
+        tuple: The status code and the parsed JSON body.
+    """
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n"
+                 .encode("latin-1") + body)
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def run_clients(port, habits, connections, requests, write_ratio, seed):
+    """
+    Sends requests from concurrent keep-alive connections: completions with probability
+    write_ratio, otherwise streak lookups, each for a random habit.
+
+    Returns:
+        dict: The latency summary of all requests, with the overall requests per second.
+    """
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+
+    async def client(count):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(count):
+            task = f"Habit {rng.randrange(habits)}"
+            if rng.random() < write_ratio:
+                method, path = "POST", f"/habits/{task.replace(' ', '%20')}/complete"
+            else:
+                method, path = "GET", f"/habits/{task.replace(' ', '%20')}/streak"
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path)
+            latencies.append(time.perf_counter() - start)
+            errors += status != 200
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(requests // connections) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    result = summarize(latencies)
+    result["requests_per_s"] = round(len(latencies) / elapsed, 2)
+    result["errors"] = errors
+    return result
+
+
+async def create_habits(port, habits):
+    """
+    Creates the habits the load test uses.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for number in range(habits):
+        await request(reader, writer, "POST", "/habits", {"task": f"Habit {number}", "periodicity": "daily"})
+    writer.close()
+
+
+def main(argv=None):
+    """
+    Load-tests habit_service.py and prints a JSON report.
+
+    Parameters:
+        - argv (list): Command line arguments, defaults to sys.argv (optional).
+    """
+    parser = argparse.ArgumentParser(description="Load-test the habit HTTP service.")
+    parser.add_argument("--habits", type=int, default=1000, help="Habits created before the test.")
+    parser.add_argument("--connections", type=int, default=50, help="Concurrent keep-alive connections.")
+    parser.add_argument("--requests", type=int, default=20000, help="Requests per workload.")
+    parser.add_argument("--write-ratios", type=float, nargs="+", default=[0.0, 0.2, 1.0],
+                        help="Shares of completions in each workload; the rest are streak lookups.")
+    parser.add_argument("--batch-window", type=float, default=0.005)
+    parser.add_argument("--no-journal", action="store_true", help="Rewrite the whole data file on every flush.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="habit-service-")
+    port = free_port()
+    process = start_service(os.path.join(workdir, "habit_data.json"), port, not args.no_journal, args.batch_window)
+    report = {
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": {}
+    }
+    try:
+        asyncio.run(create_habits(port, args.habits))
+        for write_ratio in args.write_ratios:
+            report["results"][f"writes_{write_ratio:g}"] = asyncio.run(
+                run_clients(port, args.habits, args.connections, args.requests, write_ratio, args.seed))
+    finally:
+        process.terminate()
+        process.wait()
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
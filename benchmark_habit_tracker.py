@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from habit_model import TIMESTAMP_FORMAT
+from habit_storage import DATA_FORMAT_VERSION, BinaryStorage, pack_timestamps
+from habit_tracker import HabitTracker, Analytics
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+def generate_dataset(path, habit_count, history_days=90, seed=0):
+    """
+    Writes a synthetic data file with realistic completion histories.
+
+    Each habit is daily or weekly, was created up to history_days ago, and was completed in most
+    of its periods since then, with the occasional gap and the odd repeat within a period.
+
+    Parameters:
+        - path (str): The data file to write.
+        - habit_count (int): The number of habits.
+        - history_days (int): How far back the histories reach (optional).
+        - seed (int): Seed for the random generator, so datasets are reproducible (optional).
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    habits = []
+    for number in range(habit_count):
+        periodicity = "daily" if rng.random() < 0.7 else "weekly"
+        period = 86400 if periodicity == "daily" else 7 * 86400
+        created_at = now - rng.randint(1, history_days) * 86400
+        reliability = rng.uniform(0.5, 0.98)
+        timestamps = []
+        start = created_at
+        while start < now:
+            if rng.random() < reliability:
+                timestamps.append(start + rng.randint(0, period - 1))
+                if rng.random() < 0.05:
+                    timestamps.append(start + rng.randint(0, period - 1))
+            start += period
+        timestamps = sorted(timestamp for timestamp in timestamps if timestamp < now)
+        habits.append({
+            "task": f"Habit {number}",
+            "periodicity": periodicity,
+            "created_at": created_at,
+            "completed_at": pack_timestamps(timestamps)
+        })
+    with open(path, "w") as file:
+        json.dump({"version": DATA_FORMAT_VERSION, "habits": habits}, file)
+
+
+def summarize(latencies):
+    """
+    Summarizes the latencies of one benchmarked operation.
+
+    Parameters:
+        - latencies (list): Latencies in seconds.
+
+    Returns:
+        dict: Count, total time, throughput and latency percentiles in milliseconds.
+    """
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "total_s": round(total, 6),
+        "ops_per_s": round(len(ordered) / total, 2) if total else None,
+        "p50_ms": round(percentile(0.5), 4),
+        "p90_ms": round(percentile(0.9), 4),
+        "p99_ms": round(percentile(0.99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4)
+    }
+
+
+def measure(operation, arguments):
+    """
+    Times an operation once per set of arguments.
+
+    Parameters:
+        - operation (callable): The operation to time.
+        - arguments (iterable): Argument tuples, one per call.
+
+    Returns:
+        list: Latencies in seconds.
+    """
+    latencies = []
+    for args in arguments:
+        start = time.perf_counter()
+        operation(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def run_size(workdir, habit_count, ops, repeat, storage, seed):
+    """
+    Benchmarks every tracked operation for one dataset size.
+
+    Parameters:
+        - workdir (str): Directory for the data files.
+        - habit_count (int): The number of habits in the dataset.
+        - ops (int): The number of mutations timed per mutating operation.
+        - repeat (int): The number of times whole-dataset operations are timed.
+        - storage (str): "json" for whole-file JSON saves, "journal" for journal mode, or "binary"
+          for binary snapshots in journal mode.
+        - seed (int): Seed for the dataset and the operations.
+
+    Returns:
+        dict: Summaries keyed by operation, plus the peak memory of loading the dataset.
+    """
+    rng = random.Random(seed)
+    data_file = os.path.join(workdir, f"habits_{habit_count}.json")
+    generate_dataset(data_file, habit_count, seed=seed)
+    if storage == "binary":
+        binary_file = os.path.join(workdir, f"habits_{habit_count}.habits")
+        BinaryStorage(binary_file).save(HabitTracker(data_file=data_file))
+        data_file = binary_file
+    journal = storage != "json"
+    results = {"data_file_bytes": os.path.getsize(data_file)}
+
+    tracemalloc.start()
+    HabitTracker(data_file=data_file)
+    results["load_peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    results["load_data"] = summarize(measure(lambda: HabitTracker(data_file=data_file), [()] * repeat))
+    tracker = HabitTracker(data_file=data_file, journal=journal)
+    analytics = Analytics(tracker)
+    results["save_data"] = summarize(measure(tracker.save_data, [()] * repeat))
+
+    names = [f"Benchmark {number}" for number in range(ops)]
+    results["create_habit"] = summarize(measure(tracker.create_habit, [(name, "daily") for name in names]))
+    existing = [f"Habit {rng.randrange(habit_count)}" for _ in range(ops)]
+    results["complete_task"] = summarize(measure(tracker.complete_task, [(name,) for name in existing]))
+    results["delete_habit"] = summarize(measure(tracker.delete_habit, [(name,) for name in names]))
+
+    results["get_habits_by_periodicity"] = summarize(
+        measure(analytics.get_habits_by_periodicity, [("daily",)] * repeat))
+    results["get_longest_run_streak_all"] = summarize(measure(analytics.get_longest_run_streak_all, [()] * repeat))
+    results["get_broken_habits"] = summarize(measure(analytics.get_broken_habits, [()] * repeat))
+    tracker.close()
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms=0.05):
+    """
+    Compares benchmark results against a baseline.
+
+    An operation regresses when its median latency exceeds the baseline by more than the
+    tolerance and by more than min_delta_ms, so timer noise on sub-microsecond operations
+    doesn't count. Peak memory and file size are checked against the tolerance alone.
+
+    Parameters:
+        - results (dict): The current benchmark report.
+        - baseline (dict): The baseline benchmark report.
+        - tolerance (float): Allowed slowdown as a fraction, e.g. 0.5 for 50%.
+        - min_delta_ms (float): Smallest median slowdown in milliseconds that counts (optional).
+
+    Returns:
+        list: Descriptions of the regressions.
+    """
+    regressions = []
+    for size, operations in results["results"].items():
+        baseline_operations = baseline["results"].get(size, {})
+        for name, summary in operations.items():
+            expected = baseline_operations.get(name)
+            if expected is None:
+                continue
+            if isinstance(summary, dict):
+                current, previous, unit, slack = summary["p50_ms"], expected["p50_ms"], " ms p50", min_delta_ms
+            else:
+                current, previous, unit, slack = summary, expected, " bytes", 0
+            if previous and current > previous * (1 + tolerance) and current - previous > slack:
+                regressions.append(f"{size} habits, {name}: {current}{unit} vs baseline {previous}{unit}")
+    return regressions
+
+
+def main(argv=None):
+    """
+    Runs the benchmark suite.
+
+    Parameters:
+        - argv (list): Command line arguments, defaults to sys.argv (optional).
+
+    Returns:
+        int: The exit status, 1 if a regression against the baseline was found.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark HabitTracker and Analytics on synthetic datasets.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of habits.")
+    parser.add_argument("--ops", type=int, default=200, help="Mutations timed per mutating operation.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of whole-dataset operations.")
+    parser.add_argument("--storage", choices=["json", "journal", "binary"], default="journal",
+                        help="Persist mutations by rewriting the data file, by journaling, or by journaling "
+                             "on top of a binary snapshot.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline report to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown against the baseline.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the report as the new baseline.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="habit_benchmark_")
+    try:
+        report = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "storage": args.storage,
+                "ops": args.ops,
+                "repeat": args.repeat,
+                "created_at": datetime.now().strftime(TIMESTAMP_FORMAT)
+            },
+            "results": {}
+        }
+        for size in args.sizes:
+            report["results"][str(size)] = run_size(
+                workdir, size, args.ops, args.repeat, args.storage, args.seed)
+    finally:
+        shutil.rmtree(workdir)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            file.write(text + "\n")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+import lzma
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+
+# Archive segment layout, little-endian: header (magic, codec, completion count, first and last
+# completion, payload size), then the compressed int64 deltas between consecutive completions
+SEGMENT_MAGIC = b"HSEG"
+SEGMENT_HEADER = struct.Struct("<4sBxxxIqqI")
+CODECS = {"zlib": 1, "lzma": 2}
+# Older completions are archived in runs of at least this many, so segments are worth compressing
+ARCHIVE_MIN_COMPLETIONS = 64
+# Bytes of decompressed segments an archive keeps in memory for reads
+ARCHIVE_CACHE_BYTES = 8 << 20
+
+
+class HistoryArchive:
+    def __init__(self, path, codec="zlib", cache_bytes=ARCHIVE_CACHE_BYTES):
+        """
+        Initializes a HistoryArchive, an append-only file of compressed segments holding old
+        completions of habits.
+
+        A segment is never changed once written, so readers in any process can find it by its
+        offset. Segments of deleted habits, or of histories pulled back into memory, stay in the
+        file unused.
+
+        Parameters:
+            - path (str): The archive file.
+            - codec (str): "zlib" or "lzma", for the segments written (optional).
+            - cache_bytes (int): Bytes of decompressed segments to keep for reads (optional).
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown archive codec '{codec}'. Use one of {', '.join(CODECS)}.")
+        self.path = path
+        self.codec = codec
+        self.cache_bytes = cache_bytes
+        self.reads = 0  # Segments read and decompressed so far
+        self._cache = OrderedDict()  # Decompressed segments by offset, least recently used first
+        self._cached = 0
+        self._lock = threading.Lock()
+        self._reader = None
+        self._writer = None
+
+    def append(self, timestamps):
+        """
+        Appends a segment. It is only durable after sync. Must be called holding the data
+        file's lock, so processes don't append at the same time.
+
+        Parameters:
+            - timestamps (array): Sorted completion timestamps, at least one.
+
+        Returns:
+            tuple: The segment reference (offset, size, count, first, last), as kept by
+            TieredHistory and in the data file.
+        """
+        deltas = array("q", timestamps)
+        for position in range(len(deltas) - 1, 0, -1):
+            deltas[position] -= deltas[position - 1]
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        if self.codec == "lzma":
+            payload = lzma.compress(deltas.tobytes())
+        else:
+            payload = zlib.compress(deltas.tobytes(), 6)
+        header = SEGMENT_HEADER.pack(SEGMENT_MAGIC, CODECS[self.codec], len(timestamps), timestamps[0],
+                                     timestamps[-1], len(payload))
+        with self._lock:
+            if self._writer is None:
+                self._writer = open(self.path, "ab")
+            offset = self._writer.seek(0, os.SEEK_END)
+            self._writer.write(header + payload)
+        return offset, len(header) + len(payload), len(timestamps), timestamps[0], timestamps[-1]
+
+    def sync(self):
+        """
+        Makes the segments appended so far durable.
+        """
+        with self._lock:
+            if self._writer is not None:
+                self._writer.flush()
+                os.fsync(self._writer.fileno())
+
+    def read(self, segment):
+        """
+        Reads the completions of a segment, from the cache if it was read lately.
+
+        Parameters:
+            - segment (tuple): The segment reference returned by append.
+
+        Returns:
+            array: The completion timestamps as array('q'), shared with the cache and not to be changed.
+        """
+        offset, size, count = segment[:3]
+        with self._lock:
+            history = self._cache.get(offset)
+            if history is not None:
+                self._cache.move_to_end(offset)
+                return history
+            if self._writer is not None:
+                self._writer.flush()
+            if self._reader is None:
+                self._reader = open(self.path, "rb")
+            self._reader.seek(offset)
+            data = self._reader.read(size)
+        magic, codec, stored, _, _, length = SEGMENT_HEADER.unpack_from(data) \
+            if len(data) >= SEGMENT_HEADER.size else (None,) * 6
+        if magic != SEGMENT_MAGIC or stored != count or SEGMENT_HEADER.size + length != size:
+            raise ValueError(f"The archive segment at offset {offset} of {self.path} is damaged.")
+        payload = data[SEGMENT_HEADER.size:]
+        deltas = array("q", lzma.decompress(payload) if codec == CODECS["lzma"] else zlib.decompress(payload))
+        if sys.byteorder == "big":
+            deltas.byteswap()
+        history = array("q", accumulate(deltas))
+        with self._lock:
+            self.reads += 1
+            if offset not in self._cache:
+                self._cache[offset] = history
+                self._cached += 8 * count
+                # Always keep the segment just read, even if it is larger than the cache
+                while self._cached > self.cache_bytes and len(self._cache) > 1:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cached -= 8 * len(evicted)
+        return history
+
+    def cached_bytes(self):
+        """
+        Returns the bytes of decompressed segments in the cache.
+        """
+        return self._cached
+
+    def close(self):
+        """
+        Closes the archive file and empties the cache.
+        """
+        with self._lock:
+            for file in (self._reader, self._writer):
+                if file is not None:
+                    file.close()
+            self._reader = self._writer = None
+            self._cache.clear()
+            self._cached = 0
+
+
+class TieredHistory:
+    __slots__ = ("archive", "segments", "recent", "_starts")
+
+    def __init__(self, archive, segments, recent):
+        """
+        Initializes a TieredHistory, which stands in for the completion history of a habit whose
+        older completions were moved to a HistoryArchive.
+
+        Only the recent completions stay in memory. The length and the first and last completion
+        are known from the segment references; reading older completions by index or iterating
+        reads their segments through the archive's cache. Appending and changing recent
+        completions happen in memory, while any other change pulls the archived completions back
+        in first, after which the whole history is saved in the data file again.
+
+        Parameters:
+            - archive (HistoryArchive): The archive holding the segments.
+            - segments (list): Segment references in time order, see HistoryArchive.append.
+            - recent (array): The completions after the archived ones as array('q').
+        """
+        self.archive = archive
+        self.segments = segments
+        self.recent = recent
+        self._starts = [0]  # Position of the first completion of every segment, plus the archived count
+        for segment in segments:
+            self._starts.append(self._starts[-1] + segment[2])
+
+    def archived(self):
+        """
+        Returns the number of archived completions.
+        """
+        return self._starts[-1]
+
+    def push(self, segment):
+        """
+        Records that the oldest recent completions were archived as a segment, and drops them
+        from memory.
+
+        Parameters:
+            - segment (tuple): The segment reference returned by HistoryArchive.append.
+        """
+        self.segments.append(segment)
+        self._starts.append(self._starts[-1] + segment[2])
+        del self.recent[:segment[2]]
+
+    def load(self):
+        """
+        Builds the whole history, without keeping it.
+
+        Returns:
+            array: The completion timestamps as array('q').
+        """
+        history = array("q")
+        for segment in self.segments:
+            history.extend(self.archive.read(segment))
+        history.extend(self.recent)
+        return history
+
+    def copy(self):
+        """
+        Returns an independent copy of the history, which shares the archive segments.
+
+        Returns:
+            TieredHistory: The copy.
+        """
+        return TieredHistory(self.archive, list(self.segments), self.recent[:])
+
+    def raw(self):
+        # There are no undecoded bytes to hand out, see LazyHistory.raw
+        return None
+
+    def _materialize(self):
+        """
+        Pulls the archived completions back into memory for a change that touches them.
+
+        Returns:
+            array: The whole history, which is now the recent part.
+        """
+        if self.segments:
+            self.recent = self.load()
+            self.segments = []
+            self._starts = [0]
+        return self.recent
+
+    def _position(self, index):
+        """
+        Turns an index into a non-negative position.
+        """
+        if index < 0:
+            index += len(self)
+            if index < 0:
+                raise IndexError("array index out of range")
+        return index
+
+    def __len__(self):
+        return self._starts[-1] + len(self.recent)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.load()[index]
+        index = self._position(index)
+        archived = self._starts[-1]
+        if index >= archived:
+            return self.recent[index - archived]
+        number = bisect_right(self._starts, index) - 1
+        segment = self.segments[number]
+        if index == self._starts[number]:
+            return segment[3]
+        if index == self._starts[number + 1] - 1:
+            return segment[4]
+        return self.archive.read(segment)[index - self._starts[number]]
+
+    def __setitem__(self, index, value):
+        self._materialize()[index] = value
+
+    def __delitem__(self, index):
+        if not isinstance(index, slice):
+            index = self._position(index)
+            if index >= self._starts[-1]:
+                del self.recent[index - self._starts[-1]]
+                return
+        del self._materialize()[index]
+
+    def insert(self, index, value):
+        index = max(self._position(index) if index >= -len(self) else 0, 0)
+        archived = self._starts[-1]
+        if index > archived or (index == archived and (not archived or value >= self.segments[-1][4])):
+            self.recent.insert(index - archived, value)
+        else:
+            self._materialize().insert(index, value)
+
+    def append(self, value):
+        self.recent.append(value)
+
+    def __iter__(self):
+        for segment in self.segments:
+            yield from self.archive.read(segment)
+        yield from self.recent
+
+    def __eq__(self, other):
+        return self.load() == (other.load() if isinstance(other, TieredHistory) else other)
+
+    def __repr__(self):
+        return repr(self.load())
+
+    def __getattr__(self, name):
+        # pop, remove, extend, tobytes and the rest of the array interface
+        if name.startswith("_") or name in TieredHistory.__slots__:
+            raise AttributeError(name)
+        return getattr(self._materialize(), name)
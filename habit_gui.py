@@ -1,9 +1,240 @@
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox
-from habit_tracker import HabitTracker, Analytics
+from habit_tracker import HabitTracker, Analytics, Habit, format_timestamp
+from habit_metrics import instrument
+import bisect
 import json
+import os
+import threading
 from datetime import datetime
 
+# Set HABIT_TRACKER_METRICS=1 to collect metrics, and HABIT_TRACKER_METRICS_FILE to also dump them to a file
+METRICS_ENABLED = os.environ.get("HABIT_TRACKER_METRICS") == "1"
+METRICS_FILE = os.environ.get("HABIT_TRACKER_METRICS_FILE")
+APP_METHODS = ("create_habit", "delete_habit", "complete_task", "list_habit", "apply_changes", "update_pickers",
+               "update_list_text", "display_analytics_results", "reset_app")
+
+# Rows of the habit list and suggestions of a habit picker that are materialized at a time
+VISIBLE_ROWS = 15
+PICKER_MATCHES = 8
+# Milliseconds between checks for changes other processes made to the data file
+SYNC_INTERVAL = 2000
+# Columns of the habit list as (column, heading); every column can be sorted by
+LIST_COLUMNS = (("task", "Task"), ("periodicity", "Periodicity"), ("streak", "Streak"),
+                ("longest_streak", "Longest"), ("last_completed", "Last Completed"))
+
+
+class HabitListModel:
+    def __init__(self, tracker):
+        """
+        Initializes a HabitListModel, which keeps the habits of a tracker in display order.
+
+        The order is a sorted list of (sort value, key) pairs that is patched as habits change,
+        so the list widget only ever reads the slice of rows that is on screen. A second sorted
+        list of the lower-cased names serves prefix matches for the habit pickers.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker whose habits are listed.
+        """
+        self.tracker = tracker
+        self.sort_by = "task"
+        self.descending = False
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Rebuilds the display order from all habits, e.g. after a reset or a change of sort column.
+        """
+        self._values = {key: self._sort_value(habit) for key, habit in self.tracker.habits.items()}
+        self._order = sorted((value, key) for key, value in self._values.items())
+        self._names = sorted(self._values)
+
+    def sort(self, column):
+        """
+        Sorts the habits by a column, or reverses the order if they are already sorted by it.
+
+        Parameters:
+            - column (str): One of the columns in LIST_COLUMNS.
+        """
+        if column == self.sort_by:
+            self.descending = not self.descending
+            return
+        self.sort_by = column
+        self.descending = False
+        self.rebuild()
+
+    def _sort_value(self, habit):
+        """
+        Returns the value a habit is sorted by in the current sort column.
+
+        Parameters:
+            - habit (Habit): The habit.
+
+        Returns:
+            The sort value; ties are broken by the lower-cased name.
+        """
+        if self.sort_by == "periodicity":
+            return str(habit.periodicity)
+        if self.sort_by == "streak":
+            return habit.streak
+        if self.sort_by == "longest_streak":
+            return habit.longest_streak
+        if self.sort_by == "last_completed":
+            return habit.completed_at[-1] if habit.completed_at else 0
+        return ""
+
+    def add(self, key):
+        """
+        Inserts a new habit in its place.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+        """
+        habit = self.tracker.habits.get(key)
+        if habit is None or key in self._values:
+            return
+        value = self._values[key] = self._sort_value(habit)
+        bisect.insort(self._order, (value, key))
+        bisect.insort(self._names, key)
+
+    def remove(self, key):
+        """
+        Removes a deleted habit.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+        """
+        value = self._values.pop(key, None)
+        if value is None:
+            return
+        del self._order[bisect.bisect_left(self._order, (value, key))]
+        del self._names[bisect.bisect_left(self._names, key)]
+
+    def update(self, key):
+        """
+        Moves a changed habit, e.g. a completed one, to its new place.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+
+        Returns:
+            bool: Whether the habit moved, as opposed to staying in the same row.
+        """
+        habit = self.tracker.habits.get(key)
+        value = self._values.get(key)
+        if habit is None or value is None:
+            return False
+        new_value = self._sort_value(habit)
+        if new_value == value:
+            return False
+        del self._order[bisect.bisect_left(self._order, (value, key))]
+        self._values[key] = new_value
+        bisect.insort(self._order, (new_value, key))
+        return True
+
+    def __len__(self):
+        return len(self._order)
+
+    def rows(self, offset, count):
+        """
+        Retrieves the habits of a range of rows in display order.
+
+        Habits the tracker no longer has, e.g. after another process deleted them and before
+        sync_changes rebuilt the model, are left out.
+
+        Parameters:
+            - offset (int): The first row.
+            - count (int): The number of rows.
+
+        Returns:
+            List of habits.
+        """
+        if self.descending:
+            end = len(self._order) - offset
+            entries = reversed(self._order[max(0, end - count):max(0, end)])
+        else:
+            entries = self._order[offset:offset + count]
+        habits = [self.tracker.habits.get(key) for value, key in entries]
+        return [habit for habit in habits if habit is not None]
+
+    def match(self, prefix, limit=PICKER_MATCHES):
+        """
+        Retrieves the names of habits starting with a prefix, ignoring case.
+
+        Parameters:
+            - prefix (str): The typed text.
+            - limit (int): The maximum number of names (optional).
+
+        Returns:
+            List of habit names in alphabetical order.
+        """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._names, prefix)
+        names = []
+        for key in self._names[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            habit = self.tracker.habits.get(key)
+            if habit is not None:  # Deleted by another process, see rows
+                names.append(habit.task)
+        return names
+
+
+class HabitPicker(ttk.Frame):
+    def __init__(self, parent, model):
+        """
+        Initializes a HabitPicker, a type-ahead entry that suggests matching habit names.
+
+        Only the first PICKER_MATCHES matches are shown, so typing stays fast with any number of habits.
+
+        Parameters:
+            - parent (tk.Widget): The parent widget.
+            - model (HabitListModel): The habits to pick from.
+        """
+        super().__init__(parent)
+        self.model = model
+        self.entry = tk.Entry(self)
+        self.entry.pack(fill="x")
+        self.suggestions = tk.Listbox(self, height=PICKER_MATCHES, exportselection=False)
+        self.suggestions.pack(fill="x")
+        self.entry.bind("<KeyRelease>", lambda event: self.refresh())
+        self.suggestions.bind("<<ListboxSelect>>", self.on_select)
+        self.refresh()
+
+    def get(self):
+        """
+        Returns the entered habit name.
+        """
+        return self.entry.get()
+
+    def set(self, task):
+        """
+        Enters a habit name.
+
+        Parameters:
+            - task (str): The habit name.
+        """
+        self.entry.delete(0, tk.END)
+        self.entry.insert(0, task)
+        self.refresh()
+
+    def refresh(self):
+        """
+        Shows the habits matching the entered text.
+        """
+        self.suggestions.delete(0, tk.END)
+        for task in self.model.match(self.entry.get()):
+            self.suggestions.insert(tk.END, task)
+
+    def on_select(self, event):
+        """
+        Enters the clicked suggestion.
+        """
+        selection = self.suggestions.curselection()
+        if selection:
+            self.entry.delete(0, tk.END)
+            self.entry.insert(0, self.suggestions.get(selection[0]))
+
 
 class HabitTrackerApp:
     def __init__(self, root):
@@ -39,8 +270,19 @@ class HabitTrackerApp:
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(expand=True, fill="both")
 
-        self.tracker = HabitTracker()
+        # Saves run on a background thread so large data files don't freeze the window
+        self.tracker = HabitTracker(write_behind=True, metrics=METRICS_ENABLED)
+        if METRICS_ENABLED:
+            self.tracker.enable_metrics(dump_file=METRICS_FILE)
+            # Wrap before the tabs are built, since buttons keep a reference to the bound method
+            instrument(self, APP_METHODS, self.tracker._metrics, "HabitTrackerApp.")
         self.analytics = Analytics(self.tracker)
+        self.list_model = HabitListModel(self.tracker)
+        self.list_offset = 0  # First habit list row on screen
+        self.list_items = {}  # Lower-cased habit name -> habit list item id, for the rows on screen
+        self.pending_changes = []  # (event, lower-cased habit name) received since the last redraw
+        self.redraw_scheduled = False
+        self.tracker.subscribe(self.on_tracker_event)
 
         self.create_create_tab()
         self.create_delete_tab()
@@ -48,12 +290,14 @@ class HabitTrackerApp:
         self.create_list_tab()
         self.create_analytics_tab()
         self.create_streak_tab()
+        self.create_diagnostics_tab()
 
         reset_button = tk.Button(self.root, text="Reset App", command=self.reset_app, font=('Helvetica', 12),
                                  bg='#FF5722', fg='white')  # Orange button
         reset_button.pack(side="bottom", pady=10)
 
         root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.after(SYNC_INTERVAL, self.sync_changes)
 
     def create_create_tab(self):
         """
@@ -83,8 +327,8 @@ class HabitTrackerApp:
 
         # Widgets for delete tab
         tk.Label(delete_tab, text="Select Habit:").grid(row=0, column=0, padx=5, pady=5)
-        self.delete_habit_combobox = ttk.Combobox(delete_tab, values=self.get_habit_names())
-        self.delete_habit_combobox.grid(row=0, column=1, padx=5, pady=5)
+        self.delete_habit_picker = HabitPicker(delete_tab, self.list_model)
+        self.delete_habit_picker.grid(row=0, column=1, padx=5, pady=5)
 
         delete_button = tk.Button(delete_tab, text="Delete", command=self.delete_habit)
         delete_button.grid(row=1, column=0, columnspan=2, pady=10)
@@ -98,8 +342,8 @@ class HabitTrackerApp:
 
         # Widgets for complete tab
         tk.Label(complete_tab, text="Select Habit:").grid(row=0, column=0, padx=5, pady=5)
-        self.complete_habit_combobox = ttk.Combobox(complete_tab, values=self.get_habit_names())
-        self.complete_habit_combobox.grid(row=0, column=1, padx=5, pady=5)
+        self.complete_habit_picker = HabitPicker(complete_tab, self.list_model)
+        self.complete_habit_picker.grid(row=0, column=1, padx=5, pady=5)
 
         complete_button = tk.Button(complete_tab, text="Complete", command=self.complete_task)
         complete_button.grid(row=1, column=0, columnspan=2, pady=10)
@@ -113,8 +357,8 @@ class HabitTrackerApp:
 
         # Widgets for streak tab
         tk.Label(streak_tab, text="Select Habit (optional):").grid(row=0, column=0, padx=5, pady=5)
-        self.streak_habit_combobox = ttk.Combobox(streak_tab, values=[""] + self.get_habit_names())
-        self.streak_habit_combobox.grid(row=0, column=1, padx=5, pady=5)
+        self.streak_habit_picker = HabitPicker(streak_tab, self.list_model)
+        self.streak_habit_picker.grid(row=0, column=1, padx=5, pady=5)
 
         streak_button = tk.Button(streak_tab, text="Get Streak", command=self.get_streak)
         streak_button.grid(row=1, column=0, columnspan=2, pady=10)
@@ -128,8 +372,8 @@ class HabitTrackerApp:
 
         # Widgets for list tab
         tk.Label(list_tab, text="Select Habit:").grid(row=0, column=0, padx=5, pady=5)
-        self.list_habit_combobox = ttk.Combobox(list_tab, values=self.get_habit_names())
-        self.list_habit_combobox.grid(row=0, column=1, padx=5, pady=5)
+        self.list_habit_picker = HabitPicker(list_tab, self.list_model)
+        self.list_habit_picker.grid(row=0, column=1, padx=5, pady=5)
 
         list_button = tk.Button(list_tab, text="List Habit", command=self.list_habit)
         list_button.grid(row=1, column=0, columnspan=2, pady=10)
@@ -138,6 +382,21 @@ class HabitTrackerApp:
         self.list_habit_text = tk.Text(list_tab, height=5, width=50)
         self.list_habit_text.grid(row=2, column=0, columnspan=2, padx=5, pady=5)
 
+        # All habits, of which only the rows on screen are materialized; click a heading to sort
+        self.habit_tree = ttk.Treeview(list_tab, columns=[column for column, heading in LIST_COLUMNS],
+                                       show="headings", height=VISIBLE_ROWS, selectmode="browse")
+        for column, heading in LIST_COLUMNS:
+            self.habit_tree.heading(column, text=heading, command=lambda column=column: self.sort_list(column))
+            self.habit_tree.column(column, width=160 if column in ("task", "last_completed") else 90)
+        self.habit_tree.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
+        self.habit_scrollbar = ttk.Scrollbar(list_tab, orient="vertical", command=self.scroll_list)
+        self.habit_scrollbar.grid(row=3, column=2, sticky="ns", pady=5)
+        self.habit_tree.bind("<<TreeviewSelect>>", self.on_list_select)
+        self.habit_tree.bind("<MouseWheel>", lambda event: self.scroll_list("scroll", -event.delta // 120, "units"))
+        self.habit_tree.bind("<Button-4>", lambda event: self.scroll_list("scroll", -3, "units"))
+        self.habit_tree.bind("<Button-5>", lambda event: self.scroll_list("scroll", 3, "units"))
+        self.update_list_text()
+
     def create_analytics_tab(self):
         """
         Creates the 'Analytics' tab in the notebook.
@@ -163,6 +422,38 @@ class HabitTrackerApp:
         self.analytics_text = tk.Text(analytics_tab, height=10, width=50)
         self.analytics_text.grid(row=4, column=0, padx=5, pady=5)
 
+    def create_diagnostics_tab(self):
+        """
+        Creates the 'Diagnostics' tab in the notebook, which shows the collected metrics.
+        """
+        diagnostics_tab = ttk.Frame(self.notebook)
+        self.notebook.add(diagnostics_tab, text="Diagnostics")
+
+        refresh_button = tk.Button(diagnostics_tab, text="Refresh", command=self.show_metrics)
+        refresh_button.grid(row=0, column=0, padx=5, pady=5)
+
+        self.diagnostics_text = tk.Text(diagnostics_tab, height=15, width=80)
+        self.diagnostics_text.grid(row=1, column=0, padx=5, pady=5)
+        self.show_metrics()
+
+    def show_metrics(self):
+        """
+        Displays the collected metrics in the 'Diagnostics' tab.
+        """
+        metrics = self.tracker.metrics()
+        if metrics is None:
+            text = "Metrics are disabled. Start the app with HABIT_TRACKER_METRICS=1 to collect them.\n"
+        else:
+            text = f"{'Method':45} {'Calls':>7} {'Mean ms':>9} {'p99 ms':>9} {'Max ms':>9}\n"
+            for name, stats in metrics["calls"].items():
+                text += (f"{name:45} {stats['count']:>7} {stats['mean_ms']:>9.3f} {stats['p99_ms']:>9.3f} "
+                         f"{stats['max_ms']:>9.3f}\n")
+            text += f"\n{'Storage':45} {'Calls':>7} {'Read':>12} {'Written':>12}\n"
+            for name, stats in metrics["io"].items():
+                text += f"{name:45} {stats['count']:>7} {stats['bytes_read']:>12} {stats['bytes_written']:>12}\n"
+        self.diagnostics_text.delete(1.0, tk.END)
+        self.diagnostics_text.insert(tk.END, text)
+
     def get_all_tracked_habits(self):
         """
         Displays all tracked habits in the 'Analytics' tab.
@@ -192,6 +483,9 @@ class HabitTrackerApp:
         Displays broken habits or a success message in the 'Analytics' tab.
         """
         broken_habits = self.tracker.get_broken_habits()
+        # Broken habits have their streak reset without a tracker event, so patch them in like completions
+        for habit in broken_habits:
+            self.on_tracker_event("habit_completed", habit)
         if broken_habits == [] or None:
             self.display_analytics_results(
                 "GREAT JOB!!! YOU ARE ON THE RIGHT TRACK. YOU HAVE COMPLETED ALL YOUR TASKS TODAY!",
@@ -209,12 +503,11 @@ class HabitTrackerApp:
             - title (str): The title of the analytics results.
             - data (list or str): The analytics data to display.
         """
-        result_text = f"{title}:\n\n"
         if isinstance(data, list):
-            for item in data:
-                result_text += f"{item}\n"
+            lines = [self.describe_habit(item) if isinstance(item, Habit) else str(item) for item in data]
         else:
-            result_text += f"{data}\n"
+            lines = [str(data)]
+        result_text = f"{title}:\n\n" + "".join(f"{line}\n" for line in lines)
 
         self.analytics_text.delete(1.0, tk.END)
         self.analytics_text.insert(tk.END, result_text)
@@ -227,23 +520,19 @@ class HabitTrackerApp:
         periodicity = self.create_periodicity_combobox.get()
 
         # Check if a habit with the same name already exists
-        if any(habit.lower() == task.lower() for habit in self.get_habit_names()):
+        if self.tracker.get_habit(task) is not None:
             tk.messagebox.showerror("Error", f"Habit with the name '{task}' already exists.")
         else:
             self.tracker.create_habit(task, periodicity)
             self.create_task_entry.delete(0, tk.END)
-            self.update_list_text()
-            self.update_combobox_values()
 
     def delete_habit(self):
         """
         Deletes a habit based on user selection in the 'Delete Habit' tab.
         """
-        selected_habit = self.delete_habit_combobox.get()
+        selected_habit = self.delete_habit_picker.get()
         if selected_habit:
             self.tracker.delete_habit(selected_habit)
-            self.update_list_text()
-            self.update_combobox_values()
         else:
             tk.messagebox.showinfo("Error", "Please select a habit.")
 
@@ -251,15 +540,14 @@ class HabitTrackerApp:
         """
         Completes a habit based on user selection in the 'Complete Habit' tab.
         """
-        task = self.complete_habit_combobox.get()
+        task = self.complete_habit_picker.get()
         self.tracker.complete_task(task)
-        self.update_list_text()
 
     def get_streak(self):
         """
         Gets and displays the streak for a habit in the 'Streaks' tab.
         """
-        task = self.streak_habit_combobox.get()
+        task = self.streak_habit_picker.get()
         if task:
             streak = self.tracker.get_longest_run_streak_for_habit(task)
             result = f"Longest run streak for habit '{task}': {streak}"
@@ -272,11 +560,11 @@ class HabitTrackerApp:
         """
         Lists details for a habit in the 'List Habit' tab.
         """
-        selected_habit = self.list_habit_combobox.get()
+        selected_habit = self.list_habit_picker.get()
         if selected_habit:
-            habit = next((habit for habit in self.tracker.get_all_habits() if habit["task"] == selected_habit), None)
+            habit = self.tracker.get_habit(selected_habit)
             if habit:
-                habit_text = f"Task: {habit['task']}\nPeriodicity: {habit['periodicity']}\nCreated At: {habit['created_at']}\nCompleted At: {habit['completed_at']}"
+                habit_text = f"Task: {habit['task']}\nPeriodicity: {habit['periodicity']}\nCreated At: {format_timestamp(habit['created_at'])}\nCompleted At: {self.last_completed_at(habit)}\nCompletions: {len(habit['completed_at'])}"
                 self.list_habit_text.delete(1.0, tk.END)
                 self.list_habit_text.insert(tk.END, habit_text)
             else:
@@ -284,52 +572,191 @@ class HabitTrackerApp:
         else:
             tk.messagebox.showinfo("Error", "Please select a habit.")
 
-    def update_combobox_values(self):
+    def update_pickers(self):
         """
-        Updates all Combobox values after creating or deleting habits.
+        Updates the suggestions of all habit pickers after creating or deleting habits.
         """
-        habit_names = self.get_habit_names()
-        self.delete_habit_combobox["values"] = habit_names
-        self.complete_habit_combobox["values"] = habit_names
-        self.list_habit_combobox["values"] = habit_names
-        self.streak_habit_combobox["values"] = [""] + habit_names
+        for picker in (self.delete_habit_picker, self.complete_habit_picker, self.list_habit_picker,
+                       self.streak_habit_picker):
+            picker.refresh()
 
     def update_list_text(self):
         """
-        Updates the Text widget with the list of habits.
+        Updates the habit list with the rows that are on screen.
+
+        Only VISIBLE_ROWS rows are materialized, so the cost doesn't depend on the number of habits.
         """
-        habits = self.tracker.get_all_habits()
-        list_text = ""
+        total = len(self.list_model)
+        self.list_offset = max(0, min(self.list_offset, total - VISIBLE_ROWS))
+        habits = self.list_model.rows(self.list_offset, VISIBLE_ROWS)
+        self.habit_tree.delete(*self.habit_tree.get_children())
+        self.list_items = {}
         for habit in habits:
-            list_text += f"Task: {habit['task']}, Periodicity: {habit['periodicity']}, Created At: {habit['created_at']}, Completed At: {habit['completed_at']}\n"
-        self.list_habit_text.delete(1.0, tk.END)
-        self.list_habit_text.insert(tk.END, list_text)
+            self.list_items[habit.task.lower()] = self.habit_tree.insert("", tk.END, values=self.list_row(habit))
+        if total:
+            self.habit_scrollbar.set(self.list_offset / total, (self.list_offset + len(habits)) / total)
+        else:
+            self.habit_scrollbar.set(0, 1)
+
+    def update_list_row(self, key):
+        """
+        Redraws a single row of the habit list, if it is on screen.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+        """
+        item = self.list_items.get(key)
+        habit = self.tracker.habits.get(key)
+        if item is not None and habit is not None:
+            self.habit_tree.item(item, values=self.list_row(habit))
 
-    def get_habit_names(self):
+    def list_row(self, habit):
         """
-        Get a list of habit names for Combobox values.
+        Returns the values shown for a habit in the habit list.
+
+        Parameters:
+            - habit (Habit): The habit.
 
         Returns:
-            List: A list of habit names.
+            tuple: One value per column in LIST_COLUMNS.
+        """
+        return (habit.task, str(habit.periodicity), habit.streak, habit.longest_streak, self.last_completed_at(habit))
+
+    def on_tracker_event(self, event, habit):
         """
-        return [habit["task"] for habit in self.tracker.get_all_habits()]
+        Collects a change reported by the tracker and schedules one redraw for the next idle moment.
+
+        Bursts of changes, e.g. from a batch, are applied together by apply_changes.
+
+        Parameters:
+            - event (str): The event name, see HabitTracker.subscribe.
+            - habit (Habit): The affected habit, or None.
+        """
+        self.pending_changes.append((event, habit.task.lower() if habit is not None else None))
+        # Changes caught up with by the write-behind thread are redrawn by the next sync_changes
+        if not self.redraw_scheduled and threading.current_thread() is threading.main_thread():
+            self.redraw_scheduled = True
+            self.root.after_idle(self.apply_changes)
+
+    def apply_changes(self):
+        """
+        Patches the habit list and the habit pickers with the changes collected since the last redraw.
+
+        Completions that don't move a habit only redraw its row, if it is on screen. Creates and
+        deletes redraw the visible rows and the picker suggestions.
+        """
+        self.redraw_scheduled = False
+        changes, self.pending_changes = self.pending_changes, []
+        moved = names_changed = False
+        completed = set()
+        for event, key in changes:
+            if event in ("reset", "reload"):
+                self.list_model.rebuild()
+                moved = names_changed = True
+            elif event == "habit_created":
+                self.list_model.add(key)
+                moved = names_changed = True
+            elif event == "habit_deleted":
+                self.list_model.remove(key)
+                moved = names_changed = True
+            elif event == "habit_completed":
+                moved = self.list_model.update(key) or moved
+                completed.add(key)
+        if moved:
+            self.update_list_text()
+        else:
+            for key in completed:
+                self.update_list_row(key)
+        if names_changed:
+            self.update_pickers()
+
+    def sync_changes(self):
+        """
+        Picks up changes other processes made to the data file, e.g. a second window or a script,
+        and schedules the next check.
+        """
+        try:
+            self.tracker.sync()
+            if self.pending_changes and not self.redraw_scheduled:
+                self.apply_changes()
+        finally:
+            self.root.after(SYNC_INTERVAL, self.sync_changes)
+
+    def scroll_list(self, action, amount, unit=None):
+        """
+        Scrolls the habit list; called by the scrollbar and the mouse wheel.
+
+        Parameters:
+            - action (str): "moveto" to jump to a fraction of the list, or "scroll" to move by units or pages.
+            - amount (str or int): The fraction, or the number of units or pages.
+            - unit (str): "units" (rows) or "pages" when scrolling (optional).
+        """
+        if action == "moveto":
+            self.list_offset = int(float(amount) * len(self.list_model))
+        else:
+            self.list_offset += int(amount) * (VISIBLE_ROWS if unit == "pages" else 1)
+        self.update_list_text()
+
+    def sort_list(self, column):
+        """
+        Sorts the habit list by a column, reversing the order when it is clicked again.
+
+        Parameters:
+            - column (str): One of the columns in LIST_COLUMNS.
+        """
+        self.list_model.sort(column)
+        self.list_offset = 0
+        self.update_list_text()
+
+    def on_list_select(self, event):
+        """
+        Shows the details of the habit selected in the habit list.
+        """
+        selection = self.habit_tree.selection()
+        if selection:
+            key = next(key for key, item in self.list_items.items() if item == selection[0])
+            self.list_habit_picker.set(self.tracker.habits[key].task)
+            self.list_habit()
+
+    def last_completed_at(self, habit):
+        """
+        Formats the most recent completion of a habit.
+
+        Parameters:
+            - habit (Habit): The habit.
+
+        Returns:
+            str: The last completion time, or an empty string if the habit was never completed.
+        """
+        return format_timestamp(habit["completed_at"][-1]) if habit["completed_at"] else ""
+
+    def describe_habit(self, habit):
+        """
+        Formats a habit as a single line of text.
+
+        Parameters:
+            - habit (Habit): The habit.
+
+        Returns:
+            str: The habit description.
+        """
+        return f"Task: {habit['task']}, Periodicity: {habit['periodicity']}, Created At: {format_timestamp(habit['created_at'])}, Completed At: {self.last_completed_at(habit)}"
 
     def on_closing(self):
         """
         Callback function called when the application window is closing.
-        Saves the habit data and destroys the root window.
+        Saves the habit data, waits for pending writes and destroys the root window.
         """
         self.tracker.save_data()
+        self.tracker.close()
         self.root.destroy()
 
     def reset_app(self):
         """
         Resets the application by clearing all habit data.
-        Updates Combobox values and the displayed list.
+        The habit pickers and the displayed list follow through the tracker's "reset" event.
         """
         self.tracker.reset_data()
-        self.update_combobox_values()
-        self.update_list_text()
 
 
 if __name__ == "__main__":
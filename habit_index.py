@@ -0,0 +1,232 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
+from habit_model import to_timestamp
+
+# Fields with a sorted index, in the order their values are kept in an index entry
+ORDER_FIELDS = ("created_at", "last_completed", "streak")
+
+# Sorted index entries read per lock acquisition while a query is iterated
+SCAN_CHUNK = 256
+
+# The last completion of habits that were never completed, so they sort first
+NEVER = float("-inf")
+
+
+def index_values(habit):
+    """
+    Returns the values of a habit kept in the sorted indexes.
+
+    Parameters:
+        - habit (Habit): The habit.
+
+    Returns:
+        tuple: The creation time, the last completion time (NEVER if there is none) and the current streak.
+    """
+    history = habit.completed_at
+    return habit.created_at, history[-1] if history else NEVER, habit.streak
+
+
+class HabitIndex:
+    def __init__(self, habits, lock):
+        """
+        Initializes a HabitIndex, the secondary indexes behind HabitTracker.query.
+
+        Periodicities get a hash index, and the creation time, the last completion time and the
+        current streak each get a sorted list of (value, key) pairs. The tracker keeps them up to
+        date as habits change.
+
+        Parameters:
+            - habits (dict): The habits keyed by lower-cased name.
+            - lock (RLock): The tracker lock, held while the indexes are read or changed.
+        """
+        self._lock = lock
+        self._entries = {}  # Key -> (habit, created_at, last completion, streak), in creation order
+        self._periodicities = {}  # Periodicity name -> {key: habit}, in creation order
+        for key, habit in habits.items():
+            self._entries[key] = (habit,) + index_values(habit)
+            self._periodicities.setdefault(str(habit.periodicity), {})[key] = habit
+        self._sorted = {}  # Field name -> sorted list of (value, key)
+        for position, field in enumerate(ORDER_FIELDS, 1):
+            self._sorted[field] = sorted((entry[position], key) for key, entry in self._entries.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, habit):
+        """
+        Adds a habit, or moves it to its new place in the sorted indexes after it changed.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is not habit:
+            self.remove(key)
+            entry = None
+        values = index_values(habit)
+        if entry is None:
+            self._periodicities.setdefault(str(habit.periodicity), {})[key] = habit
+        elif entry[1:] == values:
+            return
+        for position, field in enumerate(ORDER_FIELDS, 1):
+            value = values[position - 1]
+            if entry is not None:
+                if entry[position] == value:
+                    continue
+                self._discard(field, entry[position], key)
+            insort(self._sorted[field], (value, key))
+        self._entries[key] = (habit,) + values
+
+    def remove(self, key):
+        """
+        Removes a habit.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._periodicities[str(entry[0].periodicity)].pop(key, None)
+        for position, field in enumerate(ORDER_FIELDS, 1):
+            self._discard(field, entry[position], key)
+
+    def _discard(self, field, value, key):
+        """
+        Removes a (value, key) pair from a sorted index.
+        """
+        entries = self._sorted[field]
+        position = bisect_left(entries, (value, key))
+        if position < len(entries) and entries[position] == (value, key):
+            del entries[position]
+
+    def query(self, periodicity=None, created_between=None, last_completed_before=None, min_streak=None,
+              order_by=None, descending=False, limit=None, offset=0):
+        """
+        Finds habits matching all the given filters.
+
+        The most selective index drives the scan and the other filters are checked per habit, so
+        only candidates from that index are visited. Results are produced lazily: sorted indexes
+        are read a chunk at a time, seeking past the last habit returned, so habits changed while
+        iterating are neither skipped nor repeated.
+
+        Parameters:
+            - periodicity (str): Only habits with this periodicity (optional).
+            - created_between (tuple): (start, end) times, either may be None; only habits created
+              at or after start and before end (optional).
+            - last_completed_before (str, datetime or int): Only habits not completed at or after
+              this time, including those never completed (optional).
+            - min_streak (int): Only habits with at least this current streak (optional).
+            - order_by (str): "created_at", "last_completed" or "streak"; without it the order is
+              unspecified (optional).
+            - descending (bool): Reverse the order given by order_by (optional).
+            - limit (int): The most habits to return (optional).
+            - offset (int): The number of matching habits to skip (optional).
+
+        Returns:
+            Iterator of matching Habit records.
+        """
+        if order_by is not None and order_by not in self._sorted:
+            raise ValueError(f"Cannot order by {order_by!r}, expected one of {', '.join(ORDER_FIELDS)}")
+        ranges = {}  # Field name -> (low, high), low inclusive and high exclusive, None if open
+        if created_between is not None:
+            start, end = created_between
+            ranges["created_at"] = (None if start is None else to_timestamp(start),
+                                    None if end is None else to_timestamp(end))
+        if last_completed_before is not None:
+            ranges["last_completed"] = (None, to_timestamp(last_completed_before))
+        if min_streak is not None:
+            ranges["streak"] = (min_streak, None)
+        if periodicity is not None:
+            periodicity = str(periodicity)
+
+        with self._lock:
+            if order_by is not None:
+                driver = order_by
+            else:
+                # Drive the scan from whichever index yields the fewest candidates
+                driver, size = None, len(self._entries)
+                if periodicity is not None:
+                    driver, size = "periodicity", len(self._periodicities.get(periodicity, ()))
+                for field, bounds in ranges.items():
+                    start, end = self._bounds(field, bounds)
+                    if end - start < size:
+                        driver, size = field, end - start
+            if driver in (None, "periodicity"):
+                bucket = self._entries if driver is None else self._periodicities.get(periodicity, {})
+                keys = list(bucket)
+
+        checks = []
+        if periodicity is not None and driver != "periodicity":
+            checks.append(lambda entry: str(entry[0].periodicity) == periodicity)
+        for position, field in enumerate(ORDER_FIELDS, 1):
+            if field in ranges and field != driver:
+                checks.append(self._range_check(position, *ranges[field]))
+
+        # Without further checks, index positions are result positions and the offset is a seek
+        skip = 0 if checks else offset
+        if driver in (None, "periodicity"):
+            matches = self._scan_keys(keys[skip:], checks)
+        else:
+            matches = self._scan_sorted(driver, ranges.get(driver, (None, None)), descending, skip, checks)
+        offset -= skip
+        return islice(matches, offset, None if limit is None else offset + limit)
+
+    def _bounds(self, field, bounds):
+        """
+        Returns the positions in a sorted index that hold values within (low, high) bounds.
+        """
+        entries = self._sorted[field]
+        low, high = bounds
+        start = 0 if low is None else bisect_left(entries, (low,))
+        end = len(entries) if high is None else bisect_left(entries, (high,))
+        return start, max(start, end)
+
+    @staticmethod
+    def _range_check(position, low, high):
+        """
+        Returns a predicate testing one value of an index entry against (low, high) bounds.
+        """
+        def check(entry):
+            value = entry[position]
+            return (low is None or value >= low) and (high is None or value < high)
+        return check
+
+    def _scan_keys(self, keys, checks):
+        """
+        Yields the habits with the given keys that are still indexed and pass all checks.
+        """
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and all(check(entry) for check in checks):
+                yield entry[0]
+
+    def _scan_sorted(self, field, bounds, descending, skip, checks):
+        """
+        Yields the habits within bounds of a sorted index that pass all checks, in index order.
+        """
+        cursor = None
+        while True:
+            with self._lock:
+                entries = self._sorted[field]
+                start, end = self._bounds(field, bounds)
+                if not descending:
+                    if cursor is not None:
+                        start = max(start, bisect_right(entries, cursor))
+                    start += skip
+                    chunk = entries[start:min(end, start + SCAN_CHUNK)]
+                else:
+                    if cursor is not None:
+                        end = min(end, bisect_left(entries, cursor))
+                    end -= skip
+                    chunk = entries[max(start, end - SCAN_CHUNK):end][::-1] if end > start else []
+                found = [self._entries[key] for value, key in chunk]
+            if not chunk:
+                return
+            skip = 0
+            cursor = chunk[-1]
+            for entry in found:
+                if all(check(entry) for check in checks):
+                    yield entry[0]
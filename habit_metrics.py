@@ -0,0 +1,178 @@
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Metrics:
+    def __init__(self):
+        """
+        Initializes a Metrics instance, which collects call counts, latency histograms and I/O byte counts.
+
+        Latencies go into power-of-two buckets of microseconds, so recording a call is O(1) and
+        memory stays constant however many calls are made.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}  # Method name -> [count, total seconds, max seconds, {bucket: count}]
+        self._io = {}  # Operation name -> [count, bytes read, bytes written]
+        self._dump_thread = None
+        self._dump_stop = threading.Event()
+
+    def record(self, name, seconds):
+        """
+        Records one call of a method.
+
+        Parameters:
+            - name (str): The method name.
+            - seconds (float): The latency of the call.
+        """
+        bucket = int(seconds * 1000000).bit_length()
+        with self._lock:
+            stats = self._calls.get(name)
+            if stats is None:
+                stats = self._calls[name] = [0, 0.0, 0.0, {}]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+            stats[3][bucket] = stats[3].get(bucket, 0) + 1
+
+    def add_bytes(self, name, read=0, written=0):
+        """
+        Records the bytes read or written by one storage operation.
+
+        Parameters:
+            - name (str): The operation name.
+            - read (int): Bytes read (optional).
+            - written (int): Bytes written (optional).
+        """
+        with self._lock:
+            stats = self._io.get(name)
+            if stats is None:
+                stats = self._io[name] = [0, 0, 0]
+            stats[0] += 1
+            stats[1] += read
+            stats[2] += written
+
+    def snapshot(self):
+        """
+        Returns the collected metrics.
+
+        Percentiles are estimated from the histogram as the upper bound of the bucket they fall in.
+
+        Returns:
+            dict: "calls" maps method names to counts, latencies in milliseconds and the histogram
+            (bucket upper bound in microseconds -> count); "io" maps operations to byte counts.
+        """
+        with self._lock:
+            calls = {name: (count, total, longest, dict(histogram))
+                     for name, (count, total, longest, histogram) in self._calls.items()}
+            io = {name: list(stats) for name, stats in self._io.items()}
+
+        report = {"calls": {}, "io": {}}
+        for name, (count, total, longest, histogram) in sorted(calls.items()):
+            buckets = sorted(histogram.items())
+
+            def percentile(fraction):
+                seen = 0
+                for bucket, bucket_count in buckets:
+                    seen += bucket_count
+                    if seen >= fraction * count:
+                        return (1 << bucket) / 1000
+                return longest * 1000
+
+            report["calls"][name] = {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 4),
+                "p50_ms": percentile(0.5),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(longest * 1000, 4),
+                "histogram_us": {1 << bucket: bucket_count for bucket, bucket_count in buckets}
+            }
+        for name, (count, read, written) in sorted(io.items()):
+            report["io"][name] = {"count": count, "bytes_read": read, "bytes_written": written}
+        return report
+
+    def dump(self, path):
+        """
+        Atomically writes the collected metrics to a JSON file.
+
+        Parameters:
+            - path (str): The file to write.
+        """
+        temp_file = path + ".tmp"
+        with open(temp_file, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temp_file, path)
+
+    def start_dumping(self, path, interval=60.0):
+        """
+        Starts a background thread that dumps the metrics to a file periodically.
+
+        Parameters:
+            - path (str): The file to write.
+            - interval (float): Seconds between dumps (optional).
+        """
+        self.stop_dumping()
+        self._dump_stop.clear()
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                self.dump(path)
+            self.dump(path)
+
+        self._dump_thread = threading.Thread(target=run, name="habit-metrics-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_dumping(self):
+        """
+        Stops periodic dumping, writing the metrics one last time.
+        """
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+
+
+def instrument(obj, names, metrics, prefix):
+    """
+    Wraps methods of an object so that every call is timed into metrics.
+
+    The wrappers are set as instance attributes, so objects that are not instrumented run the
+    original methods with no overhead at all.
+
+    Parameters:
+        - obj: The object to instrument.
+        - names (iterable): Names of the methods to wrap; missing ones are skipped.
+        - metrics (Metrics): Where to record the calls.
+        - prefix (str): Prefix of the recorded names, e.g. "HabitTracker.".
+    """
+    for name in names:
+        method = getattr(obj, name, None)
+        if method is not None:
+            setattr(obj, name, _timed(method, prefix + name, metrics))
+
+
+def _timed(method, name, metrics):
+    """
+    Returns a wrapper of a method that records the latency of every call.
+
+    Parameters:
+        - method (callable): The method to wrap.
+        - name (str): The name to record the calls under.
+        - metrics (Metrics): Where to record the calls.
+
+    Returns:
+        callable: The wrapper.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            metrics.record(name, time.perf_counter() - start)
+
+    return wrapper
@@ -0,0 +1,148 @@
+import sys
+from array import array
+from datetime import datetime
+from enum import Enum
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def to_timestamp(value):
+    """
+    Converts a completion time to an integer epoch timestamp.
+
+    Parameters:
+        - value (str, datetime or int): A "%Y-%m-%d %H:%M:%S" string, a datetime or an epoch timestamp.
+
+    Returns:
+        int: Seconds since the epoch.
+    """
+    if type(value) is int:
+        return value
+    if isinstance(value, str):
+        value = datetime.strptime(value, TIMESTAMP_FORMAT)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value)
+
+
+def format_timestamp(timestamp):
+    """
+    Formats an epoch timestamp the way habit times are displayed.
+
+    Parameters:
+        - timestamp (int): Seconds since the epoch.
+
+    Returns:
+        str: The local time formatted as "%Y-%m-%d %H:%M:%S".
+    """
+    return datetime.fromtimestamp(timestamp).strftime(TIMESTAMP_FORMAT)
+
+
+class Periodicity(str, Enum):
+    DAILY = "daily"
+    WEEKLY = "weekly"
+
+    def __str__(self):
+        return self.value
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Converts a periodicity name to a shared Periodicity member.
+
+        create_habit accepts any name, so unknown ones are kept as interned strings; such habits
+        are never broken.
+
+        Parameters:
+            - value (str): The frequency of the habit ("daily" or "weekly").
+
+        Returns:
+            Periodicity or str: The member, or the interned name if it is unknown.
+        """
+        member = PERIODICITIES.get(value)
+        return member if member is not None else sys.intern(value)
+
+
+# Periodicity members by name, for fast lookups while loading
+PERIODICITIES = {member.value: member for member in Periodicity}
+
+
+class Habit:
+    # No per-instance __dict__, so a habit costs a few dozen bytes plus its history
+    __slots__ = ("task", "periodicity", "created_at", "completed_at", "streak", "longest_streak")
+
+    def __init__(self, task, periodicity, created_at, completed_at=None, streak=0, longest_streak=0):
+        """
+        Initializes a Habit record.
+
+        Supports read access by field name (habit["task"]), so it can be used where habits used to be dicts.
+
+        Parameters:
+            - task (str): The name of the habit.
+            - periodicity (str): The frequency of the habit ("daily" or "weekly").
+            - created_at (str, datetime or int): The creation time, stored as an epoch timestamp.
+            - completed_at (array): Sorted completion timestamps as array('q') (optional).
+            - streak (int): The current streak, None if it is still to be computed (optional).
+            - longest_streak (int): The longest streak, None if it is still to be computed (optional).
+        """
+        self.task = task
+        # Loaders pass members and epochs already, so skip the conversions for them
+        self.periodicity = periodicity if type(periodicity) is Periodicity else Periodicity.parse(periodicity)
+        self.created_at = created_at if type(created_at) is int else to_timestamp(created_at)
+        self.completed_at = array("q") if completed_at is None else completed_at
+        self.streak = streak
+        self.longest_streak = longest_streak
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except (AttributeError, TypeError):
+            raise KeyError(field) from None
+
+    def __contains__(self, field):
+        return field in self.__slots__
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return f"Habit({self.as_dict()!r})"
+
+    def keys(self):
+        """
+        Returns the field names, so dict(habit) gives a plain copy.
+        """
+        return self.__slots__
+
+    def get(self, field, default=None):
+        """
+        Retrieves a field by name.
+
+        Parameters:
+            - field (str): The field name.
+            - default: The value returned for unknown fields (optional).
+
+        Returns:
+            The value of the field, or the default.
+        """
+        return getattr(self, field, default) if field in self.__slots__ else default
+
+    def as_dict(self):
+        """
+        Returns the habit in the shape of the original dict-based habits.
+
+        Returns:
+            dict: The fields, with the periodicity as a plain string and the creation time formatted
+            as "%Y-%m-%d %H:%M:%S".
+        """
+        return {
+            "task": self.task,
+            "periodicity": str(self.periodicity),
+            "created_at": format_timestamp(self.created_at),
+            "completed_at": self.completed_at,
+            "streak": self.streak,
+            "longest_streak": self.longest_streak
+        }
@@ -0,0 +1,224 @@
+import heapq
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+# Partitions per worker process, so one slow partition doesn't leave the other workers idle
+PARTITIONS_PER_WORKER = 4
+
+# The numeric statistics columns computed by the workers, with the array type code they are sent back in
+PARTIAL_COLUMNS = (("streak", "q"), ("longest_streak", "q"), ("broken", "b"), ("hits", "q"), ("expected", "q"),
+                   ("ratio", "d"))
+
+
+def create_pool(workers=None):
+    """
+    Starts a pool of worker processes for analytics.
+
+    Workers are spawned rather than forked, so they don't inherit the tracker's threads and locks.
+
+    Parameters:
+        - workers (int): The number of processes, defaults to the number of CPUs (optional).
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=get_context("spawn"))
+
+
+class SharedHistories:
+    def __init__(self, habits):
+        """
+        Initializes SharedHistories, which copies the completion histories of habits into one
+        shared memory block that worker processes read in place, instead of pickling them.
+
+        The other fields go to the workers as compact arrays: creation times, history offsets
+        into the block and numbered periodicities.
+
+        Parameters:
+            - habits (list): The habits, in the order of the results.
+        """
+        offsets = array("q", [0])
+        for habit in habits:
+            offsets.append(offsets[-1] + len(habit.completed_at))
+        self.offsets = offsets
+        self.memory = shared_memory.SharedMemory(create=True, size=max(8, offsets[-1] * 8))
+        view = self.memory.buf.cast("q")
+        try:
+            for position, habit in enumerate(habits):
+                history = habit.completed_at
+                if len(history):
+                    if not isinstance(history, array):
+                        history = history.load()  # A LazyHistory from a binary snapshot
+                    view[offsets[position]:offsets[position + 1]] = memoryview(history)
+        finally:
+            view.release()
+        self.created_at = array("q", (habit.created_at for habit in habits))
+        numbers = {}
+        self.periodicities = array("H", (numbers.setdefault(str(habit.periodicity), len(numbers)) for habit in habits))
+        self.names = list(numbers)
+
+    def __len__(self):
+        return len(self.created_at)
+
+    def partitions(self, count):
+        """
+        Splits the habits into ranges with about the same number of habits plus completions.
+
+        Parameters:
+            - count (int): The number of partitions wanted.
+
+        Returns:
+            List of (first, end) habit positions, end exclusive.
+        """
+        offsets = self.offsets
+        size = len(self)
+        total = offsets[-1] + size
+        bounds = [0]
+        position = 0
+        for part in range(1, count):
+            target = total * part // count
+            while position < size and offsets[position] + position < target:
+                position += 1
+            if position > bounds[-1]:
+                bounds.append(position)
+        bounds.append(size)
+        return [(first, end) for first, end in zip(bounds, bounds[1:]) if end > first]
+
+    def arguments(self, first, end):
+        """
+        Returns the arguments of partition_stats for a range of habits, except as_of and top.
+        """
+        return (self.memory.name, first, self.offsets[first:end + 1], self.created_at[first:end],
+                self.periodicities[first:end], self.names)
+
+    def close(self):
+        """
+        Frees the shared memory block.
+        """
+        self.memory.close()
+        self.memory.unlink()
+
+
+def partition_stats(memory_name, first, offsets, created_at, periodicities, names, as_of, top=None):
+    """
+    Computes the statistics of a range of habits in a worker process.
+
+    Parameters:
+        - memory_name (str): The name of the SharedHistories block.
+        - first (int): The position of the first habit of the range.
+        - offsets (array): Where each habit's history starts in the block, plus where the last ends.
+        - created_at (array): The creation time of each habit.
+        - periodicities (array): The number of each habit's periodicity in names.
+        - names (list): The periodicity names.
+        - as_of (int): Seconds since the epoch; later completions are ignored.
+        - top (int): Reduce the results to a summary with this many top streaks, see
+          summarize_stats; otherwise all columns are returned (optional).
+
+    Returns:
+        dict: The numeric columns as arrays, or the partial summary.
+    """
+    from habit_tracker import habit_stats
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    view = memory.buf.cast("q")
+    try:
+        columns = [array(code) for _, code in PARTIAL_COLUMNS]
+        for position in range(len(created_at)):
+            history = view[offsets[position]:offsets[position + 1]]
+            values = habit_stats(names[periodicities[position]], created_at[position], history, as_of)
+            history.release()
+            for column, value in zip(columns, values):
+                column.append(value)
+    finally:
+        view.release()
+        memory.close()
+    columns = dict(zip((name for name, _ in PARTIAL_COLUMNS), columns))
+    if top is None:
+        return columns
+    return {
+        "broken": [first + position for position, broken in enumerate(columns["broken"]) if broken],
+        "top_streaks": heapq.nlargest(top, ((longest, -(first + position))
+                                            for position, longest in enumerate(columns["longest_streak"]))),
+        "hits": sum(columns["hits"]),
+        "expected": sum(columns["expected"])
+    }
+
+
+def summarize_stats(columns, top=10):
+    """
+    Reduces the statistics of all habits to population totals.
+
+    Parameters:
+        - columns (dict): The columns of get_habit_stats.
+        - top (int): The number of longest streaks to keep (optional).
+
+    Returns:
+        dict: The number of habits, the broken habits' tasks, the top (task, longest streak)
+        pairs (ties in creation order), and the hit and expected periods with their ratio.
+    """
+    tasks = columns["task"]
+    partial = {
+        "broken": [position for position, broken in enumerate(columns["broken"]) if broken],
+        "top_streaks": heapq.nlargest(top, ((int(longest), -position)
+                                            for position, longest in enumerate(columns["longest_streak"]))),
+        "hits": int(sum(columns["hits"])),
+        "expected": int(sum(columns["expected"]))
+    }
+    return merge_summaries(tasks, [partial], top)
+
+
+def merge_summaries(tasks, partials, top=10):
+    """
+    Merges the partial summaries of partitions, see summarize_stats.
+
+    Parameters:
+        - tasks (list): The task of every habit, by position.
+        - partials (list): The partial summaries, in partition order.
+        - top (int): The number of longest streaks to keep (optional).
+
+    Returns:
+        dict: The summary.
+    """
+    hits = sum(partial["hits"] for partial in partials)
+    expected = sum(partial["expected"] for partial in partials)
+    best = heapq.nlargest(top, (entry for partial in partials for entry in partial["top_streaks"]))
+    return {
+        "habits": len(tasks),
+        "broken": [tasks[position] for partial in partials for position in partial["broken"]],
+        "top_streaks": [(tasks[-position], longest) for longest, position in best],
+        "hits": hits,
+        "expected": expected,
+        "ratio": hits / expected if expected else 0.0
+    }
+
+
+def parallel_stats(executor, tasks, shared, as_of, partitions, top=None):
+    """
+    Computes statistics with a pool of worker processes, one partition of the habits at a time.
+
+    Parameters:
+        - executor (ProcessPoolExecutor): The worker pool, see create_pool.
+        - tasks (list): The task of every habit, by position.
+        - shared (SharedHistories): The habits' histories and fields.
+        - as_of (int): Seconds since the epoch; later completions are ignored.
+        - partitions (int): The number of partitions, e.g. PARTITIONS_PER_WORKER per worker.
+        - top (int): Return the summary with this many top streaks instead of all columns (optional).
+
+    Returns:
+        dict: The columns of get_habit_stats, or the summary of summarize_stats.
+    """
+    futures = [executor.submit(partition_stats, *shared.arguments(first, end), as_of, top)
+               for first, end in shared.partitions(partitions)]
+    results = [future.result() for future in futures]
+    if top is not None:
+        return merge_summaries(tasks, results, top)
+    columns = {"task": list(tasks)}
+    for name, _ in PARTIAL_COLUMNS:
+        column = []
+        for result in results:
+            column.extend(result[name])
+        columns[name] = column
+    columns["broken"] = [bool(broken) for broken in columns["broken"]]
+    return columns
@@ -0,0 +1,352 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+from habit_tracker import HabitTracker
+
+# Hex digits of the user id hash naming the shard directory, so 256 shards
+SHARD_DIGITS = 2
+
+# Rough memory footprint of a habit without its history, and of one completion, in bytes
+HABIT_BYTES = 400
+COMPLETION_BYTES = 8
+
+# Events that change a tracker's habits, see HabitTracker.subscribe
+CHANGE_EVENTS = ("habit_created", "habit_deleted", "habit_completed", "reset")
+
+
+def tracker_bytes(tracker):
+    """
+    Estimates the memory held by a tracker's habits.
+
+    Parameters:
+        - tracker (HabitTracker): The tracker.
+
+    Returns:
+        int: The estimate in bytes.
+    """
+    return sum(HABIT_BYTES + COMPLETION_BYTES * len(habit.completed_at) for habit in tracker.habits.values())
+
+
+class PooledTracker:
+    # One per resident tracker
+    __slots__ = ("user_id", "tracker", "size", "dirty", "pins")
+
+    def __init__(self, user_id, tracker):
+        """
+        Initializes the pool's bookkeeping for a resident tracker.
+
+        Parameters:
+            - user_id (str): The user id.
+            - tracker (HabitTracker): The loaded tracker.
+        """
+        self.user_id = user_id
+        self.tracker = tracker
+        self.size = tracker_bytes(tracker)  # Estimated bytes, see tracker_bytes
+        self.dirty = False  # Whether the habits changed since the tracker was loaded
+        self.pins = 0  # Callers currently using the tracker; pinned trackers are not evicted
+
+
+class TrackerPool:
+    def __init__(self, directory, max_trackers=1000, max_bytes=None, extension=".json", journal=False,
+                 write_behind=False):
+        """
+        Initializes a TrackerPool, which keeps one HabitTracker per user.
+
+        Every user has a data file of their own, in one of 256 shard directories picked by a hash
+        of the user id, so no directory grows too large. Trackers are loaded on first use and kept
+        in memory until the least recently used ones are evicted to stay within max_trackers and
+        max_bytes; a tracker in use is never evicted.
+
+        Parameters:
+            - directory (str): The directory holding the shard directories, created if missing.
+            - max_trackers (int): The most trackers kept in memory (optional).
+            - max_bytes (int): The most estimated bytes of habits kept in memory, see
+              tracker_bytes; unbounded if None (optional).
+            - extension (str): The data file extension, which picks the format, see open_storage (optional).
+            - journal (bool): Open the trackers in journal mode (optional).
+            - write_behind (bool): Open the trackers in write-behind mode (optional).
+        """
+        self.directory = directory
+        self.max_trackers = max_trackers
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.journal = journal
+        self.write_behind = write_behind
+        # Held while the resident trackers are looked up or picked for eviction, but not while
+        # trackers are loaded, flushed or closed; never taken by tracker callbacks, which run
+        # holding a tracker's lock
+        self._lock = threading.RLock()
+        self._trackers = OrderedDict()  # User id -> PooledTracker, least recently used first
+        self._busy = {}  # User id -> Event set once a load or eviction of the user in progress is done
+        os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._trackers)
+
+    @property
+    def resident_bytes(self):
+        """
+        The estimated bytes of the habits of all trackers in memory.
+        """
+        with self._lock:
+            return sum(entry.size for entry in self._trackers.values())
+
+    def shard_of(self, user_id):
+        """
+        Returns the shard directory of a user.
+
+        Parameters:
+            - user_id (str): The user id.
+
+        Returns:
+            str: The shard directory.
+        """
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:SHARD_DIGITS])
+
+    def data_file(self, user_id):
+        """
+        Returns the data file of a user.
+
+        Parameters:
+            - user_id (str): The user id, which may contain any characters.
+
+        Returns:
+            str: The data file path.
+        """
+        return os.path.join(self.shard_of(user_id), quote(user_id, safe="") + self.extension)
+
+    @contextmanager
+    def tracker(self, user_id):
+        """
+        Lends out the tracker of a user, loading it if it isn't in memory.
+
+        Use it as "with pool.tracker(user_id) as tracker:"; the tracker is not evicted before the
+        block exits, so it must not be kept afterwards.
+
+        Parameters:
+            - user_id (str): The user id.
+
+        Returns:
+            HabitTracker: The user's tracker, for the duration of the block.
+        """
+        entry, loading = self._pin(user_id, lend=True)
+        if entry is None:
+            try:
+                entry = self._load(user_id)
+            finally:
+                with self._lock:
+                    del self._busy[user_id]
+                    if entry is not None:
+                        self._trackers[user_id] = entry
+                loading.set()
+        with self._lock:
+            evicted = self._evict()
+        self._retire(evicted)
+        try:
+            yield entry.tracker
+        finally:
+            with self._lock:
+                entry.pins -= 1
+                evicted = self._evict()
+            self._retire(evicted)
+
+    def _pin(self, user_id, lend):
+        """
+        Pins the tracker of a user if it is resident, after waiting for a load or eviction of the
+        user in progress.
+
+        Parameters:
+            - user_id (str): The user id.
+            - lend (bool): Whether the tracker is lent out: it becomes the most recently used, and
+              if it isn't resident, the caller is to load it while other callers wait.
+
+        Returns:
+            tuple: The pinned PooledTracker, or None if the user isn't resident; and, if the
+            caller is to load the user, the Event to set once done, otherwise None.
+        """
+        while True:
+            with self._lock:
+                entry = self._trackers.get(user_id)
+                if entry is not None:
+                    if lend:
+                        self._trackers.move_to_end(user_id)
+                    entry.pins += 1
+                    return entry, None
+                busy = self._busy.get(user_id)
+                if busy is None:
+                    if not lend:
+                        return None, None
+                    busy = self._busy[user_id] = threading.Event()
+                    return None, busy
+            busy.wait()
+
+    def _load(self, user_id):
+        """
+        Loads the tracker of a user, pinned; called without holding the pool lock.
+        """
+        os.makedirs(self.shard_of(user_id), exist_ok=True)
+        tracker = HabitTracker(data_file=self.data_file(user_id), journal=self.journal,
+                               write_behind=self.write_behind)
+        entry = PooledTracker(user_id, tracker)
+        entry.pins = 1
+        tracker.subscribe(lambda event, habit: self._on_change(entry, event, habit))
+        return entry
+
+    def _on_change(self, entry, event, habit):
+        """
+        Marks a resident tracker dirty and keeps its size estimate up to date.
+        """
+        if event in CHANGE_EVENTS:
+            entry.dirty = True
+        if event == "habit_completed":
+            change = COMPLETION_BYTES
+        elif event == "habit_created":
+            change = HABIT_BYTES + COMPLETION_BYTES * len(habit.completed_at)
+        elif event == "habit_deleted":
+            change = -HABIT_BYTES - COMPLETION_BYTES * len(habit.completed_at)
+        else:
+            change = tracker_bytes(entry.tracker) - entry.size
+        entry.size += change
+
+    def _evict(self):
+        """
+        Picks the least recently used trackers not in use for eviction until the pool is within
+        its limits. Must be called holding the pool lock.
+
+        The evicted users are marked busy, so a user requested again is only loaded once
+        everything of theirs was written by _retire.
+
+        Returns:
+            list: The evicted PooledTrackers, to be passed to _retire after releasing the lock.
+        """
+        evicted = []
+        total = self.resident_bytes if self.max_bytes is not None else 0
+        for user_id in list(self._trackers):
+            if len(self._trackers) <= self.max_trackers and (self.max_bytes is None or total <= self.max_bytes):
+                break
+            entry = self._trackers[user_id]
+            if entry.pins == 0:
+                del self._trackers[user_id]
+                total -= entry.size
+                self._busy[user_id] = threading.Event()
+                evicted.append(entry)
+        return evicted
+
+    def _retire(self, entries):
+        """
+        Flushes and closes evicted trackers without holding the pool lock, then lets callers
+        waiting for their users go on.
+
+        Parameters:
+            - entries (list): The PooledTrackers returned by _evict.
+        """
+        for entry in entries:
+            try:
+                self._flush(entry)
+                entry.tracker.close()
+            finally:
+                with self._lock:
+                    busy = self._busy.pop(entry.user_id)
+                busy.set()
+
+    def _flush(self, entry):
+        """
+        Writes everything of a tracker that changed since it was loaded or last flushed.
+
+        Without a journal or write-behind every change is already in the data file. Otherwise a
+        full save writes the pending write-behind records and folds the journal into the data
+        file, so the next load reads a single file.
+        """
+        if entry.dirty:
+            entry.dirty = False
+            if self.journal or self.write_behind:
+                entry.tracker.save_data()
+
+    def users(self):
+        """
+        Yields the ids of all users with a data file or journal, shard by shard.
+        """
+        for shard in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, shard)
+            if len(shard) != SHARD_DIGITS or not os.path.isdir(path):
+                continue
+            names = set()
+            for name in os.listdir(path):
+                # In journal mode a new user only has a journal until it is first compacted
+                if name.endswith(self.extension + ".journal"):
+                    name = name[:-len(".journal")]
+                if name.endswith(self.extension):
+                    names.add(unquote(name[:-len(self.extension)]))
+            yield from sorted(names)
+
+    def map_users(self, function, users=None):
+        """
+        Runs a function on the tracker of every user, shard by shard.
+
+        Resident trackers are used as they are, once a load or eviction of the user in progress
+        is done. Other users are loaded one at a time and closed straight away instead of being
+        made resident, so a pass over all users neither evicts the hot trackers nor holds more
+        than one extra tracker in memory.
+
+        Parameters:
+            - function (callable): Called as function(tracker); must not keep the tracker.
+            - users (iterable): The user ids, defaults to all users (optional).
+
+        Returns:
+            Iterator of (user id, result) tuples.
+        """
+        for user_id in self.users() if users is None else users:
+            entry, _ = self._pin(user_id, lend=False)
+            if entry is not None:
+                try:
+                    yield user_id, function(entry.tracker)
+                finally:
+                    with self._lock:
+                        entry.pins -= 1
+                continue
+            tracker = HabitTracker(data_file=self.data_file(user_id), journal=self.journal)
+            try:
+                result = function(tracker)
+            finally:
+                tracker.close()
+            yield user_id, result
+
+    def get_broken_habits(self):
+        """
+        Finds the broken habits of every user, shard by shard.
+
+        Returns:
+            Iterator of (user id, list of broken habits) tuples, for users with broken habits.
+        """
+        for user_id, habits in self.map_users(HabitTracker.get_broken_habits):
+            if habits:
+                yield user_id, habits
+
+    def flush(self):
+        """
+        Writes everything of the resident trackers that changed, keeping them in memory.
+        """
+        with self._lock:
+            entries = [entry for entry in self._trackers.values() if entry.dirty]
+        for entry in entries:
+            self._flush(entry)
+
+    def close(self):
+        """
+        Flushes and closes all resident trackers.
+        """
+        with self._lock:
+            busy = list(self._busy.values())
+        for event in busy:
+            event.wait()
+        with self._lock:
+            entries = list(self._trackers.values())
+            self._trackers.clear()
+        for entry in entries:
+            self._flush(entry)
+            entry.tracker.close()
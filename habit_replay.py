@@ -0,0 +1,121 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice, repeat
+
+from habit_rollup import day_number
+from habit_vector import STATS_COLUMNS
+
+
+class ReplayEngine:
+    def __init__(self, habits, period_days):
+        """
+        Initializes a ReplayEngine, which replays the completions of habits in time order to
+        compute their statistics at past times without touching the habits.
+
+        The histories are copied, so the habits may change while a replay runs.
+
+        Parameters:
+            - habits (list): The habits, in the order of the results.
+            - period_days (dict): The length in days of each periodicity that can be broken.
+        """
+        self.tasks = [habit.task for habit in habits]
+        self.lengths = [period_days.get(habit.periodicity, 1) for habit in habits]
+        self.breakable = [habit.periodicity in period_days for habit in habits]
+        self.created = [(day_number(habit.created_at) - 1) // length
+                        for habit, length in zip(habits, self.lengths)]
+        self.histories = [history[:] if isinstance(history, array) else array("q", history)
+                          for history in (habit.completed_at for habit in habits)]
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def events(self, start=None, end=None):
+        """
+        Streams the completions of all habits in time order.
+
+        Parameters:
+            - start (int): Only completions at or after this time (optional).
+            - end (int): Only completions at or before this time (optional).
+
+        Returns:
+            Iterator of (timestamp, habit position) tuples.
+        """
+        streams = []
+        for position, history in enumerate(self.histories):
+            first = 0 if start is None else bisect_left(history, start)
+            last = len(history) if end is None else bisect_right(history, end)
+            if first < last:
+                streams.append(zip(islice(history, first, last), repeat(position)))
+        return heapq.merge(*streams)
+
+    def snapshots(self, times):
+        """
+        Computes the statistics of every habit at each of a series of times, in one pass over
+        the completions: each completion is applied once, and a snapshot costs one step per habit.
+
+        Every snapshot equals HabitTracker.get_habit_stats(as_of=time).
+
+        Parameters:
+            - times (iterable): Seconds since the epoch, in ascending order.
+
+        Returns:
+            Iterator of (time, columns) tuples, with the columns of get_habit_stats.
+        """
+        count = len(self.tasks)
+        last = [None] * count  # Period of the latest completion applied
+        first = [None] * count  # Period of the first completion
+        streak = [0] * count  # Run of consecutive periods ending with the latest completion
+        longest = [0] * count
+        hits = [0] * count  # Periods with at least one completion
+        lengths = self.lengths
+        events = self.events()
+        event = next(events, None)
+        previous = None
+        for time in times:
+            if previous is not None and time < previous:
+                raise ValueError("Snapshot times must be in ascending order")
+            previous = time
+            while event is not None and event[0] <= time:
+                timestamp, position = event
+                period = (day_number(timestamp) - 1) // lengths[position]
+                latest = last[position]
+                if latest is None:
+                    first[position] = period
+                    streak[position] = hits[position] = 1
+                elif period != latest:
+                    streak[position] = streak[position] + 1 if period == latest + 1 else 1
+                    hits[position] += 1
+                if period != latest:
+                    last[position] = period
+                    if streak[position] > longest[position]:
+                        longest[position] = streak[position]
+                event = next(events, None)
+            yield time, self._columns(time, last, first, streak, longest, hits)
+
+    def _columns(self, time, last, first, streak, longest, hits):
+        """
+        Turns the replay state at a time into the columns of get_habit_stats.
+        """
+        day = day_number(time)
+        currents = {length: (day - 1) // length for length in set(self.lengths)}
+        columns = {name: [] for name in STATS_COLUMNS}
+        columns["task"] = list(self.tasks)
+        streaks, longests, broken_column = columns["streak"], columns["longest_streak"], columns["broken"]
+        hits_column, expected_column, ratios = columns["hits"], columns["expected"], columns["ratio"]
+        for position, length in enumerate(self.lengths):
+            current = currents[length]
+            start = self.created[position]
+            latest = last[position]
+            broken = False
+            if latest is not None:
+                start = min(start, first[position])
+                broken = self.breakable[position] and current >= latest + 2
+            expected = max(current - start + 1, 0)
+            streaks.append(0 if broken else streak[position])
+            longests.append(longest[position])
+            broken_column.append(broken)
+            hits_column.append(hits[position])
+            expected_column.append(expected)
+            ratios.append(hits[position] / expected if expected else 0.0)
+        return columns
@@ -0,0 +1,280 @@
+from datetime import date
+
+# Bucket sizes rollups are kept for
+GRANULARITIES = ("day", "week", "month")
+
+# Columns of exported rollup rows
+ROLLUP_COLUMNS = ("task", "bucket", "completions", "expected", "hits", "misses")
+
+
+def day_number(timestamp):
+    """
+    Numbers the local day a timestamp falls in.
+
+    Parameters:
+        - timestamp (int): Seconds since the epoch.
+
+    Returns:
+        int: The proleptic Gregorian ordinal of the day.
+    """
+    return date.fromtimestamp(timestamp).toordinal()
+
+
+def bucket_of(day, granularity):
+    """
+    Numbers the day, ISO week or month a day falls in.
+
+    Parameters:
+        - day (int): The day ordinal.
+        - granularity (str): "day", "week" or "month".
+
+    Returns:
+        int: The bucket number; consecutive buckets have consecutive numbers.
+    """
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        # Ordinal 1 (0001-01-01) is a Monday, as in period_index
+        return (day - 1) // 7
+    first = date.fromordinal(day)
+    return first.year * 12 + first.month - 1
+
+
+def bucket_days(bucket, granularity):
+    """
+    Returns the first and last day of a bucket.
+
+    Parameters:
+        - bucket (int): The bucket number, see bucket_of.
+        - granularity (str): "day", "week" or "month".
+
+    Returns:
+        tuple: The ordinals of the first and the last day.
+    """
+    if granularity == "day":
+        return bucket, bucket
+    if granularity == "week":
+        return bucket * 7 + 1, bucket * 7 + 7
+    year, month = divmod(bucket, 12)
+    next_year, next_month = divmod(bucket + 1, 12)
+    return date(year, month + 1, 1).toordinal(), date(next_year, next_month + 1, 1).toordinal() - 1
+
+
+def bucket_label(bucket, granularity):
+    """
+    Names a bucket: "2023-12-01" for days, "2023-W48" for ISO weeks and "2023-12" for months.
+
+    Parameters:
+        - bucket (int): The bucket number, see bucket_of.
+        - granularity (str): "day", "week" or "month".
+
+    Returns:
+        str: The label.
+    """
+    if granularity == "day":
+        return date.fromordinal(bucket).isoformat()
+    if granularity == "week":
+        year, week, _ = date.fromordinal(bucket * 7 + 1).isocalendar()
+        return f"{year}-W{week:02d}"
+    year, month = divmod(bucket, 12)
+    return f"{year}-{month + 1:02d}"
+
+
+class HabitRollup:
+    # Created for every habit with completions, so keep it small
+    __slots__ = ("length", "periods", "counts", "hits", "first")
+
+    def __init__(self, length):
+        """
+        Initializes the rollups of one habit.
+
+        Parameters:
+            - length (int): The length of the habit's period in days.
+        """
+        self.length = length
+        self.counts = ({}, {}, {})  # Completions per bucket, by granularity
+        self.hits = ({}, {}, {})  # Periods with at least one completion per bucket, by granularity
+        # Completions per period; weekly periods are the week buckets, so share those
+        self.periods = self.counts[1] if length == 7 else {}
+        self.first = None  # The first period with a completion
+
+
+class Rollups:
+    def __init__(self, period_days):
+        """
+        Initializes Rollups, which count completions and hit periods of every habit per day, ISO
+        week and month.
+
+        A period counts towards the buckets its first day falls in, so the weeks of a weekly habit
+        are counted in the month of their Monday.
+
+        Parameters:
+            - period_days (dict): The length in days of each periodicity, 1 for unknown ones.
+        """
+        self._period_days = period_days
+        self._habits = {}  # Key -> HabitRollup, for habits with completions
+        self._totals = {}  # Day -> completions of all habits
+
+    def __len__(self):
+        return len(self._habits)
+
+    def add(self, key, habit, timestamp):
+        """
+        Counts a completion.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+            - timestamp (int): The completion timestamp.
+        """
+        rollup = self._habits.get(key)
+        if rollup is None:
+            rollup = self._habits[key] = HabitRollup(self._period_days.get(habit.periodicity, 1))
+        day = day_number(timestamp)
+        self._totals[day] = self._totals.get(day, 0) + 1
+        period = (day - 1) // rollup.length
+        hit = rollup.periods.get(period, 0) == 0
+        for position, granularity in enumerate(GRANULARITIES):
+            counts = rollup.counts[position]
+            bucket = bucket_of(day, granularity)
+            counts[bucket] = counts.get(bucket, 0) + 1
+        if rollup.periods is not rollup.counts[1]:
+            rollup.periods[period] = rollup.periods.get(period, 0) + 1
+        if hit:
+            self._count_hit(rollup, period, 1)
+            if rollup.first is None or period < rollup.first:
+                rollup.first = period
+
+    def discard(self, key, habit, timestamp):
+        """
+        Uncounts a completion, e.g. when a batch is rolled back.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+            - timestamp (int): The completion timestamp.
+        """
+        rollup = self._habits.get(key)
+        if rollup is None:
+            return
+        day = day_number(timestamp)
+        self._decrement(self._totals, day)
+        period = (day - 1) // rollup.length
+        for position, granularity in enumerate(GRANULARITIES):
+            self._decrement(rollup.counts[position], bucket_of(day, granularity))
+        if rollup.periods is not rollup.counts[1]:
+            self._decrement(rollup.periods, period)
+        if period not in rollup.periods:
+            self._count_hit(rollup, period, -1)
+            if not rollup.periods:
+                del self._habits[key]
+            elif period == rollup.first:
+                rollup.first = min(rollup.periods)
+
+    def add_habit(self, key, habit):
+        """
+        Counts every completion of a habit, e.g. when a deleted habit is restored.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+        """
+        for timestamp in habit.completed_at:
+            self.add(key, habit, timestamp)
+
+    def remove(self, key):
+        """
+        Drops the rollups of a deleted habit.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+        """
+        rollup = self._habits.pop(key, None)
+        if rollup is not None:
+            for day, count in rollup.counts[0].items():
+                self._decrement(self._totals, day, count)
+
+    @staticmethod
+    def _decrement(counts, bucket, count=1):
+        """
+        Lowers a count, dropping buckets that reach zero.
+        """
+        remaining = counts.get(bucket, 0) - count
+        if remaining > 0:
+            counts[bucket] = remaining
+        else:
+            counts.pop(bucket, None)
+
+    @staticmethod
+    def _count_hit(rollup, period, change):
+        """
+        Adds a period that got its first completion, or removes one that lost its last, to the
+        hits of the buckets its first day falls in.
+        """
+        start = period * rollup.length + 1
+        for position, granularity in enumerate(GRANULARITIES):
+            hits = rollup.hits[position]
+            bucket = bucket_of(start, granularity)
+            if change > 0:
+                hits[bucket] = hits.get(bucket, 0) + 1
+            else:
+                Rollups._decrement(hits, bucket)
+
+    def buckets(self, key, habit, granularity, first_day, last_day, today):
+        """
+        Summarizes a habit per bucket, reading only the buckets between two days.
+
+        A period is expected from the habit's creation (or its first completion, if earlier) until
+        today.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+            - granularity (str): "day", "week" or "month".
+            - first_day (int): The ordinal of a day in the first bucket.
+            - last_day (int): The ordinal of a day in the last bucket.
+            - today (int): The ordinal of the current day.
+
+        Returns:
+            List of dicts with the bucket label and its completions, expected periods, hit
+            periods and missed periods.
+        """
+        position = GRANULARITIES.index(granularity)
+        rollup = self._habits.get(key)
+        length = rollup.length if rollup is not None else self._period_days.get(habit.periodicity, 1)
+        counts = rollup.counts[position] if rollup is not None else {}
+        hits = rollup.hits[position] if rollup is not None else {}
+        start_period = (day_number(habit.created_at) - 1) // length
+        if rollup is not None and rollup.first is not None:
+            start_period = min(start_period, rollup.first)
+        end_period = (today - 1) // length
+        result = []
+        for bucket in range(bucket_of(first_day, granularity), bucket_of(last_day, granularity) + 1):
+            bucket_start, bucket_end = bucket_days(bucket, granularity)
+            # Periods whose first day is in the bucket, within the expected ones
+            low = max(-((1 - bucket_start) // length), start_period)
+            high = min((bucket_end - 1) // length, end_period)
+            expected = max(0, high - low + 1)
+            hit = hits.get(bucket, 0)
+            result.append({"bucket": bucket_label(bucket, granularity), "completions": counts.get(bucket, 0),
+                           "expected": expected, "hits": hit, "misses": max(0, expected - hit)})
+        return result
+
+    def heatmap(self, key, first_day, last_day):
+        """
+        Counts the completions of a habit, or of all habits, on every day between two days.
+
+        Parameters:
+            - key (str): The lower-cased habit name, or None for all habits.
+            - first_day (int): The ordinal of the first day.
+            - last_day (int): The ordinal of the last day.
+
+        Returns:
+            List of ("%Y-%m-%d" date, completions) tuples, one per day.
+        """
+        if key is None:
+            counts = self._totals
+        else:
+            rollup = self._habits.get(key)
+            counts = rollup.counts[0] if rollup is not None else {}
+        return [(date.fromordinal(day).isoformat(), counts.get(day, 0)) for day in range(first_day, last_day + 1)]
@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import json
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from habit_model import PERIODICITIES, format_timestamp
+from habit_tracker import HabitTracker
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Seconds writes are collected for before they are persisted together
+BATCH_WINDOW = 0.005
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+def habit_summary(habit):
+    """
+    Describes a habit for a JSON response, without its completion history.
+
+    Parameters:
+        - habit (Habit): The habit.
+
+    Returns:
+        dict: The task, periodicity, creation time, streaks, number of completions and last completion.
+    """
+    history = habit.completed_at
+    return {
+        "task": habit.task,
+        "periodicity": str(habit.periodicity),
+        "created_at": format_timestamp(habit.created_at),
+        "streak": habit.streak,
+        "longest_streak": habit.longest_streak,
+        "completions": len(history),
+        "last_completed": format_timestamp(history[-1]) if history else None
+    }
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        """
+        Initializes an HttpError, which turns into an error response.
+
+        Parameters:
+            - status (int): The HTTP status code.
+            - message (str): The error message sent to the client.
+        """
+        super().__init__(message)
+        self.status = status
+
+
+class HabitService:
+    def __init__(self, tracker, batch_window=BATCH_WINDOW):
+        """
+        Initializes a HabitService, an HTTP/JSON front-end for a tracker.
+
+        Requests are handled on one asyncio event loop. Reads are answered from the habits in
+        memory. Writes are applied in memory straight away, and their responses wait until they
+        are persisted: writes arriving within batch_window seconds of each other are persisted
+        together by one flush of the tracker's write-behind queue (one journal append, SQLite
+        transaction or data file rewrite). Without write-behind, every write is persisted on its
+        own before its response.
+
+        Endpoints:
+            - GET /habits[?periodicity=daily]: List habits.
+            - POST /habits {"task": ..., "periodicity": ...}: Create a habit.
+            - GET /habits/<task>: A habit with its completion history.
+            - DELETE /habits/<task>: Delete a habit.
+            - POST /habits/<task>/complete [{"completed_at": ...}]: Complete a habit.
+            - GET /habits/<task>/streak: The current and longest streak of a habit.
+            - GET /broken: List broken habits.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker, preferably in write-behind mode.
+            - batch_window (float): Seconds to collect writes for before persisting them (optional).
+        """
+        self.tracker = tracker
+        self.batch_window = batch_window
+        self._flush = None  # Future of the flush the next write joins, if one is scheduled
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Starts listening for connections.
+
+        Parameters:
+            - host (str): The address to listen on (optional).
+            - port (int): The port to listen on, 0 for any free port (optional).
+
+        Returns:
+            asyncio.Server: The server, e.g. to read the port from or to close.
+        """
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves the HTTP/1.1 requests of one connection, keeping it open between requests unless
+        the client asks to close it.
+
+        Parameters:
+            - reader (asyncio.StreamReader): The connection's input.
+            - writer (asyncio.StreamWriter): The connection's output.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request line."}, False)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close" if version == "HTTP/1.1" \
+                    else headers.get("connection", "").lower() == "keep-alive"
+                try:
+                    body = await self._read_body(reader, headers)
+                    status, payload = await self.dispatch(method, target, body)
+                except HttpError as error:
+                    status, payload = error.status, {"error": str(error)}
+                    keep_alive = keep_alive and status not in (411, 413)
+                except Exception as error:
+                    status, payload = 500, {"error": f"{type(error).__name__}: {error}"}
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_body(reader, headers):
+        """
+        Reads a request body of the length given by its Content-Length header.
+        """
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HttpError(411, "Chunked request bodies are not supported, send a Content-Length.")
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length.") from None
+        if length > MAX_BODY:
+            raise HttpError(413, f"Request bodies are limited to {MAX_BODY} bytes.")
+        return await reader.readexactly(length) if length else b""
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        """
+        Writes a JSON response.
+        """
+        body = json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, body=b""):
+        """
+        Routes a request to its endpoint.
+
+        Parameters:
+            - method (str): The HTTP method.
+            - target (str): The request target, a path with an optional query string.
+            - body (bytes): The request body, JSON if not empty (optional).
+
+        Returns:
+            tuple: The HTTP status code and the JSON-serializable response.
+        """
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        query = parse_qs(url.query)
+        if parts == ["habits"]:
+            if method == "GET":
+                return 200, self.list_habits(query.get("periodicity", [None])[0])
+            if method == "POST":
+                return await self.create_habit(self._json(body))
+        elif len(parts) == 2 and parts[0] == "habits":
+            if method == "GET":
+                return 200, self.get_habit(parts[1])
+            if method == "DELETE":
+                return await self.delete_habit(parts[1])
+        elif len(parts) == 3 and parts[0] == "habits" and parts[2] == "complete":
+            if method == "POST":
+                return await self.complete_task(parts[1], self._json(body))
+        elif len(parts) == 3 and parts[0] == "habits" and parts[2] == "streak":
+            if method == "GET":
+                return 200, self.get_streak(parts[1])
+        elif parts == ["broken"]:
+            if method == "GET":
+                return 200, [habit_summary(habit) for habit in self.tracker.get_broken_habits()]
+        else:
+            raise HttpError(404, f"No endpoint at {url.path}.")
+        raise HttpError(405, f"{method} is not allowed on {url.path}.")
+
+    @staticmethod
+    def _json(body):
+        """
+        Parses a request body as a JSON object; an empty body is an empty object.
+        """
+        if not body:
+            return {}
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "The request body is not valid JSON.") from None
+        if not isinstance(data, dict):
+            raise HttpError(400, "The request body must be a JSON object.")
+        return data
+
+    def _habit(self, task):
+        """
+        Looks up a habit, raising a 404 error if it doesn't exist.
+        """
+        habit = self.tracker.get_habit(task)
+        if habit is None:
+            raise HttpError(404, f"Habit '{task}' not found.")
+        return habit
+
+    def list_habits(self, periodicity=None):
+        """
+        Lists all habits, or those with one periodicity.
+        """
+        if periodicity is None:
+            habits = self.tracker.get_all_habits()
+        else:
+            habits = self.tracker.get_habits_by_periodicity(periodicity)
+        return [habit_summary(habit) for habit in habits]
+
+    def get_habit(self, task):
+        """
+        Describes a habit, including its completion history.
+        """
+        habit = self._habit(task)
+        result = habit_summary(habit)
+        result["completed_at"] = [format_timestamp(timestamp) for timestamp in habit.completed_at]
+        return result
+
+    def get_streak(self, task):
+        """
+        Returns the current and longest streak of a habit.
+        """
+        habit = self._habit(task)
+        return {"task": habit.task, "streak": habit.streak, "longest_streak": habit.longest_streak}
+
+    async def create_habit(self, data):
+        """
+        Creates a habit from {"task": ..., "periodicity": ...} once it is persisted.
+        """
+        task, periodicity = data.get("task"), data.get("periodicity")
+        if not isinstance(task, str) or not task.strip():
+            raise HttpError(400, "A task name is required.")
+        if periodicity not in PERIODICITIES:
+            raise HttpError(400, f"The periodicity must be one of {', '.join(PERIODICITIES)}.")
+        if self.tracker.get_habit(task) is not None:
+            raise HttpError(409, f"Habit with the name '{task}' already exists.")
+        self.tracker.create_habit(task, periodicity)
+        await self.persisted()
+        return 201, habit_summary(self.tracker.get_habit(task))
+
+    async def delete_habit(self, task):
+        """
+        Deletes a habit once it is persisted.
+        """
+        habit = self._habit(task)
+        self.tracker.delete_habit(task)
+        await self.persisted()
+        return 200, habit_summary(habit)
+
+    async def complete_task(self, task, data):
+        """
+        Completes a habit, now or at {"completed_at": ...}, once it is persisted.
+        """
+        habit = self._habit(task)
+        try:
+            self.tracker.complete_task(task, data.get("completed_at"))
+        except (ValueError, TypeError) as error:
+            raise HttpError(400, f"Invalid completion time: {error}") from None
+        await self.persisted()
+        return 200, habit_summary(habit)
+
+    async def persisted(self):
+        """
+        Waits until the writes made so far are persisted.
+
+        The first write after a flush schedules the next one batch_window seconds later, and
+        every write made meanwhile waits for that same flush.
+        """
+        if self._flush is None:
+            self._flush = asyncio.ensure_future(self._flush_later())
+        # A client hanging up must not cancel the flush the other writes wait for
+        await asyncio.shield(self._flush)
+
+    async def _flush_later(self):
+        """
+        Flushes the tracker's write-behind queue after the batch window, off the event loop.
+        """
+        await asyncio.sleep(self.batch_window)
+        self._flush = None  # Writes from now on join the next flush
+        await asyncio.get_running_loop().run_in_executor(None, self.tracker.flush)
+
+
+async def serve(tracker, host=DEFAULT_HOST, port=DEFAULT_PORT, batch_window=BATCH_WINDOW):
+    """
+    Runs a HabitService until cancelled.
+
+    Parameters:
+        - tracker (HabitTracker): The tracker to serve.
+        - host (str): The address to listen on (optional).
+        - port (int): The port to listen on (optional).
+        - batch_window (float): Seconds to collect writes for before persisting them (optional).
+    """
+    server = await HabitService(tracker, batch_window).start(host, port)
+    print(f"Serving habits on http://{host}:{server.sockets[0].getsockname()[1]}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    """
+    Runs the habit service from the command line.
+
+    Parameters:
+        - argv (list): Command line arguments, defaults to sys.argv (optional).
+    """
+    parser = argparse.ArgumentParser(description="Serve a habit tracker over HTTP/JSON.")
+    parser.add_argument("--data-file", default="habit_data.json")
+    parser.add_argument("--journal", action="store_true", default=True,
+                        help="Append mutations to a journal (the default).")
+    parser.add_argument("--no-journal", dest="journal", action="store_false",
+                        help="Rewrite the whole data file on every flush, holding up reads while it is serialized.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW,
+                        help="Seconds to collect writes for before persisting them together.")
+    args = parser.parse_args(argv)
+
+    # The service flushes after each batch window; the delay only covers writes nobody waits for
+    tracker = HabitTracker(data_file=args.data_file, journal=args.journal, write_behind=True, flush_delay=1.0)
+    try:
+        asyncio.run(serve(tracker, args.host, args.port, args.batch_window))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        tracker.close()
+
+
+if __name__ == "__main__":
+    main()
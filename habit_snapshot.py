@@ -0,0 +1,185 @@
+from array import array
+from collections.abc import Mapping
+from itertools import islice
+
+from habit_model import Habit
+
+# A layer of a snapshot is merged into the one below once it has at least 1/LAYER_RATIO of its entries
+LAYER_RATIO = 2
+
+
+def freeze_habit(habit):
+    """
+    Copies a habit for a snapshot. Histories still in a binary snapshot or partly archived
+    share what never changes instead of being copied.
+
+    Parameters:
+        - habit (Habit): The live habit.
+
+    Returns:
+        Habit: The copy.
+    """
+    history = habit.completed_at
+    history = history[:] if type(history) is array else history.copy()
+    return Habit(habit.task, habit.periodicity, habit.created_at, history, habit.streak, habit.longest_streak)
+
+
+def creation_order(entries, next_order):
+    """
+    Puts the habits of a layer in creation order without sorting: every creation order is
+    below next_order, so each habit goes straight into its slot.
+
+    Parameters:
+        - entries (dict): Names mapped to (creation order, habit), or to None for a deleted habit.
+        - next_order (int): The creation order of the next new habit.
+
+    Returns:
+        list: (name, habit) pairs in creation order.
+    """
+    slots = [None] * next_order
+    for key, entry in entries.items():
+        if entry is not None:
+            slots[entry[0]] = (key, entry[1])
+    return [slot for slot in slots if slot is not None]
+
+
+class SnapshotHabits(Mapping):
+    def __init__(self, layers, length, next_order):
+        """
+        Initializes SnapshotHabits, the habits of a snapshot keyed by lower-cased name, in
+        creation order. It never changes once built.
+
+        The habits are kept in layers, oldest first, each mapping names to (creation order,
+        habit) or to None for a deleted habit. A newer snapshot shares all layers of the one it
+        was derived from and adds one holding only the habits changed since. Layers are merged
+        like the digits of a binary counter, so there are O(log n) of them and every habit is
+        copied into a merged layer O(log n) times. When everything is merged into a single layer,
+        the creation orders are renumbered from 0, so they stay below twice the number of habits
+        and the habits can be put in order in linear time.
+
+        Parameters:
+            - layers (list): The layers, oldest first; the oldest holds no deleted habits, and
+              if it is the only one, its habits are in creation order.
+            - length (int): The number of habits.
+            - next_order (int): The creation order of the next new habit.
+        """
+        self._layers = layers
+        self._length = length
+        self._next_order = next_order
+        self._items = None  # (name, habit) pairs in creation order, built on first iteration
+
+    @classmethod
+    def build(cls, habits):
+        """
+        Copies all habits of a tracker into a single layer.
+
+        Parameters:
+            - habits (dict): The live habits keyed by lower-cased name, in creation order.
+
+        Returns:
+            SnapshotHabits: The habits.
+        """
+        layer = {key: (order, freeze_habit(habit)) for order, (key, habit) in enumerate(habits.items())}
+        return cls([layer], len(layer), len(layer))
+
+    def evolve(self, habits, changed):
+        """
+        Derives the habits of the next snapshot: only the changed habits are copied, everything
+        else is shared with this one.
+
+        Parameters:
+            - habits (dict): The live habits keyed by lower-cased name.
+            - changed (dict): The lower-cased names of the habits changed since this snapshot,
+              each mapped to whether the habit was deleted meanwhile (so if it exists now, it
+              was created again and comes last).
+
+        Returns:
+            SnapshotHabits: The new habits.
+        """
+        layer = {}
+        length = self._length
+        created = 0
+        for key, deleted in changed.items():
+            entry = self._entry(key)
+            habit = habits.get(key)
+            if habit is None:
+                if entry is not None:
+                    layer[key] = None
+                    length -= 1
+            elif entry is None or deleted:
+                length += entry is None
+                created += 1
+            else:
+                layer[key] = (entry[0], freeze_habit(habit))
+        # Habits created since are the last ones of the tracker, in creation order
+        next_order = self._next_order
+        for key in reversed(list(islice(reversed(habits), created))):
+            layer[key] = (next_order, freeze_habit(habits[key]))
+            next_order += 1
+        if not layer:
+            habits = SnapshotHabits(self._layers, length, next_order)
+            habits._items = self._items
+            return habits
+        layers = self._layers + [layer]
+        while len(layers) > 1 and len(layers[-1]) * LAYER_RATIO >= len(layers[-2]):
+            newer = layers.pop()
+            merged = dict(layers.pop())
+            merged.update(newer)
+            if not layers:
+                ordered = creation_order(merged, next_order)
+                merged = {key: (order, habit) for order, (key, habit) in enumerate(ordered)}
+                next_order = len(merged)
+            layers.append(merged)
+        return SnapshotHabits(layers, length, next_order)
+
+    def _entry(self, key):
+        """
+        Finds the (creation order, habit) entry of a name in the newest layer that has it.
+
+        Returns:
+            tuple: The entry, or None if there is no such habit.
+        """
+        for layer in reversed(self._layers):
+            if key in layer:
+                return layer[key]
+        return None
+
+    def _ordered(self):
+        """
+        Returns the (name, habit) pairs in creation order, putting them in order on first use.
+        """
+        items = self._items
+        if items is None:
+            if len(self._layers) == 1:
+                items = [(key, entry[1]) for key, entry in self._layers[0].items()]
+            else:
+                entries = {}
+                for layer in self._layers:
+                    entries.update(layer)
+                items = creation_order(entries, self._next_order)
+            self._items = items
+        return items
+
+    def __getitem__(self, key):
+        entry = self._entry(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[1]
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return (key for key, _ in self._ordered())
+
+    def items(self):
+        return list(self._ordered())
+
+    def values(self):
+        return [habit for _, habit in self._ordered()]
+
+    def layers(self):
+        """
+        Returns the number of layers, for tests and diagnostics.
+        """
+        return len(self._layers)
@@ -0,0 +1,1787 @@
+import argparse
+import base64
+import csv
+import json
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from habit_archive import HistoryArchive, TieredHistory
+from habit_model import Habit, Periodicity, format_timestamp, to_timestamp
+
+DATA_FORMAT_VERSION = 3
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+BINARY_EXTENSIONS = (".habits",)
+# Interchange formats for bulk import and export, by file extension
+ROW_FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+CSV_COLUMNS = ("type", "task", "periodicity", "created_at", "completed_at")
+
+# Binary snapshot layout, all little-endian:
+#   header: magic, format version, habit count, offset of the names, offset of the histories,
+#     generation (version 2), offsets of the name index, the deadline order and the leaderboard
+#     order (version 3); older headers end earlier
+#   habit table: one fixed-width row per habit
+#   name index (version 3): open-addressing hash table of uint32 row numbers plus one, 0 for an
+#     empty slot, hashed by the CRC-32 of the UTF-8 lower-cased name
+#   deadline order (version 3): uint32 row numbers of the habits that can be broken, by deadline
+#     and then lower-cased name
+#   leaderboard order (version 3): uint32 row numbers of all habits, by longest streak, longest
+#     first, and then row
+#   names: UTF-8 name and periodicity of every habit, in table order
+#   histories: the completion timestamps of every habit as int64, in table order
+BINARY_MAGIC = b"HABT"
+BINARY_FORMAT_VERSION = 3
+BINARY_HEADER = struct.Struct("<4sHxxQQQQQQQ")
+BINARY_HEADER_V2 = struct.Struct("<4sHxxQQQQ")
+BINARY_HEADER_V1 = struct.Struct("<4sHxxQQQ")
+# Name length, periodicity length, created_at, streak, longest streak, history offset,
+# history length, last completion, name offset, deadline (0 if the habit can't be broken)
+BINARY_ROW = struct.Struct("<IHqIIQIqQq")
+# Versions 1 and 2 rows end after the last completion
+BINARY_ROW_V2 = struct.Struct("<IHqIIQIq")
+BINARY_SLOT = struct.Struct("<I")
+_history_lock = threading.Lock()
+
+# Returned by changes() when the data file was rewritten by another process and has to be reloaded
+RELOAD = "reload"
+
+# The generation of a JSON data file, which dump writes right after the format version
+GENERATION_PATTERN = re.compile(rb'"generation": (\d+)')
+
+
+def pack_timestamps(timestamps):
+    """
+    Encodes sorted epoch timestamps as base64 of zigzag delta varints.
+
+    Daily check-ins take three bytes each before base64, so years of history stay within a few KB.
+
+    Parameters:
+        - timestamps (array): Sorted epoch timestamps.
+
+    Returns:
+        str: The packed timestamps.
+    """
+    packed = bytearray()
+    previous = 0
+    for timestamp in timestamps:
+        delta = timestamp - previous
+        previous = timestamp
+        delta = (delta << 1) ^ (delta >> 63)
+        while delta >= 0x80:
+            packed.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        packed.append(delta)
+    return base64.b64encode(packed).decode("ascii")
+
+
+def unpack_timestamps(text):
+    """
+    Decodes timestamps packed by pack_timestamps.
+
+    Parameters:
+        - text (str): The packed timestamps.
+
+    Returns:
+        array: The epoch timestamps as array('q').
+    """
+    timestamps = array("q")
+    previous = 0
+    delta = 0
+    shift = 0
+    for byte in base64.b64decode(text):
+        delta |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += (delta >> 1) ^ -(delta & 1)
+        timestamps.append(previous)
+        delta = 0
+        shift = 0
+    return timestamps
+
+
+def _upgrade_habit(habit):
+    """
+    Upgrades a habit from the original file format, where "completed_at" held a single
+    completion string (or an empty list), to one holding the completion history.
+
+    The old "streak" counter is dropped so that the tracker recomputes it from the history.
+
+    Parameters:
+        - habit (dict): The habit as stored by version 1 files.
+
+    Returns:
+        Habit: The upgraded habit, with its streaks still to be computed.
+    """
+    completed_at = habit.get("completed_at") or []
+    if isinstance(completed_at, str):
+        completed_at = [completed_at]
+    return Habit(habit["task"], habit["periodicity"], habit["created_at"],
+                 array("q", sorted(to_timestamp(value) for value in completed_at)), None, None)
+
+
+def parse_time(value):
+    """
+    Converts a time from an import row to an epoch timestamp.
+
+    Parameters:
+        - value (str or int): A "%Y-%m-%d %H:%M:%S" string or an epoch timestamp, possibly as a string.
+
+    Returns:
+        int: Seconds since the epoch, or None if the value is missing.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, str) and value.lstrip("-").isdigit():
+        return int(value)
+    return to_timestamp(value)
+
+
+def row_format(path, format=None):
+    """
+    Picks the interchange format of an import or export file.
+
+    Parameters:
+        - path (str): The file; .ndjson and .jsonl files are NDJSON, .csv files CSV.
+        - format (str): "ndjson" or "csv", overriding the extension (optional).
+
+    Returns:
+        str: The format.
+    """
+    format = format or ROW_FORMATS.get(os.path.splitext(path)[1].lower())
+    if format not in ("ndjson", "csv"):
+        raise ValueError(f"Unknown import/export format for {path}; use .ndjson, .jsonl or .csv.")
+    return format
+
+
+def read_rows(path, format=None):
+    """
+    Streams the rows of an NDJSON or CSV file, one at a time.
+
+    Each row is a dict with a "type" of "habit" (with "task", "periodicity" and "created_at") or
+    "completion" (with "task" and "completed_at"). CSV files have the columns in CSV_COLUMNS.
+
+    Parameters:
+        - path (str): The file to read.
+        - format (str): "ndjson" or "csv", overriding the extension (optional).
+
+    Returns:
+        Generator of row dicts.
+    """
+    format = row_format(path, format)
+    with open(path, "r", newline="", encoding="utf-8") as file:
+        if format == "csv":
+            yield from csv.DictReader(file)
+        else:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_rows(path, rows, format=None, columns=CSV_COLUMNS):
+    """
+    Streams rows into an NDJSON or CSV file, one at a time.
+
+    Parameters:
+        - path (str): The file to write.
+        - rows (iterable): Row dicts as read by read_rows.
+        - format (str): "ndjson" or "csv", overriding the extension (optional).
+        - columns (tuple): The CSV columns, in order (optional).
+
+    Returns:
+        int: The number of rows written.
+    """
+    format = row_format(path, format)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        if format == "csv":
+            writer = csv.DictWriter(file, columns)
+            writer.writeheader()
+        for row in rows:
+            if format == "csv":
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(row) + "\n")
+            count += 1
+    return count
+
+
+def open_storage(data_file, journal=False):
+    """
+    Picks a storage backend for a data file based on its extension.
+
+    Parameters:
+        - data_file (str): The data file; .db, .sqlite and .sqlite3 files use SQLite, .habits files
+          binary snapshots, anything else JSON.
+        - journal (bool): Use journal mode for JSON and binary data files (optional).
+
+    Returns:
+        The storage backend.
+    """
+    if data_file.endswith(SQLITE_EXTENSIONS):
+        return SqliteStorage(data_file)
+    if data_file.endswith(BINARY_EXTENSIONS):
+        return BinaryStorage(data_file, journal=journal)
+    return JsonStorage(data_file, journal=journal)
+
+
+def file_state(path):
+    """
+    Identifies the current version of a file cheaply, to notice when it was replaced or changed.
+
+    Parameters:
+        - path (str): The file.
+
+    Returns:
+        tuple: The inode, size and modification time, or None if the file doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class FileLock:
+    def __init__(self, path):
+        """
+        Initializes a FileLock, an advisory lock on a lock file that serializes access to a data
+        file across threads and processes.
+
+        The lock is reentrant within a thread. Data files are replaced by renaming, so the lock
+        is taken on a separate file that stays in place.
+
+        Parameters:
+            - path (str): The lock file, created if it doesn't exist.
+        """
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self):
+        """
+        Waits until no other thread or process holds the lock, and takes it.
+        """
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                else:
+                    self._file.seek(0)
+                    while True:
+                        try:
+                            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:  # Gave up after retrying for 10 seconds
+                            pass
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        """
+        Releases the lock taken by acquire.
+        """
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                if fcntl is not None:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._file.seek(0)
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+    def close(self):
+        """
+        Closes the lock file.
+        """
+        with self._thread_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class JsonStorage:
+    # Whether older completions can be moved to a HistoryArchive, see HabitTracker's hot_days
+    tiered = True
+
+    def __init__(self, data_file, journal=False):
+        """
+        Initializes a JsonStorage instance, which keeps all habits in one JSON data file.
+
+        Parameters:
+            - data_file (str): The filename for storing habit data in JSON format.
+            - journal (bool): Append mutations to a journal file instead of rewriting
+              the whole data file on every change (optional).
+        """
+        self.data_file = data_file
+        self.journal_file = data_file + ".journal"
+        self.incremental = journal
+        self.metrics = None  # Set by HabitTracker.enable_metrics to count bytes read and written
+        self.generation = 0  # Generation of the data file as last read or written by this process
+        self._data_state = None  # file_state of the data file as last read or written
+        self._journal_offset = 0  # Bytes of the journal read or written so far
+        self._lock = FileLock(data_file + ".lock")
+        self._archive = None  # HistoryArchive of older completions, opened on first use
+
+    def archive(self):
+        """
+        Returns the archive that older completions are moved to, next to the data file.
+
+        Returns:
+            HistoryArchive: The archive.
+        """
+        if self._archive is None:
+            self._archive = HistoryArchive(self.data_file + ".archive")
+        return self._archive
+
+    def lock(self):
+        """
+        Returns the lock that serializes reading and writing the data file and its journal
+        across threads and processes.
+
+        Returns:
+            FileLock: The lock, to be used as a context manager.
+        """
+        return self._lock
+
+    def changes(self):
+        """
+        Checks for changes other processes made since the data file and journal were last read
+        or written by this one. Must be called holding the lock.
+
+        Returns:
+            None if there are none, the new journal records (which are then considered read), or
+            RELOAD if the data file was rewritten and has to be loaded again.
+        """
+        state = file_state(self.data_file)
+        if state != self._data_state:
+            if self._read_generation() != self.generation:
+                return RELOAD
+            self._data_state = state
+        try:
+            size = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            size = 0
+        if size == self._journal_offset:
+            return None
+        if size < self._journal_offset:
+            return RELOAD
+        return list(self._read_journal())
+
+    def _read_generation(self):
+        """
+        Reads the generation of the data file without parsing all of it.
+
+        Returns:
+            int: The generation, 0 for files written before generations were kept or missing files.
+        """
+        try:
+            with open(self.data_file, "rb") as file:
+                match = GENERATION_PATTERN.search(file.read(64))
+        except FileNotFoundError:
+            return 0
+        return int(match.group(1)) if match else 0
+
+    def load(self):
+        """
+        Loads habits from the data file.
+
+        Returns:
+            List of Habit records. Habits upgraded from version 1 files have their streaks set to None.
+        """
+        if not os.path.exists(self.data_file):
+            self.generation, self._data_state = 0, None
+            return []
+        with open(self.data_file, "r") as file:
+            data = json.load(file)
+            state = os.fstat(file.fileno())
+            if self.metrics is not None:
+                self.metrics.add_bytes("JsonStorage.load", read=file.tell())
+        self._data_state = state.st_ino, state.st_size, state.st_mtime_ns
+        # Version 1 files are a bare list of habits with formatted completion strings
+        if isinstance(data, list):
+            self.generation = 0
+            return [_upgrade_habit(habit) for habit in data]
+        self.generation = data.get("generation", 0)
+        # Version 2 files store the creation time formatted, version 3 files as an epoch timestamp
+        habits = []
+        for habit in data["habits"]:
+            history = unpack_timestamps(habit["completed_at"])
+            if "archived" in habit:
+                # The older completions are in archive segments
+                history = TieredHistory(self.archive(), [tuple(segment) for segment in habit["archived"]], history)
+            habits.append(Habit(habit["task"], habit["periodicity"], habit["created_at"], history,
+                                habit.get("streak"), habit.get("longest_streak")))
+        return habits
+
+    def replay(self):
+        """
+        Yields the records of the journal file, to be applied on top of the loaded habits.
+
+        A torn final line (e.g. from a crash mid-append) is ignored and cut off. Records written
+        before completion history was kept are converted to the current record shapes.
+        """
+        self._journal_offset = 0
+        return self._read_journal()
+
+    def _read_journal(self):
+        """
+        Yields the journal records after the part already read, and moves past them.
+        """
+        if not os.path.exists(self.journal_file):
+            return
+        if self.metrics is not None:
+            self.metrics.add_bytes(f"{type(self).__name__}.replay",
+                                   read=os.path.getsize(self.journal_file) - self._journal_offset)
+        with open(self.journal_file, "rb") as file:
+            file.seek(self._journal_offset)
+            for line in file:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except json.JSONDecodeError:
+                    record = None
+                if record is None:
+                    # Cut off the torn tail, or the next append would be glued onto it and lost too
+                    file.close()
+                    os.truncate(self.journal_file, self._journal_offset)
+                    return
+                self._journal_offset += len(line)
+                if record["op"] == "create" and "habit" in record:
+                    habit = _upgrade_habit(record["habit"])
+                    yield {"op": "create", "task": habit.task, "periodicity": str(habit.periodicity),
+                           "created_at": habit.created_at}
+                    for timestamp in habit.completed_at:
+                        yield {"op": "complete", "task": habit.task, "ts": timestamp}
+                elif record["op"] == "complete" and "ts" not in record:
+                    yield {"op": "complete", "task": record["task"], "ts": to_timestamp(record["completed_at"])}
+                else:
+                    yield record
+
+    def save(self, tracker):
+        """
+        Writes all habits of a tracker to the data file.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker to save.
+        """
+        self.write(self.dump(tracker))
+
+    def dump(self, tracker):
+        """
+        Serializes all habits of a tracker into the contents of a data file.
+
+        Histories partly moved to this storage's archive keep only their recent completions in
+        the file, plus references to their archive segments.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker to serialize.
+
+        Returns:
+            str: The JSON document.
+        """
+        habits = []
+        for habit in tracker.habits.values():
+            history = habit.completed_at
+            tiered = type(history) is TieredHistory and history.archive is self._archive and history.segments
+            habits.append({
+                "task": habit.task,
+                "periodicity": str(habit.periodicity),
+                "created_at": habit.created_at,
+                "completed_at": pack_timestamps(history.recent if tiered else history),
+                "streak": habit.streak,
+                "longest_streak": habit.longest_streak
+            })
+            if tiered:
+                habits[-1]["archived"] = history.segments
+        # The generation goes first, so _read_generation finds it in the first bytes
+        return json.dumps({"version": DATA_FORMAT_VERSION, "generation": self.generation + 1, "habits": habits})
+
+    def write(self, data):
+        """
+        Atomically replaces the data file with a snapshot produced by dump.
+
+        The snapshot is written and fsynced to a temporary file and renamed into place, after
+        which the journal is cleared since all of its records are now part of the snapshot. It
+        carries the next generation, which tells other processes to reload. Must be called
+        holding the lock.
+
+        Parameters:
+            - data (str or bytes): The JSON document, or a binary snapshot.
+        """
+        temp_file = self.data_file + ".tmp"
+        with open(temp_file, "wb" if isinstance(data, bytes) else "w") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        if self.metrics is not None:
+            self.metrics.add_bytes(f"{type(self).__name__}.write", written=len(data))
+        os.replace(temp_file, self.data_file)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.generation += 1
+        self._data_state = file_state(self.data_file)
+        self._journal_offset = 0
+
+    def append(self, records, tracker):
+        """
+        Appends mutation records to the journal in a single write. Must be called holding the
+        lock, after catching up with changes().
+
+        Parameters:
+            - records (list): The mutation records.
+            - tracker (HabitTracker): The tracker the records were applied to.
+        """
+        text = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        with open(self.journal_file, "ab") as file:
+            file.write(text)
+            self._journal_offset = file.tell()
+        if self.metrics is not None:
+            self.metrics.add_bytes(f"{type(self).__name__}.append", written=len(text))
+
+    def update_habits(self, tracker, keys):
+        """
+        Stores recomputed streaks of habits; nothing to do, since snapshots include them and
+        journal replay recomputes them.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker holding the habits.
+            - keys (iterable): Lower-cased names of the habits.
+        """
+
+    def close(self):
+        """
+        Releases resources held by the storage.
+        """
+        if self._archive is not None:
+            self._archive.close()
+        self._lock.close()
+
+
+class LazyHistory:
+    __slots__ = ("_snapshot", "_offset", "_count", "_last", "_array")
+
+    def __init__(self, snapshot, offset, count, last):
+        """
+        Initializes a LazyHistory, which stands in for the completion history of a habit loaded
+        from a binary snapshot until the history is needed.
+
+        Its length and last completion are known from the habit table, so the tracker can compute
+        deadlines without reading it. Anything else pages the history in from the snapshot.
+
+        Parameters:
+            - snapshot (_Snapshot): The mapped snapshot file.
+            - offset (int): The file offset of the history.
+            - count (int): The number of completions.
+            - last (int): The last completion timestamp.
+        """
+        self._snapshot = snapshot
+        self._offset = offset
+        self._count = count
+        self._last = last
+        self._array = None
+
+    def load(self):
+        """
+        Pages the history in, if it hasn't been already.
+
+        Returns:
+            array: The completion timestamps as array('q').
+        """
+        history = self._array
+        if history is None:
+            with _history_lock:
+                history = self._array
+                if history is None:
+                    history = self._array = self._snapshot.read(self._offset, self._count)
+                    self._snapshot = None
+        return history
+
+    def copy(self):
+        """
+        Returns an independent copy of the history, which shares the mapped snapshot while the
+        history isn't paged in.
+
+        Returns:
+            LazyHistory or array: The copy.
+        """
+        with _history_lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return self._array[:]
+            history = LazyHistory(snapshot, self._offset, self._count, self._last)
+            if snapshot.histories is not None:
+                # Paged in too before the file is replaced on Windows, see BinaryStorage.write
+                snapshot.histories.append(history)
+            return history
+
+    def raw(self):
+        """
+        Returns the history as stored in the snapshot, without decoding it.
+
+        Returns:
+            bytes: The little-endian int64 timestamps, or None once the history has been paged in.
+        """
+        snapshot = self._snapshot
+        return snapshot.data[self._offset:self._offset + 8 * self._count] if snapshot is not None else None
+
+    def __len__(self):
+        return self._count if self._array is None else len(self._array)
+
+    def __getitem__(self, index):
+        if self._array is None and self._count and (index == -1 or index == self._count - 1):
+            return self._last
+        return self.load()[index]
+
+    def __setitem__(self, index, value):
+        self.load()[index] = value
+
+    def __delitem__(self, index):
+        del self.load()[index]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __eq__(self, other):
+        return self.load() == (other.load() if isinstance(other, LazyHistory) else other)
+
+    def __repr__(self):
+        return repr(self.load())
+
+    def __getattr__(self, name):
+        # append, insert, tobytes and the rest of the array interface
+        return getattr(self.load(), name)
+
+
+class _Snapshot:
+    def __init__(self, data, track=False):
+        """
+        Initializes a _Snapshot, which keeps a binary data file mapped while habits or histories
+        in it are still to be read. The map is closed once nothing refers to it.
+
+        Parameters:
+            - data (mmap): The mapped file.
+            - track (bool): Keep a list of the histories read from it, see BinaryStorage.write (optional).
+        """
+        self.data = data
+        self.histories = [] if track else None
+
+    def read(self, offset, count):
+        """
+        Reads a completion history.
+
+        Parameters:
+            - offset (int): The file offset of the history.
+            - count (int): The number of completions.
+
+        Returns:
+            array: The completion timestamps as array('q').
+        """
+        history = array("q")
+        history.frombytes(self.data[offset:offset + 8 * count])
+        if sys.byteorder == "big":
+            history.byteswap()
+        return history
+
+
+class _HabitTable:
+    def __init__(self, snapshot, count, rows_offset, names_offset, histories_offset, orders):
+        """
+        Initializes a _HabitTable, which reads habits straight from the habit table of a mapped
+        binary snapshot.
+
+        Version 3 snapshots find a habit by name through the name index in the file. Older ones
+        have no index, so one is built here, at the cost of reading every name.
+
+        Parameters:
+            - snapshot (_Snapshot): The mapped snapshot file.
+            - count (int): The number of rows.
+            - rows_offset (int): The file offset of the habit table.
+            - names_offset (int): The file offset of the names.
+            - histories_offset (int): The file offset of the histories.
+            - orders (tuple): The offsets of the name index, the deadline order and the
+              leaderboard order, or None for snapshots older than version 3.
+        """
+        self.snapshot = snapshot
+        self.data = snapshot.data
+        self.rows = range(count)  # The rows in creation order
+        self._row_count = count
+        self.rows_offset = rows_offset
+        self.names_offset = names_offset
+        self.histories_offset = histories_offset
+        self.indexed = orders is not None  # Whether the deadline and leaderboard orders are there
+        self._periodicities = {}
+        if orders is None:
+            self._row = BINARY_ROW_V2
+            self._name_offsets = array("Q")
+            self._keys = {}
+            position = names_offset
+            table = self.data[rows_offset:rows_offset + BINARY_ROW_V2.size * count]
+            for row, fields in enumerate(BINARY_ROW_V2.iter_unpack(table)):
+                self._name_offsets.append(position)
+                self._keys.setdefault(self.data[position:position + fields[0]].decode("utf-8").lower(), row)
+                position += fields[0] + fields[1]
+            self.rows = list(self._keys.values())  # Later rows of the same name are ignored, as by the tracker
+        else:
+            self._row = BINARY_ROW
+            self._name_offsets = self._keys = None
+            self._index_offset, self._deadlines_offset, self._leaders_offset = orders
+            self._slots = (self._deadlines_offset - self._index_offset) // 4
+            self.deadline_count = (self._leaders_offset - self._deadlines_offset) // 4
+
+    def _fields(self, row):
+        """
+        Reads the fields of a row.
+        """
+        return self._row.unpack_from(self.data, self.rows_offset + self._row.size * row)
+
+    def entries(self):
+        """
+        Yields (row, (name, periodicity as stored), row fields) of every habit, in creation order.
+        """
+        if len(self.rows) < self._row_count:
+            for row in self.rows:
+                fields = self._fields(row)
+                yield row, self._names(row, fields), fields
+            return
+        # Slicing bytes is much cheaper than slicing the map, so copy the names out once
+        names = self.data[self.names_offset:self.histories_offset]
+        start = self.names_offset
+        table = self.data[self.rows_offset:self.rows_offset + self._row.size * self._row_count]
+        for row, fields in enumerate(self._row.iter_unpack(table)):
+            offset = self._name_offset(row, fields) - start
+            end = offset + fields[0]
+            yield row, (names[offset:end].decode("utf-8"), names[end:end + fields[1]]), fields
+
+    def _name_offset(self, row, fields):
+        """
+        Returns the file offset of the name of the habit in a row.
+        """
+        return fields[8] if self._name_offsets is None else self._name_offsets[row]
+
+    def _names(self, row, fields):
+        """
+        Reads the name and the stored periodicity of the habit in a row.
+        """
+        offset = self._name_offset(row, fields)
+        end = offset + fields[0]
+        return self.data[offset:end].decode("utf-8"), self.data[end:end + fields[1]]
+
+    def name(self, row, fields=None):
+        """
+        Returns the name of the habit in a row.
+        """
+        fields = fields or self._fields(row)
+        offset = self._name_offset(row, fields)
+        return self.data[offset:offset + fields[0]].decode("utf-8")
+
+    def key(self, row, fields=None):
+        """
+        Returns the lower-cased name of the habit in a row.
+        """
+        return self.name(row, fields).lower()
+
+    def find(self, key):
+        """
+        Finds the row of a habit.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+
+        Returns:
+            int: The row, or None if there is no such habit.
+        """
+        if self._keys is not None:
+            return self._keys.get(key)
+        mask = self._slots - 1
+        slot = zlib.crc32(key.encode("utf-8")) & mask
+        while True:
+            row = BINARY_SLOT.unpack_from(self.data, self._index_offset + 4 * slot)[0] - 1
+            if row < 0 or self.key(row) == key:
+                return row if row >= 0 else None
+            slot = (slot + 1) & mask
+
+    def habit(self, row, fields=None, names=None):
+        """
+        Builds the habit in a row; its history stays in the snapshot until it is needed.
+
+        Parameters:
+            - row (int): The row.
+            - fields (tuple): The fields of the row, if already read (optional).
+            - names (tuple): The name and the stored periodicity, if already read (optional).
+
+        Returns:
+            Habit: The habit.
+        """
+        fields = fields or self._fields(row)
+        task, periodicity = names or self._names(row, fields)
+        if periodicity not in self._periodicities:
+            self._periodicities[periodicity] = Periodicity.parse(periodicity.decode("utf-8"))
+        history = LazyHistory(self.snapshot, fields[5], fields[6], fields[7])
+        if self.snapshot.histories is not None:
+            self.snapshot.histories.append(history)
+        return Habit(task, self._periodicities[periodicity], fields[2], history, fields[3], fields[4])
+
+    def stored(self, row):
+        """
+        Returns the longest streak and the deadline stored in a row.
+
+        Returns:
+            tuple: (longest streak, deadline or None).
+        """
+        fields = self._fields(row)
+        return fields[4], fields[9] or None
+
+    def expiry(self, position):
+        """
+        Returns the habit at a position of the deadline order.
+
+        Returns:
+            tuple: (deadline, lower-cased name), or None past the end.
+        """
+        if position >= self.deadline_count:
+            return None
+        row = BINARY_SLOT.unpack_from(self.data, self._deadlines_offset + 4 * position)[0]
+        fields = self._fields(row)
+        return fields[9], self.key(row, fields)
+
+    def leaders(self):
+        """
+        Yields (longest streak, lower-cased name) of every habit, longest first.
+        """
+        for position in range(len(self.rows)):
+            row = BINARY_SLOT.unpack_from(self.data, self._leaders_offset + 4 * position)[0]
+            fields = self._fields(row)
+            yield fields[4], self.key(row, fields)
+
+
+class LazyHabits(MutableMapping):
+    def __init__(self, table):
+        """
+        Initializes LazyHabits, the habits of a binary snapshot keyed by lower-cased name, in
+        creation order, which stands in for the tracker's dict of habits.
+
+        A habit is only built from its row the first time it is looked up or iterated over, so
+        opening a snapshot costs the same however many habits it holds. The tracker's deadline
+        queue and leaderboard read the habits nobody changed straight from the table, see
+        expiry and leaders. Changes are kept in memory: replaced habits keep their place, new
+        ones come after the table, in the order they were added.
+
+        Parameters:
+            - table (_HabitTable): The habit table.
+        """
+        self._table = table
+        self._loaded = {}  # Habits built from their row, or replaced since, by key
+        self._rows = {}  # Rows of the habits built so far, by key
+        self._deleted = set()  # Keys of rows deleted since, even if created again
+        self._added = {}  # Habits not in the table, or created again since, in creation order
+
+    @property
+    def indexed(self):
+        """
+        Whether the table has deadline and leaderboard orders, see expiry and leaders.
+        """
+        return self._table.indexed
+
+    def from_table(self, key):
+        """
+        Checks whether a habit of the table wasn't deleted since, so its row still describes it
+        unless the tracker changed it in memory.
+
+        Parameters:
+            - key (str): The lower-cased name of a habit of the table.
+
+        Returns:
+            bool: True if the habit is the one in the table.
+        """
+        return key not in self._deleted
+
+    def built(self, key):
+        """
+        Returns a habit of the table if it was built from its row or replaced since.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+
+        Returns:
+            Habit: The habit, or None if it is only in the table.
+        """
+        return self._loaded.get(key)
+
+    def stored(self, key):
+        """
+        Returns the longest streak and the deadline a habit of the table has in its row, which
+        differ from the habit's own once the tracker changed it.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+
+        Returns:
+            tuple: (longest streak, deadline or None), or None if the habit isn't in the table.
+        """
+        if key in self._deleted:
+            return None
+        row = self._rows.get(key)
+        if row is None:
+            row = self._table.find(key)
+        return self._table.stored(row) if row is not None else None
+
+    def expiry(self, position):
+        """
+        Returns the habit at a position of the deadline order of the table, see _HabitTable.expiry.
+        """
+        return self._table.expiry(position)
+
+    def leaders(self):
+        """
+        Yields (longest streak, lower-cased name) of the habits of the table not deleted since,
+        longest first.
+        """
+        for longest, key in self._table.leaders():
+            if key not in self._deleted:
+                yield longest, key
+
+    def loaded_items(self):
+        """
+        Returns the (key, habit) pairs of the habits built so far and of those added since.
+        """
+        return list(self._loaded.items()) + list(self._added.items())
+
+    def scan(self):
+        """
+        Yields the (key, habit) pairs like items(), without keeping the habits it builds; those
+        must not be changed.
+        """
+        table = self._table
+        for row, names, fields in table.entries():
+            key = names[0].lower()
+            if key not in self._deleted:
+                habit = self._loaded.get(key)
+                yield key, habit if habit is not None else table.habit(row, fields, names)
+        yield from list(self._added.items())
+
+    def detach(self):
+        """
+        Builds every habit and copies the table out of the mapped snapshot, which can then be
+        closed; the histories are still to be paged in by the caller.
+        """
+        for _ in self._items():
+            pass
+        table = self._table
+        table.data = table.data[:table.histories_offset]
+
+    def _load(self, key, row):
+        # Racing readers may both build the habit, but only the first one is kept
+        habit = self._loaded.setdefault(key, self._table.habit(row))
+        self._rows[key] = row
+        return habit
+
+    def _find(self, key):
+        """
+        Finds the row of a habit of the table that wasn't deleted since.
+        """
+        return None if key in self._deleted else self._table.find(key)
+
+    def __getitem__(self, key):
+        habit = self._added.get(key)
+        if habit is None:
+            habit = self._loaded.get(key)
+        if habit is not None:
+            return habit
+        row = self._find(key)
+        if row is None:
+            raise KeyError(key)
+        return self._load(key, row)
+
+    def __contains__(self, key):
+        return key in self._added or key in self._loaded or self._find(key) is not None
+
+    def __setitem__(self, key, habit):
+        if key in self._loaded or key not in self._added and self._find(key) is not None:
+            self._loaded[key] = habit
+        else:
+            self._added[key] = habit
+
+    def __delitem__(self, key):
+        if key in self._added:
+            del self._added[key]
+        elif key in self._loaded or self._find(key) is not None:
+            self._loaded.pop(key, None)
+            self._deleted.add(key)
+        else:
+            raise KeyError(key)
+
+    def __len__(self):
+        return len(self._table.rows) - len(self._deleted) + len(self._added)
+
+    def _items(self):
+        loaded, rows, deleted, build = self._loaded, self._rows, self._deleted, self._table.habit
+        for row, names, fields in self._table.entries():
+            key = names[0].lower()
+            if key not in deleted:
+                habit = loaded.get(key)
+                if habit is None:
+                    habit = loaded.setdefault(key, build(row, fields, names))
+                    rows[key] = row
+                yield key, habit
+        yield from list(self._added.items())
+
+    def __iter__(self):
+        for _, (task, _), _ in self._table.entries():
+            key = task.lower()
+            if key not in self._deleted:
+                yield key
+        yield from list(self._added)
+
+    def __reversed__(self):
+        yield from reversed(list(self._added))
+        table = self._table
+        for row in reversed(table.rows):
+            key = table.key(row)
+            if key not in self._deleted:
+                yield key
+
+    def items(self):
+        return _LazyItems(self)
+
+    def values(self):
+        return _LazyValues(self)
+
+
+class _LazyItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._items()
+
+
+class _LazyValues(ValuesView):
+    def __iter__(self):
+        return (habit for _, habit in self._mapping._items())
+
+
+class BinaryStorage(JsonStorage):
+    tiered = False  # Histories are paged in from the snapshot instead
+
+    def __init__(self, data_file, journal=False):
+        """
+        Initializes a BinaryStorage instance, which keeps all habits in a memory-mapped binary snapshot.
+
+        Opening the tracker only reads the fixed-width habit table and the names; completion
+        histories are paged in the first time something needs them. Journal mode works as for JSON.
+
+        Parameters:
+            - data_file (str): The filename of the binary snapshot.
+            - journal (bool): Append mutations to a journal file instead of rewriting
+              the whole data file on every change (optional).
+        """
+        super().__init__(data_file, journal=journal)
+        self._snapshots = []  # Snapshots mapped on Windows, which must be released before replacing the file
+
+    def load(self):
+        """
+        Opens the habit table of the data file, without reading any habit.
+
+        Returns:
+            LazyHabits: The habits, built from the table as they are used.
+        """
+        if not os.path.exists(self.data_file) or os.path.getsize(self.data_file) == 0:
+            self.generation, self._data_state = 0, file_state(self.data_file)
+            return []
+        with open(self.data_file, "rb") as file:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            state = os.fstat(file.fileno())
+        header = self._read_header(data)
+        if header is None:
+            data.close()
+            raise ValueError(f"{self.data_file} is not a habit snapshot.")
+        count, rows_offset, names_offset, histories_offset, self.generation, orders = header
+        self._data_state = state.st_ino, state.st_size, state.st_mtime_ns
+        if self.metrics is not None:
+            self.metrics.add_bytes("BinaryStorage.load", read=rows_offset)
+
+        snapshot = _Snapshot(data, track=os.name == "nt")
+        habits = LazyHabits(_HabitTable(snapshot, count, rows_offset, names_offset, histories_offset, orders))
+        if os.name == "nt":
+            self._snapshots.append((snapshot, habits))
+        return habits
+
+    @staticmethod
+    def _read_header(data):
+        """
+        Reads the header of a binary snapshot.
+
+        Parameters:
+            - data (bytes or mmap): The start of the snapshot, or all of it.
+
+        Returns:
+            tuple: The habit count, the offsets of the habit table, the names and the histories,
+            the generation, and the offsets of the name index, the deadline order and the
+            leaderboard order (None before version 3); None if the data is not a habit snapshot.
+        """
+        if len(data) < BINARY_HEADER_V1.size:
+            return None
+        magic, version, count, names_offset, histories_offset = BINARY_HEADER_V1.unpack_from(data)
+        if magic != BINARY_MAGIC or version not in (1, 2, BINARY_FORMAT_VERSION):
+            return None
+        if version == 1:
+            return count, BINARY_HEADER_V1.size, names_offset, histories_offset, 0, None
+        if version == 2:
+            generation = BINARY_HEADER_V2.unpack_from(data)[5]
+            return count, BINARY_HEADER_V2.size, names_offset, histories_offset, generation, None
+        generation, *orders = BINARY_HEADER.unpack_from(data)[5:]
+        return count, BINARY_HEADER.size, names_offset, histories_offset, generation, tuple(orders)
+
+    def _read_generation(self):
+        """
+        Reads the generation from the header of the data file.
+
+        Returns:
+            int: The generation, 0 for version 1 snapshots or missing files.
+        """
+        try:
+            with open(self.data_file, "rb") as file:
+                header = self._read_header(file.read(BINARY_HEADER.size))
+        except FileNotFoundError:
+            return 0
+        return header[4] if header is not None else 0
+
+    def dump(self, tracker):
+        """
+        Serializes all habits of a tracker into a binary snapshot.
+
+        Histories that were never paged in are copied from the current snapshot without decoding
+        them. The name index and the deadline and leaderboard orders are written along, so
+        opening the snapshot needs no pass over the habits.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker to serialize.
+
+        Returns:
+            bytes: The snapshot.
+        """
+        habits = tracker.habits
+        items = list(habits.scan() if isinstance(habits, LazyHabits) else habits.items())
+        count = len(items)
+        names = []
+        histories = []
+        for key, habit in items:
+            names.append((habit.task.encode("utf-8"), str(habit.periodicity).encode("utf-8")))
+            history = habit.completed_at
+            raw = history.raw() if isinstance(history, LazyHistory) else None
+            if raw is None:
+                history = array("q", history)
+                if sys.byteorder == "big":
+                    history.byteswap()
+                raw = history.tobytes()
+            histories.append(raw)
+
+        slots = array("I", bytes(4 * (1 << (2 * count).bit_length())))
+        mask = len(slots) - 1
+        for row, (key, habit) in enumerate(items):
+            slot = zlib.crc32(key.encode("utf-8")) & mask
+            while slots[slot]:
+                slot = (slot + 1) & mask
+            slots[slot] = row + 1
+        deadlines = [tracker._deadline(habit) for key, habit in items]
+        deadline_order = array("I", (row for _, _, row in sorted(
+            (deadline, key, row) for row, ((key, _), deadline) in enumerate(zip(items, deadlines))
+            if deadline is not None)))
+        leader_order = array("I", sorted(range(count), key=lambda row: -items[row][1].longest_streak))
+        orders = [slots, deadline_order, leader_order]
+        if sys.byteorder == "big":
+            for order in orders:
+                order.byteswap()
+
+        index_offset = BINARY_HEADER.size + BINARY_ROW.size * count
+        deadlines_offset = index_offset + 4 * len(slots)
+        leaders_offset = deadlines_offset + 4 * len(deadline_order)
+        names_offset = leaders_offset + 4 * count
+        offset = names_offset + sum(len(task) + len(periodicity) for task, periodicity in names)
+        header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_FORMAT_VERSION, count, names_offset, offset,
+                                    self.generation + 1, index_offset, deadlines_offset, leaders_offset)
+        rows = []
+        name_offset = names_offset
+        for (key, habit), (task, periodicity), raw, deadline in zip(items, names, histories, deadlines):
+            history = habit.completed_at
+            rows.append(BINARY_ROW.pack(len(task), len(periodicity), habit.created_at, habit.streak,
+                                        habit.longest_streak, offset, len(raw) // 8, history[-1] if history else 0,
+                                        name_offset, deadline or 0))
+            offset += len(raw)
+            name_offset += len(task) + len(periodicity)
+        names = b"".join(part for pair in names for part in pair)
+        return b"".join([header] + rows + [order.tobytes() for order in orders] + [names] + histories)
+
+    def write(self, data):
+        """
+        Atomically replaces the data file with a snapshot produced by dump.
+
+        On Windows a mapped file can't be replaced, so habits and histories still in the old
+        snapshot are read in first.
+
+        Parameters:
+            - data (bytes): The snapshot.
+        """
+        for snapshot, habits in self._snapshots:
+            habits.detach()
+            for history in snapshot.histories:
+                history.load()
+            snapshot.data.close()
+        self._snapshots = []
+        super().write(data)
+
+
+class SqliteStorage:
+    indexed = True  # The tracker's queries go to the indexed SQL queries below
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS habits (
+            id INTEGER PRIMARY KEY,
+            task_key TEXT NOT NULL,
+            task TEXT NOT NULL,
+            periodicity TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            streak INTEGER NOT NULL DEFAULT 0,
+            longest_streak INTEGER NOT NULL DEFAULT 0,
+            broken_at INTEGER
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS habits_task_key ON habits (task_key);
+        CREATE INDEX IF NOT EXISTS habits_periodicity ON habits (periodicity);
+        CREATE INDEX IF NOT EXISTS habits_broken_at ON habits (broken_at);
+        CREATE INDEX IF NOT EXISTS habits_longest_streak ON habits (longest_streak DESC, id);
+        CREATE TABLE IF NOT EXISTS completions (
+            habit_id INTEGER NOT NULL REFERENCES habits (id) ON DELETE CASCADE,
+            ts INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS completions_habit_ts ON completions (habit_id, ts);
+    """
+    HABIT_COLUMNS = "id, task, periodicity, created_at, streak, longest_streak"
+    INSERT_HABIT = ("INSERT INTO habits (task_key, task, periodicity, created_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (task_key) DO NOTHING")
+    UPDATE_HABIT = "UPDATE habits SET streak = ?, longest_streak = ?, broken_at = ? WHERE task_key = ?"
+    DELETE_HABIT = "DELETE FROM habits WHERE task_key = ?"
+    INSERT_COMPLETION = "INSERT INTO completions (habit_id, ts) SELECT id, ? FROM habits WHERE task_key = ?"
+
+    def __init__(self, data_file):
+        """
+        Initializes a SqliteStorage instance, which keeps habits and completions in indexed SQLite tables.
+
+        Every mutation is written as a few row inserts or updates, so the cost of a write does not
+        depend on how many habits there are.
+
+        Parameters:
+            - data_file (str): The filename of the SQLite database.
+        """
+        self.data_file = data_file
+        self.incremental = True
+        self.metrics = None
+        self.connection = sqlite3.connect(data_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(self.SCHEMA)
+        self._data_version = None  # PRAGMA data_version when the habits were last loaded
+        self._lock = FileLock(data_file + ".lock")
+
+    def lock(self):
+        """
+        Returns the lock that serializes catching up with other processes and writing.
+
+        SQLite keeps each transaction atomic by itself; the lock makes sure the streaks written
+        with a transaction were computed from everything other processes committed before it.
+
+        Returns:
+            FileLock: The lock, to be used as a context manager.
+        """
+        return self._lock
+
+    def changes(self):
+        """
+        Checks whether another process committed to the database since the habits were last
+        loaded. Must be called holding the lock.
+
+        Returns:
+            None if nothing changed, otherwise RELOAD.
+        """
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        return None if data_version == self._data_version else RELOAD
+
+    def load(self):
+        """
+        Loads all habits with their completion histories.
+
+        Returns:
+            List of habits in creation order.
+        """
+        with self.connection:
+            # One read transaction, so the habits and completions are consistent
+            self.connection.execute("BEGIN")
+            habits = self._fetch_habits()
+            self._data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        return list(habits.values())
+
+    def replay(self):
+        """
+        Yields nothing, since every mutation is applied to the tables directly.
+        """
+        return iter(())
+
+    def save(self, tracker):
+        """
+        Replaces the contents of the database with all habits of a tracker.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker to save.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM completions")
+            self.connection.execute("DELETE FROM habits")
+            self.connection.executemany(self.INSERT_HABIT, (
+                (key, habit.task, str(habit.periodicity), format_timestamp(habit.created_at))
+                for key, habit in tracker.habits.items()))
+            self.connection.executemany(self.INSERT_COMPLETION, (
+                (timestamp, key) for key, habit in tracker.habits.items() for timestamp in habit.completed_at))
+            self._update_rows(tracker, tracker.habits)
+
+    def append(self, records, tracker):
+        """
+        Applies mutation records to the tables in a single transaction.
+
+        Parameters:
+            - records (list): The mutation records.
+            - tracker (HabitTracker): The tracker the records were applied to, used for the
+              resulting streaks and deadlines.
+        """
+        touched = set()
+        with self.connection:
+            for record in records:
+                op = record["op"]
+                if op == "create":
+                    key = record["task"].lower()
+                    self.connection.execute(self.INSERT_HABIT, (
+                        key, record["task"], record["periodicity"], format_timestamp(to_timestamp(record["created_at"]))))
+                elif op == "delete":
+                    key = record["task"].lower()
+                    self.connection.execute(self.DELETE_HABIT, (key,))
+                elif op == "complete":
+                    key = record["task"].lower()
+                    self.connection.execute(self.INSERT_COMPLETION, (record["ts"], key))
+                elif op == "reset":
+                    self.connection.execute("DELETE FROM completions")
+                    self.connection.execute("DELETE FROM habits")
+                    continue
+                touched.add(key)
+            self._update_rows(tracker, touched)
+
+    def update_habits(self, tracker, keys):
+        """
+        Stores recomputed streaks of habits, e.g. after their history was backfilled.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker holding the habits.
+            - keys (iterable): Lower-cased names of the habits.
+        """
+        with self.connection:
+            self._update_rows(tracker, keys)
+
+    def _update_rows(self, tracker, keys):
+        """
+        Copies the streaks and deadlines of habits from a tracker into their rows.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker holding the habits.
+            - keys (iterable): Lower-cased names of the habits to update.
+        """
+        rows = []
+        for key in keys:
+            habit = tracker.habits.get(key)
+            if habit is not None:
+                rows.append((habit.streak, habit.longest_streak, tracker._deadline(habit), key))
+        self.connection.executemany(self.UPDATE_HABIT, rows)
+
+    def _fetch_habits(self):
+        """
+        Fetches all habits with their completion histories.
+
+        Returns:
+            dict: Habit records keyed by row id, in creation order.
+        """
+        habits = {}
+        for row in self.connection.execute(f"SELECT {self.HABIT_COLUMNS} FROM habits ORDER BY id"):
+            habit_id, task, periodicity, created_at, streak, longest_streak = row
+            habits[habit_id] = Habit(task, periodicity, created_at, array("q"), streak, longest_streak)
+        for habit_id, timestamp in self.connection.execute("SELECT habit_id, ts FROM completions ORDER BY habit_id, ts"):
+            habits[habit_id].completed_at.append(timestamp)
+        return habits
+
+    def get_habits_by_periodicity(self, periodicity):
+        """
+        Finds habits based on their periodicity through the periodicity index.
+
+        Parameters:
+            - periodicity (str): The frequency of habits to find ("daily" or "weekly").
+
+        Returns:
+            List of the lower-cased names of the habits, in creation order.
+        """
+        return [key for key, in self.connection.execute(
+            "SELECT task_key FROM habits WHERE periodicity = ? ORDER BY id", (periodicity,))]
+
+    def get_broken_habits(self, now=None):
+        """
+        Finds habits whose deadline has passed through the deadline index.
+
+        Parameters:
+            - now (str, datetime or int): The time to check against, defaults to now (optional).
+
+        Returns:
+            List of the lower-cased names of the broken habits, in the order their deadlines passed.
+        """
+        now = to_timestamp(now or datetime.now())
+        return [key for key, in self.connection.execute(
+            "SELECT task_key FROM habits WHERE broken_at <= ? ORDER BY broken_at, task_key", (now,))]
+
+    def get_top_streaks(self, n=10):
+        """
+        Finds the habits with the longest run streaks through the streak index.
+
+        Parameters:
+            - n (int): The number of habits to return.
+
+        Returns:
+            List of (lower-cased name, longest streak) tuples, longest first.
+        """
+        return list(self.connection.execute(
+            "SELECT task_key, longest_streak FROM habits ORDER BY longest_streak DESC, id LIMIT ?", (n,)))
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
+        self._lock.close()
+
+
+class WriteBehind:
+    def __init__(self, tracker, flush_delay=1.0, flush_threshold=1000):
+        """
+        Initializes a WriteBehind instance, which persists a tracker's mutations from a background thread.
+
+        Mutations arriving in a burst are coalesced into a single write (group commit): one journal
+        append or SQLite transaction, or one snapshot of the data file. At most flush_delay seconds
+        or flush_threshold mutations are lost if the process dies.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker to persist.
+            - flush_delay (float): Seconds to wait for more mutations before writing (optional).
+            - flush_threshold (int): Number of pending mutations that triggers a write straight away (optional).
+        """
+        self.tracker = tracker
+        self.flush_delay = flush_delay
+        self.flush_threshold = flush_threshold
+        self._condition = threading.Condition()
+        self._records = []
+        self._submitted = 0  # Mutations submitted so far
+        self._written = 0  # Mutations persisted so far
+        self._dirty_since = None
+        self._flush_requested = False
+        self._saves_requested = 0  # Full saves requested through flush(save=True)
+        self._saves_done = 0
+        self._closed = False
+        self._error = None
+        self._taken = (0, 0)  # Mutations and full saves covered by the write in progress
+        self._thread = threading.Thread(target=self._run, name="habit-write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, records):
+        """
+        Queues mutation records that have already been applied in memory.
+
+        Parameters:
+            - records (list): The mutation records.
+        """
+        with self._condition:
+            self._records.extend(records)
+            self._submitted += len(records)
+            if self._dirty_since is None:
+                # Wake the idle writer, so it starts counting down flush_delay
+                self._dirty_since = time.monotonic()
+                self._condition.notify_all()
+            elif self._submitted - self._written >= self.flush_threshold:
+                self._condition.notify_all()
+
+    def pending(self):
+        """
+        Returns the queued mutation records, which are applied in memory but not written yet.
+
+        Returns:
+            list: A copy of the records.
+        """
+        with self._condition:
+            return list(self._records)
+
+    def idle(self):
+        """
+        Checks whether every queued mutation was written. Must be called holding the tracker's
+        lock, so a write in progress has finished with the storage.
+
+        Returns:
+            bool: True if nothing is queued.
+        """
+        with self._condition:
+            return not self._records
+
+    def flush(self, save=False):
+        """
+        Writes all queued mutations and waits until they are persisted.
+
+        Must not be called while holding the tracker's lock, e.g. inside a batch.
+
+        Parameters:
+            - save (bool): Also write a full save of the tracker, e.g. to compact the journal (optional).
+        """
+        with self._condition:
+            target = self._submitted
+            self._flush_requested = True
+            if save:
+                self._saves_requested += 1
+            saves = self._saves_requested
+            self._condition.notify_all()
+            while (self._written < target or self._saves_done < saves) and self._error is None \
+                    and self._thread.is_alive():
+                self._condition.wait()
+            self._raise_error()
+
+    def close(self):
+        """
+        Flushes all queued mutations and stops the background thread.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        """
+        Re-raises the error of a failed background write, if any.
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        """
+        Waits for mutations and writes them in groups until closed.
+        """
+        while True:
+            with self._condition:
+                while True:
+                    pending = self._submitted - self._written
+                    if self._saves_done < self._saves_requested or pending and (
+                            self._closed or self._flush_requested or pending >= self.flush_threshold
+                            or time.monotonic() - self._dirty_since >= self.flush_delay):
+                        break
+                    if self._closed:
+                        return
+                    timeout = None if not pending else self.flush_delay - (time.monotonic() - self._dirty_since)
+                    self._condition.wait(timeout)
+                self._taken = (self._submitted, self._saves_requested)
+                self._dirty_since = None
+                self._flush_requested = False
+            try:
+                self._write()
+            except Exception as error:
+                with self._condition:
+                    self._error = error
+            with self._condition:
+                self._written, self._saves_done = self._taken
+                self._condition.notify_all()
+
+    def _take(self):
+        """
+        Takes the queued mutation records for writing; called holding the tracker's lock, so no
+        mutation is applied in memory without being either queued or taken.
+
+        Returns:
+            tuple: The records, and whether a full save was requested.
+        """
+        with self._condition:
+            records, self._records = self._records, []
+            self._taken = (self._submitted, self._saves_requested)
+            return records, self._saves_requested > self._saves_done
+
+    def _write(self):
+        """
+        Persists a group of mutations.
+
+        All writes happen on the background thread, so they can't overtake each other. Changes
+        of other processes are caught up with and snapshots are serialized while holding the
+        tracker's lock, so they are consistent; the data file lock is held until the snapshot is
+        on disk, after the tracker's lock is released. The locks are taken in the same order as
+        everywhere else, the tracker's lock first.
+        """
+        tracker = self.tracker
+        storage = tracker.storage
+        file_lock = storage.lock()
+        data = None
+        with tracker._lock:
+            file_lock.acquire()
+            try:
+                records, save = self._take()
+                tracker._catch_up(records)
+                if save or not storage.incremental:
+                    tracker._archive_due()
+                if save:
+                    storage.save(tracker)
+                elif storage.incremental:
+                    storage.append(records, tracker)
+                else:
+                    data = storage.dump(tracker)
+            except BaseException:
+                file_lock.release()
+                raise
+        try:
+            if data is not None:
+                storage.write(data)
+        finally:
+            file_lock.release()
+
+
+def convert_data_file(source_file, target_file):
+    """
+    Converts a data file, including its journal, into another format chosen by the target's
+    extension (see open_storage), e.g. JSON into a binary snapshot or a SQLite database.
+
+    Parameters:
+        - source_file (str): The data file to read.
+        - target_file (str): The data file to write; existing contents are replaced.
+
+    Returns:
+        int: The number of habits converted.
+    """
+    from habit_tracker import HabitTracker
+
+    tracker = HabitTracker(data_file=source_file)
+    storage = open_storage(target_file)
+    try:
+        with storage.lock():
+            storage.save(tracker)
+    finally:
+        storage.close()
+        tracker.close()
+    return len(tracker.habits)
+
+
+def migrate_json_to_sqlite(json_file, sqlite_file):
+    """
+    Converts a JSON data file, including its journal, into a SQLite database.
+
+    Parameters:
+        - json_file (str): The JSON data file.
+        - sqlite_file (str): The SQLite database to write; existing contents are replaced.
+
+    Returns:
+        int: The number of habits migrated.
+    """
+    return convert_data_file(json_file, sqlite_file)
+
+
+def main(argv=None):
+    """
+    Runs the storage command line tool.
+
+    Parameters:
+        - argv (list): Command line arguments, defaults to sys.argv (optional).
+    """
+    parser = argparse.ArgumentParser(description="Habit tracker storage tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Convert a JSON data file into a SQLite database.")
+    migrate.add_argument("json_file")
+    migrate.add_argument("sqlite_file")
+    convert = commands.add_parser("convert", help="Convert a data file into the format of the target's "
+                                                  "extension (.json, .habits, .db).")
+    convert.add_argument("source_file")
+    convert.add_argument("target_file")
+    import_rows = commands.add_parser("import", help="Import habits and completions from an NDJSON or CSV file.")
+    import_rows.add_argument("data_file")
+    import_rows.add_argument("rows_file")
+    import_rows.add_argument("--chunk-size", type=int, default=10000, help="Rows applied and persisted together.")
+    import_rows.add_argument("--skip-invalid", action="store_true", help="Count invalid rows instead of stopping.")
+    export_rows = commands.add_parser("export", help="Export habits and completions to an NDJSON or CSV file.")
+    export_rows.add_argument("data_file")
+    export_rows.add_argument("rows_file")
+    rollups = commands.add_parser("rollups", help="Rebuild the completion rollups and write them to an NDJSON or "
+                                                  "CSV file.")
+    rollups.add_argument("data_file")
+    rollups.add_argument("rows_file")
+    rollups.add_argument("--granularity", choices=("day", "week", "month"), default="week")
+    rollups.add_argument("--start", help="A \"%%Y-%%m-%%d %%H:%%M:%%S\" time in the first bucket.")
+    rollups.add_argument("--end", help="A \"%%Y-%%m-%%d %%H:%%M:%%S\" time in the last bucket.")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        count = migrate_json_to_sqlite(args.json_file, args.sqlite_file)
+        print(f"Migrated {count} habits from {args.json_file} to {args.sqlite_file}.")
+    elif args.command == "convert":
+        count = convert_data_file(args.source_file, args.target_file)
+        print(f"Converted {count} habits from {args.source_file} to {args.target_file}.")
+    elif args.command in ("import", "export"):
+        from habit_tracker import HabitTracker
+
+        # Journal mode, so that each imported chunk is appended rather than rewriting the data file
+        tracker = HabitTracker(data_file=args.data_file, journal=True)
+        try:
+            if args.command == "import":
+                counts = tracker.import_habits(args.rows_file, chunk_size=args.chunk_size,
+                                               skip_invalid=args.skip_invalid)
+                if isinstance(tracker.storage, JsonStorage):
+                    tracker.compact()
+                print(f"Imported {counts['habits']} habits and {counts['completions']} completions into "
+                      f"{args.data_file}, skipped {counts['duplicates']} duplicates and {counts['invalid']} invalid rows.")
+            else:
+                count = tracker.export_habits(args.rows_file)
+                print(f"Exported {count} rows from {args.data_file} to {args.rows_file}.")
+        finally:
+            tracker.close()
+    elif args.command == "rollups":
+        from habit_tracker import Analytics, HabitTracker
+
+        tracker = HabitTracker(data_file=args.data_file)
+        try:
+            analytics = Analytics(tracker)
+            habits = analytics.rebuild_rollups()
+            count = analytics.export_rollups(args.rows_file, args.granularity, args.start, args.end)
+            print(f"Rebuilt the rollups of {habits} habits and wrote {count} rows to {args.rows_file}.")
+        finally:
+            tracker.close()
+
+
+if __name__ == "__main__":
+    main()
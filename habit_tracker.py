@@ -1,41 +1,882 @@
-import json
+import bisect
+import gc
+import heapq
 import os
-from datetime import datetime, date
+import threading
+from array import array
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, date, time
+from itertools import islice
+
+from habit_archive import ARCHIVE_MIN_COMPLETIONS, TieredHistory
+from habit_index import HabitIndex
+from habit_metrics import Metrics, instrument
+from habit_model import PERIODICITIES, Habit, format_timestamp, to_timestamp
+from habit_parallel import PARTITIONS_PER_WORKER, SharedHistories, create_pool, parallel_stats, summarize_stats
+from habit_replay import ReplayEngine
+from habit_rollup import GRANULARITIES, ROLLUP_COLUMNS, Rollups, day_number
+from habit_snapshot import SnapshotHabits
+from habit_storage import RELOAD, LazyHabits, WriteBehind, open_storage, parse_time, read_rows, write_rows
+from habit_vector import SECONDS_PER_DAY, STATS_COLUMNS, VectorEngine, np
+
+# Methods timed when metrics are enabled
+TRACKER_METHODS = ("load_data", "save_data", "reset_data", "create_habit", "delete_habit", "complete_task",
+                   "get_all_habits", "get_habits_by_periodicity", "get_longest_run_streak_for_habit",
+                   "get_top_streaks", "get_longest_run_streak_all", "get_broken_habits", "sync", "snapshot")
+ANALYTICS_METHODS = ("get_all_tracked_habits", "get_habits_by_periodicity", "get_longest_run_streak_all",
+                     "get_broken_habits", "get_rollups", "get_heatmap", "rebuild_rollups", "get_habit_stats",
+                     "get_stats_summary", "replay_stats", "get_period_snapshots")
+STORAGE_METHODS = ("load", "save", "dump", "write", "append")
+
+# Length in days of the period a habit must be completed in
+PERIOD_DAYS = {"daily": 1, "weekly": 7}
+
+# A batch that changes more habits than this notifies subscribers with a single "reload" event
+EVENT_BUFFER_LIMIT = 10000
+
+
+def period_index(timestamp, periodicity):
+    """
+    Numbers the day or week (starting on Monday) a timestamp falls in, in local time.
+
+    Consecutive periods have consecutive numbers, so streaks can be counted one period at a time.
+
+    Parameters:
+        - timestamp (int): Seconds since the epoch.
+        - periodicity (str): The frequency of the habit ("daily" or "weekly").
+
+    Returns:
+        int: The period number.
+    """
+    # Ordinal 1 (0001-01-01) is a Monday
+    return (date.fromtimestamp(timestamp).toordinal() - 1) // PERIOD_DAYS.get(periodicity, 1)
+
+
+def period_start(index, periodicity):
+    """
+    Returns the local midnight at which a period numbered by period_index starts.
+
+    Parameters:
+        - index (int): The period number.
+        - periodicity (str): The frequency of the habit ("daily" or "weekly").
+
+    Returns:
+        int: Seconds since the epoch.
+    """
+    first_day = date.fromordinal(index * PERIOD_DAYS.get(periodicity, 1) + 1)
+    return int(datetime.combine(first_day, time()).timestamp())
+
+
+def compute_streaks(timestamps, periodicity):
+    """
+    Computes streaks from a completion history.
+
+    A streak is a run of consecutive periods with at least one completion each.
+
+    Parameters:
+        - timestamps (array): Sorted completion timestamps.
+        - periodicity (str): The frequency of the habit ("daily" or "weekly").
+
+    Returns:
+        tuple: The run ending with the last completion and the longest run.
+    """
+    current = longest = 0
+    previous = None
+    for timestamp in timestamps:
+        index = period_index(timestamp, periodicity)
+        if index == previous:
+            continue
+        current = current + 1 if previous is not None and index == previous + 1 else 1
+        longest = max(longest, current)
+        previous = index
+    return current, longest
+
+
+def habit_stats(periodicity, created_at, history, as_of):
+    """
+    Computes the statistics of one habit from its completions up to a time, see
+    HabitTracker.get_habit_stats.
+
+    Parameters:
+        - periodicity (str): The frequency of the habit ("daily" or "weekly").
+        - created_at (int): The creation time of the habit.
+        - history (array): Sorted completion timestamps.
+        - as_of (int): Seconds since the epoch; later completions are ignored.
+
+    Returns:
+        tuple: The current streak, longest streak, broken status, hit periods, expected periods
+        and completion ratio.
+    """
+    count = bisect.bisect_right(history, as_of)
+    if count < len(history):
+        history = history[:count]
+    streak, longest = compute_streaks(history, periodicity)
+    current = period_index(as_of, periodicity)
+    start = period_index(created_at, periodicity)
+    broken = False
+    if len(history):
+        start = min(start, period_index(history[0], periodicity))
+        broken = periodicity in PERIOD_DAYS and current >= period_index(history[-1], periodicity) + 2
+    hits = len({period_index(timestamp, periodicity) for timestamp in history})
+    expected = max(current - start + 1, 0)
+    return 0 if broken else streak, longest, broken, hits, expected, hits / expected if expected else 0.0
 
 
 class HabitTracker:
-    def __init__(self, data_file="habit_data.json"):
+    def __init__(self, data_file="habit_data.json", journal=False, storage=None, write_behind=False,
+                 flush_delay=1.0, flush_threshold=1000, metrics=False, hot_days=None):
         """
         Initializes a HabitTracker instance.
 
         Parameters:
-            - data_file (str): The filename for storing habit data in JSON format.
+            - data_file (str): The filename for storing habit data in JSON format, or in SQLite
+              for .db, .sqlite and .sqlite3 files.
+            - journal (bool): Append mutations to a journal file instead of rewriting
+              the whole data file on every change (optional).
+            - storage: A storage backend from habit_storage, overriding data_file and journal (optional).
+            - write_behind (bool): Persist mutations from a background thread instead of on every
+              call, coalescing bursts into one write (optional).
+            - flush_delay (float): In write-behind mode, the longest time in seconds a mutation
+              waits before it is written (optional).
+            - flush_threshold (int): In write-behind mode, the number of pending mutations that
+              triggers a write straight away (optional).
+            - metrics (bool): Collect call counts, latencies and I/O byte counts from the start,
+              see enable_metrics (optional).
+            - hot_days (int): Keep only the completions of the last hot_days days in memory; older
+              ones are moved to a compressed archive next to the data file whenever it is saved
+              and read back only when needed, see archive_history. JSON data files only (optional).
         """
         self.data_file = data_file
-        self.habits = []
+        self.storage = storage or open_storage(data_file, journal=journal)
+        if hot_days is not None:
+            if not getattr(self.storage, "tiered", False):
+                raise ValueError("Only JSON data files can archive older completions.")
+            if hot_days <= 0:
+                raise ValueError("hot_days must be positive.")
+        self.hot_days = hot_days
+        self._init_state()
+        if metrics:
+            self.enable_metrics()
         self.load_data()
+        self._writer = WriteBehind(self, flush_delay, flush_threshold) if write_behind else None
+
+    def _init_state(self):
+        """
+        Sets up the in-memory state: no habits, no open batch and no indexes built yet.
+        """
+        self._lock = threading.RLock()  # Held while mutating or serializing the habits
+        self.habits = {}  # Habits keyed by lower-cased name, in creation order
+        self._undo_log = None  # Set while a batch is open
+        self._undo_order = None
+        self._pending = None
+        self._events = None  # Change events held back until the open batch commits
+        self._stale = None  # Set while importing or replaying: habits whose streaks are recomputed at the end
+        self._deferred_save = None  # Set during imports: whether a whole-file save was put off
+        self._subscribers = []
+        self._deadlines = []  # Min-heap of (deadline, key), may hold stale entries
+        self._due = {}  # Current deadline of every habit that is not yet broken
+        self._broken = {}  # Keys of habits whose deadline has passed, in the order they expired
+        self._leaders = []  # Min-heap of (-longest streak, entry number, key), may hold stale entries
+        self._leader_entries = {}  # (longest streak, entry number) of the current leaderboard entry of every habit
+        self._leader_count = 0
+        self._indexed = False  # The deadline queue and the leaderboard are built on first use
+        self._table = None  # LazyHabits whose table answers for the habits not indexed in memory
+        self._table_expired = 0  # Entries of its deadline order taken so far
+        self._query_index = None  # HabitIndex behind query, built on first use
+        self._rollups = None  # Completion rollups per day, week and month, built on first use
+        self._vectors = None  # VectorEngine over all completions, built on first use and dropped on change
+        self.analytics_workers = None  # Processes of the "processes" analytics engine, None for one per CPU
+        self._executor = None  # Their pool, started on first use
+        self._metrics = None
+        self._changed = None  # Keys changed since the last snapshot, to whether they were deleted; None to copy all
+        self._snapshot = None  # The last snapshot taken, to derive the next one from
+        self._snapshots = 0
 
     def load_data(self):
         """
-        Loads habit data from the specified JSON file.
+        Loads habit data from storage and replays any journaled mutations on top of it.
         """
-        if os.path.exists(self.data_file):
-            with open(self.data_file, "r") as file:
-                self.habits = json.load(file)
+        with self._lock, self.storage.lock():
+            habits = self.storage.load()
+            if isinstance(habits, LazyHabits):
+                # Binary snapshots build their habits on first use
+                self.habits = habits
+            else:
+                self.habits = {}
+                # Loading creates an object per habit; collecting garbage meanwhile only slows it down
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    for habit in habits:
+                        if habit.longest_streak is None:
+                            habit.streak, habit.longest_streak = compute_streaks(habit.completed_at,
+                                                                                 habit.periodicity)
+                        self.habits.setdefault(habit.task.lower(), habit)
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+            self._rebuild_indexes()
+            subscribers, self._subscribers = self._subscribers, []
+            self._stale = {}
+            try:
+                for record in self.storage.replay():
+                    self._apply_record(record)
+                self._refresh_streaks(self._stale)
+            finally:
+                self._subscribers = subscribers
+                self._stale = None
+            self._notify("reload", None)
 
     def save_data(self):
         """
-        Saves habit data to the specified JSON file.
+        Saves all habit data to storage.
+
+        For JSON storage this writes a new snapshot and clears the journal.
+        """
+        if self._writer is not None:
+            self._writer.flush(save=True)
+        else:
+            with self._lock, self.storage.lock():
+                self._catch_up()
+                self._archive_due()
+                self.storage.save(self)
+
+    def archive_history(self, before):
+        """
+        Moves the completions before a time into a compressed, append-only archive next to the
+        data file, and saves the data file without them.
+
+        Only habits with at least ARCHIVE_MIN_COMPLETIONS such completions are archived. The
+        histories keep working as before: lengths, the first and last completion, appending and
+        streaks need nothing from the archive, and whatever reads older completions (e.g. as-of
+        statistics, replay or export) reads their segments transparently. With hot_days set, this
+        happens on every save for the completions older than the window.
+
+        Parameters:
+            - before (str, datetime or int): Completions before this time are archived.
+
+        Returns:
+            int: The number of completions archived.
+        """
+        if not getattr(self.storage, "tiered", False):
+            raise ValueError("Only JSON data files can archive older completions.")
+        with self._lock, self.storage.lock():
+            self._catch_up()
+            moved = self._archive(to_timestamp(before))
+        if moved:
+            self.save_data()
+        return moved
+
+    def _archive_due(self):
+        """
+        Archives the completions older than the hot window, if there is one. Called holding both
+        locks, right before the data file is saved.
+        """
+        if self.hot_days is not None:
+            self._archive(int(datetime.now().timestamp()) - self.hot_days * SECONDS_PER_DAY)
+
+    def _archive(self, cutoff):
+        """
+        Moves the completions before a time into archive segments, one per habit that has at
+        least ARCHIVE_MIN_COMPLETIONS of them. Must be called holding both locks.
+
+        Parameters:
+            - cutoff (int): Seconds since the epoch.
+
+        Returns:
+            int: The number of completions archived.
+        """
+        archive = self.storage.archive()
+        moved = 0
+        for habit in self.habits.values():
+            history = habit.completed_at
+            tiered = type(history) is TieredHistory and history.archive is archive
+            recent = history.recent if tiered else history
+            count = bisect.bisect_left(recent, cutoff)
+            if count < ARCHIVE_MIN_COMPLETIONS:
+                continue
+            segment = archive.append(recent[:count])
+            if tiered:
+                history.push(segment)
+            else:
+                habit.completed_at = TieredHistory(archive, [segment], recent[count:])
+            moved += count
+        if moved:
+            # The segments must be on disk before a data file referring to them
+            archive.sync()
+        return moved
+
+    def flush(self):
+        """
+        Waits until every mutation made so far is persisted.
+
+        In write-behind mode the queued mutations are written straight away instead of after the
+        flush delay; otherwise mutations are persisted as they are made and this does nothing.
+
+        Must not be called while holding the tracker's lock, e.g. inside a batch.
+        """
+        if self._writer is not None:
+            self._writer.flush()
+
+    def sync(self):
+        """
+        Catches up with changes other processes made to the data file, e.g. to refresh a
+        long-running GUI.
+
+        New journal records are applied on top of the habits in memory; if the data file was
+        rewritten, it is loaded again and changes not written yet are applied on top of it.
+
+        Returns:
+            bool: Whether anything changed.
+        """
+        with self._lock, self.storage.lock():
+            return self._catch_up()
+
+    def _catch_up(self, records=None):
+        """
+        Applies changes other processes made to the data file since it was last read or written.
+
+        Must be called holding the tracker's lock and the storage lock, so nothing can change
+        between catching up and writing.
+
+        Parameters:
+            - records (list): Mutation records applied in memory but not written yet, re-applied
+              if the habits are reloaded; defaults to those queued for write-behind (optional).
+
+        Returns:
+            bool: Whether anything changed.
+        """
+        changes = self.storage.changes()
+        if changes is None:
+            return False
+        if records is None:
+            records = self._writer.pending() if self._writer is not None else []
+        if changes == RELOAD:
+            self.load_data()
+            if self._undo_log is not None:
+                # The batch's changes are re-applied below; undoing them is all a rollback can do now
+                self._undo_log = []
+                self._undo_order = None
+            for record in records:
+                self._apply_record(record)
+        else:
+            # Changes of other processes are kept if the open batch is rolled back
+            undo_log, self._undo_log = self._undo_log, None
+            try:
+                for record in changes:
+                    self._apply_record(record)
+            finally:
+                self._undo_log = undo_log
+        return True
+
+    def compact(self):
+        """
+        Folds the journal into a new snapshot of the data file.
+        """
+        self.save_data()
+
+    def enable_metrics(self, dump_file=None, dump_interval=60.0):
+        """
+        Starts collecting per-method call counts and latency histograms for this tracker, its
+        storage and Analytics instances created afterwards, plus bytes read and written by the storage.
+
+        Until this is called, no method is wrapped, so there is no overhead.
+
+        Parameters:
+            - dump_file (str): Also write the metrics to this JSON file periodically (optional).
+            - dump_interval (float): Seconds between dumps (optional).
+        """
+        if self._metrics is None:
+            self._metrics = Metrics()
+            instrument(self, TRACKER_METHODS, self._metrics, "HabitTracker.")
+            instrument(self.storage, STORAGE_METHODS, self._metrics, type(self.storage).__name__ + ".")
+            self.storage.metrics = self._metrics
+        if dump_file:
+            self._metrics.start_dumping(dump_file, dump_interval)
+
+    def metrics(self):
+        """
+        Retrieves the metrics collected since enable_metrics was called.
+
+        Returns:
+            dict: Per-method call statistics under "calls" and storage byte counts under "io",
+            or None if metrics are not enabled.
+        """
+        return self._metrics.snapshot() if self._metrics is not None else None
+
+    def close(self):
+        """
+        Flushes pending writes, stops the write-behind thread and the analytics worker processes,
+        and closes the storage backend.
+        """
+        if self._writer is not None:
+            self._writer.close()
+        if self._metrics is not None:
+            self._metrics.stop_dumping()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.storage.close()
+
+    def subscribe(self, callback):
+        """
+        Registers a callback that is told about every change to the habits.
+
+        The callback is called as callback(event, habit) after the change is applied and while
+        the tracker's lock is held, on the thread that made the change, so it should be quick.
+        Events are:
+            - "habit_created", "habit_deleted", "habit_completed": with the affected Habit.
+            - "reset": all habits were cleared, with None.
+            - "reload": the habits were replaced wholesale, e.g. loaded again, with None.
+        Changes made in a batch are announced when it commits, and not at all if it rolls back.
+
+        Parameters:
+            - callback (callable): The function to call.
+        """
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+
+    def unsubscribe(self, callback):
+        """
+        Removes a callback registered with subscribe.
+
+        Parameters:
+            - callback (callable): The function to remove.
+        """
+        with self._lock:
+            self._subscribers = [subscriber for subscriber in self._subscribers if subscriber != callback]
+
+    def _notify(self, event, habit):
+        """
+        Tells subscribers about a change, or holds it back until the open batch commits.
+
+        Parameters:
+            - event (str): The event name, see subscribe.
+            - habit (Habit): The affected habit, or None.
+        """
+        if not self._subscribers:
+            return
+        if self._events is None:
+            for callback in self._subscribers:
+                callback(event, habit)
+        elif len(self._events) < EVENT_BUFFER_LIMIT:
+            self._events.append((event, habit))
+        else:
+            self._events[:] = [("reload", None)]
+
+    def _apply_record(self, record):
+        """
+        Applies a single mutation record to the in-memory habits.
+
+        Inside a batch, an undo action is logged for every change so the batch can be rolled back.
+
+        Parameters:
+            - record (dict): The mutation, identified by its "op" key.
+        """
+        op = record["op"]
+        undo_log = self._undo_log
+        self._vectors = None
+        if op == "create":
+            habit = Habit(record["task"], record["periodicity"], record["created_at"])
+            key = habit.task.lower()
+            if key not in self.habits:
+                self.habits[key] = habit
+                self._update_indexes(key, habit)
+                if undo_log is not None:
+                    undo_log.append(lambda: self._remove_habit(key))
+                self._notify("habit_created", habit)
+        elif op == "delete":
+            key = record["task"].lower()
+            if key in self.habits and undo_log is not None and self._undo_order is None:
+                # Restoring a deleted habit appends it, so remember the order to put it back in
+                self._undo_order = list(self.habits)
+            habit = self._remove_habit(key)
+            if habit and undo_log is not None:
+                undo_log.append(lambda: self._restore_habit(key, habit))
+            if habit:
+                self._notify("habit_deleted", habit)
+        elif op == "complete":
+            habit = self.get_habit(record["task"])
+            if habit:
+                timestamp = record["ts"]
+                history = habit.completed_at
+                if not history or timestamp >= history[-1]:
+                    self._extend_streak(habit, timestamp)
+                    history.append(timestamp)
+                elif self._stale is not None:
+                    # Backfilled history: recompute the streaks once at the end
+                    bisect.insort(history, timestamp)
+                    self._stale[habit.task.lower()] = habit
+                else:
+                    bisect.insort(history, timestamp)
+                    habit.streak, habit.longest_streak = compute_streaks(history, habit.periodicity)
+                key = habit.task.lower()
+                if self._rollups is not None:
+                    self._rollups.add(key, habit, timestamp)
+                self._update_indexes(key, habit)
+                if undo_log is not None:
+                    undo_log.append(lambda: self._undo_complete(habit, timestamp))
+                self._notify("habit_completed", habit)
+        elif op == "reset":
+            habits = self.habits
+            self.habits = {}
+            self._rebuild_indexes()
+            if undo_log is not None:
+                undo_log.append(lambda: self._restore_habits(habits))
+            self._notify("reset", None)
+
+    def _remove_habit(self, key):
+        """
+        Removes a habit from the name index, the deadline queue and the leaderboard.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+
+        Returns:
+            Habit: The removed habit, or None if there was no such habit.
+        """
+        self._due.pop(key, None)
+        self._broken.pop(key, None)
+        self._leader_entries.pop(key, None)
+        if self._query_index is not None:
+            self._query_index.remove(key)
+        if self._rollups is not None:
+            self._rollups.remove(key)
+        if self._changed is not None:
+            self._changed[key] = True
+        return self.habits.pop(key, None)
+
+    def _restore_habit(self, key, habit):
         """
-        with open(self.data_file, "w") as file:
-            json.dump(self.habits, file, default=str)
+        Puts back a habit removed by _remove_habit.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+        """
+        self.habits[key] = habit
+        self._update_indexes(key, habit)
+        if self._rollups is not None:
+            self._rollups.add_habit(key, habit)
+
+    def _restore_habits(self, habits):
+        """
+        Replaces all habits, e.g. to undo a reset.
+
+        Parameters:
+            - habits (dict): The habits keyed by lower-cased name.
+        """
+        self.habits = habits
+        self._rebuild_indexes()
+
+    def _extend_streak(self, habit, timestamp):
+        """
+        Updates the streaks of a habit for a completion at or after its last one.
+
+        Parameters:
+            - habit (Habit): The habit, before the completion is added to its history.
+            - timestamp (int): The completion timestamp.
+        """
+        history = habit.completed_at
+        index = period_index(timestamp, habit.periodicity)
+        if history:
+            previous = period_index(history[-1], habit.periodicity)
+            if index == previous:
+                return
+            # A streak reset by get_broken_habits stays broken
+            if index == previous + 1 and habit.streak:
+                habit.streak += 1
+            else:
+                habit.streak = 1
+        else:
+            habit.streak = 1
+        habit.longest_streak = max(habit.longest_streak, habit.streak)
+
+    def _update_indexes(self, key, habit):
+        """
+        Brings the deadline queue, the leaderboard and the query indexes up to date for a habit.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit, after it was added or changed.
+        """
+        self._schedule(key, habit)
+        self._rank(key, habit)
+        if self._query_index is not None:
+            self._query_index.add(key, habit)
+        if self._changed is not None:
+            self._changed.setdefault(key, False)
+
+    def _deadline(self, habit):
+        """
+        Returns the time at which a habit becomes broken: the start of the second period after
+        its last completion, i.e. once a whole period has passed without completing it.
+
+        Parameters:
+            - habit (Habit): The habit.
+
+        Returns:
+            int: Seconds since the epoch, or None if the habit can't be broken.
+        """
+        if not habit.completed_at or habit.periodicity not in PERIOD_DAYS:
+            return None
+        periodicity = habit.periodicity
+        return period_start(period_index(habit.completed_at[-1], periodicity) + 2, periodicity)
+
+    def _schedule(self, key, habit):
+        """
+        Queues the deadline by which a habit must be completed again.
+
+        Habits that were never completed, or have an unknown periodicity, are never broken.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+        """
+        if not self._indexed:
+            return
+        deadline = self._deadline(habit)
+        if deadline is None:
+            return
+        if self._due.get(key) != deadline:
+            self._broken.pop(key, None)
+            self._due[key] = deadline
+            heapq.heappush(self._deadlines, (deadline, key))
+            # Superseded entries are only dropped when they expire, so rebuild once they pile up
+            if len(self._deadlines) > 2 * len(self._due) + 64:
+                self._deadlines = [(due, due_key) for due_key, due in self._due.items()]
+                heapq.heapify(self._deadlines)
+
+    def _rank(self, key, habit):
+        """
+        Adds a habit's longest streak to the leaderboard if it changed.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - habit (Habit): The habit.
+        """
+        if not self._indexed:
+            return
+        entry = self._leader_entries.get(key)
+        if entry is not None and entry[0] == habit.longest_streak:
+            return
+        self._leader_count += 1
+        self._leader_entries[key] = (habit.longest_streak, self._leader_count)
+        heapq.heappush(self._leaders, (-habit.longest_streak, self._leader_count, key))
+        if len(self._leaders) > 2 * len(self._leader_entries) + 64:
+            self._rebuild_leaders()
+
+    def _rebuild_leaders(self):
+        """
+        Rebuilds the leaderboard heap, dropping superseded entries.
+        """
+        self._leaders = [(-longest, entry, key) for key, (longest, entry) in self._leader_entries.items()]
+        heapq.heapify(self._leaders)
+
+    def _rebuild_indexes(self):
+        """
+        Drops the deadline queue, the leaderboard and the query indexes after the habits were
+        replaced wholesale.
+
+        They are rebuilt by _ensure_indexes and _ensure_query_index when first needed, so loading
+        doesn't pay for them.
+        """
+        self._indexed = False
+        self._table = None
+        self._table_expired = 0
+        self._query_index = None
+        self._rollups = None
+        self._vectors = None
+        self._due = {}
+        self._broken = {}
+        self._leader_entries = {}
+        self._deadlines = []
+        self._leaders = []
+        self._changed = None
+
+    def _ensure_indexes(self):
+        """
+        Builds the deadline queue and the leaderboard for the current habits, if not built yet.
+
+        Habits of a binary snapshot are left to the deadline and leaderboard orders stored with
+        it, see get_broken_habits and get_top_streaks, unless they changed in memory.
+        """
+        if self._indexed:
+            return
+        with self._lock:
+            if self._indexed:
+                return
+            habits = self.habits.items()
+            table = None
+            if isinstance(self.habits, LazyHabits) and self.habits.indexed:
+                table = self._table = self.habits
+                habits = table.loaded_items()
+            for key, habit in habits:
+                stored = table.stored(key) if table is not None else None
+                deadline = self._deadline(habit)
+                if deadline is not None and (stored is None or stored[1] != deadline):
+                    self._due[key] = deadline
+                if stored is None or stored[0] != habit.longest_streak:
+                    self._leader_count += 1
+                    self._leader_entries[key] = (habit.longest_streak, self._leader_count)
+            self._deadlines = [(deadline, key) for key, deadline in self._due.items()]
+            heapq.heapify(self._deadlines)
+            self._rebuild_leaders()
+            self._indexed = True
+
+    def _ensure_query_index(self):
+        """
+        Builds the query indexes for the current habits, if not built yet.
+
+        Returns:
+            HabitIndex: The query indexes.
+        """
+        with self._lock:
+            if self._query_index is None:
+                self._query_index = HabitIndex(self.habits, self._lock)
+            return self._query_index
+
+    def _indexed_storage(self):
+        """
+        Returns the storage if it answers queries from indexes of its own and holds every change
+        applied in memory, otherwise None. Must be called holding the lock.
+
+        Returns:
+            SqliteStorage: The storage, or None.
+        """
+        if not getattr(self.storage, "indexed", False) or self._pending:
+            return None
+        if self._writer is not None and not self._writer.idle():
+            return None
+        return self.storage
+
+    def _undo_complete(self, habit, timestamp):
+        """
+        Reverts a completion applied by _apply_record.
+
+        Parameters:
+            - habit (Habit): The completed habit.
+            - timestamp (int): The completion timestamp to remove.
+        """
+        history = habit.completed_at
+        del history[bisect.bisect_left(history, timestamp)]
+        habit.streak, habit.longest_streak = compute_streaks(history, habit.periodicity)
+        key = habit.task.lower()
+        if self._rollups is not None:
+            self._rollups.discard(key, habit, timestamp)
+        self._due.pop(key, None)
+        self._broken.pop(key, None)
+        self._update_indexes(key, habit)
+
+    def _commit(self, record):
+        """
+        Applies a mutation in memory and persists it.
+
+        Parameters:
+            - record (dict): The mutation record.
+        """
+        with self._lock:
+            self._apply_record(record)
+            self._persist(record)
+
+    def _persist(self, record):
+        """
+        Persists a mutation that has already been applied in memory.
+
+        Inside a batch the record is held back until the batch commits.
+
+        Parameters:
+            - record (dict): The mutation record to persist.
+        """
+        if self._pending is not None:
+            self._pending.append(record)
+        else:
+            self._persist_records([record])
+
+    def _persist_records(self, records):
+        """
+        Persists mutations that have already been applied in memory.
+
+        Incremental storage (a journal or SQLite) gets the records in one call, otherwise the
+        whole data file is rewritten once. Changes other processes made meanwhile are applied
+        first, under the data file lock, so neither side's changes are lost. In write-behind mode
+        the records are queued instead.
+
+        Parameters:
+            - records (list): The mutation records to persist.
+        """
+        if self._writer is not None:
+            self._writer.submit(records)
+        elif not self.storage.incremental and self._deferred_save is not None:
+            self._deferred_save = True
+        else:
+            with self._lock, self.storage.lock():
+                self._catch_up(records)
+                if self.storage.incremental:
+                    self.storage.append(records, self)
+                else:
+                    self.save_data()
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups mutations into one transaction that is persisted once when the block exits.
+
+        Changes are applied in memory straight away. If the block raises, they are rolled back
+        and nothing is written. Nested batches join the outermost one. Subscribers are notified
+        once the batch has been persisted.
+
+        Example:
+            with tracker.batch():
+                tracker.create_habit("Reading", "daily")
+                tracker.complete_task("Reading")
+        """
+        with self._lock:
+            if self._undo_log is not None:
+                yield self
+                return
+            self._undo_log = []
+            self._undo_order = None
+            self._pending = []
+            self._events = []
+            try:
+                yield self
+                if self._pending:
+                    self._persist_records(self._pending)
+                events = self._events
+            except BaseException:
+                self._rollback()
+                raise
+            finally:
+                self._undo_log = None
+                self._undo_order = None
+                self._pending = None
+                self._events = None
+            for event, habit in events:
+                self._notify(event, habit)
+
+    def _rollback(self):
+        """
+        Reverts the in-memory changes of the current batch.
+        """
+        self._vectors = None
+        for undo in reversed(self._undo_log):
+            undo()
+        if self._undo_order is not None:
+            self.habits = {key: self.habits[key] for key in self._undo_order if key in self.habits}
+            # Restored habits were re-indexed at the end, out of creation order
+            self._query_index = None
+            self._changed = None
+            if self._table is not None:
+                # The deadline queue and the leaderboard relied on the table
+                self._rebuild_indexes()
 
     def reset_data(self):
         """
         Resets all habit data.
         """
-        self.habits = []
-        self.save_data()
+        record = {"op": "reset"}
+        self._commit(record)
 
     def create_habit(self, task, periodicity):
         """
@@ -46,19 +887,16 @@ class HabitTracker:
             - periodicity (str): The frequency of the habit ("daily" or "weekly").
         """
         # Check if a habit with the same name already exists
-        if any(habit["task"].lower() == task.lower() for habit in self.habits):
+        if self.get_habit(task) is not None:
             print(f"Error: Habit with the name '{task}' already exists.")
         else:
-            habit = {
+            record = {
+                "op": "create",
                 "task": task,
                 "periodicity": periodicity,
-                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "completed_at": [],
-                "streak": 0,  # Initialize streak to 0 when creating a new habit
-                "all_streaks": []  # Initialize all_streaks to an empty list
+                "created_at": int(datetime.now().timestamp())
             }
-            self.habits.append(habit)
-            self.save_data()
+            self._commit(record)
 
     def delete_habit(self, task):
         """
@@ -67,28 +905,247 @@ class HabitTracker:
         Parameters:
             - task (str): The name of the habit to be deleted.
         """
-        self.habits = [habit for habit in self.habits if habit["task"] != task]
-        self.save_data()
+        record = {"op": "delete", "task": task}
+        self._commit(record)
 
     def complete_task(self, task, custom_completed_at=None):
         """
-        Marks a habit as completed and updates streak.
+        Marks a habit as completed, adds the completion to its history and updates streak.
 
         Parameters:
             - task (str): The name of the habit to be marked as completed.
-            - custom_completed_at (str): Custom completion time (optional).
+            - custom_completed_at (str, datetime or int): Custom completion time (optional).
         """
-        habit = next((habit for habit in self.habits if habit["task"] == task), None)
-        if habit:
-            habit["completed_at"] = custom_completed_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            habit["streak"] += 1
-            self.save_data()
+        if self.get_habit(task) is not None:
+            record = {
+                "op": "complete",
+                "task": task,
+                "ts": to_timestamp(custom_completed_at or datetime.now())
+            }
+            self._commit(record)
+
+    def create_habits(self, habits):
+        """
+        Creates many habits with a single save.
+
+        Parameters:
+            - habits (iterable): (task, periodicity) pairs.
+        """
+        with self.batch():
+            for task, periodicity in habits:
+                self.create_habit(task, periodicity)
+
+    def complete_tasks(self, completions):
+        """
+        Marks many habits as completed with a single save.
+
+        Parameters:
+            - completions (iterable): (task, completed_at) pairs, where completed_at may be None for now.
+        """
+        with self.batch():
+            for task, completed_at in completions:
+                self.complete_task(task, completed_at)
+
+    def import_habits(self, rows, format=None, chunk_size=10000, skip_invalid=False):
+        """
+        Imports habits and completions from a stream of rows, e.g. to backfill history from another system.
+
+        Rows are applied chunk by chunk, each chunk as one batch: one journal append or SQLite
+        transaction per chunk, or a single rewrite of a whole-file data file at the end. Memory use
+        depends on the chunk size, not on the number of rows. A failing chunk is rolled back, while
+        earlier chunks stay imported.
+
+        Habits that already exist and completions already in a habit's history are skipped as
+        duplicates. Completions may arrive in any order; the streaks of habits whose history was
+        backfilled are recomputed once when the import ends, followed by a "reload" event.
+
+        A whole-file data file stays locked until it is saved at the end, so other threads and
+        processes wait for the import; use journal mode or SQLite to let them continue meanwhile.
+
+        Parameters:
+            - rows (str or iterable): An NDJSON or CSV file, or row dicts (e.g. from a generator),
+              as described in habit_storage.read_rows.
+            - format (str): "ndjson" or "csv", overriding the file extension (optional).
+            - chunk_size (int): The number of rows applied and persisted together (optional).
+            - skip_invalid (bool): Count invalid rows instead of raising ValueError (optional).
+
+        Returns:
+            dict: The numbers of imported "habits" and "completions", and of skipped "duplicates"
+            and "invalid" rows.
+        """
+        if isinstance(rows, str):
+            rows = read_rows(rows, format)
+        counts = {"habits": 0, "completions": 0, "duplicates": 0, "invalid": 0}
+        rows = iter(rows)
+        number = 0
+        with ExitStack() as held:
+            if not self.storage.incremental and self._writer is None:
+                # Saved once at the end, so nobody else may change the data file meanwhile
+                held.enter_context(self._lock)
+                held.enter_context(self.storage.lock())
+                self._catch_up()
+            self._deferred_save = False
+            self._stale = stale = {}
+            try:
+                while True:
+                    chunk = list(islice(rows, chunk_size))
+                    if not chunk:
+                        break
+                    with self.batch():
+                        for row in chunk:
+                            number += 1
+                            try:
+                                self._import_row(row, counts)
+                            except (ValueError, TypeError, KeyError, AttributeError) as error:
+                                if not skip_invalid:
+                                    raise ValueError(f"Invalid row {number}: {error}") from None
+                                counts["invalid"] += 1
+            finally:
+                with self._lock, self.storage.lock():
+                    self._stale = None
+                    self._refresh_streaks(stale)
+                    if stale:
+                        self.storage.update_habits(self, stale)
+                        self._notify("reload", None)
+                deferred, self._deferred_save = self._deferred_save, None
+                if deferred:
+                    self.save_data()
+        return counts
+
+    def _import_row(self, row, counts):
+        """
+        Validates and applies one imported row.
+
+        Parameters:
+            - row (dict): The row, see import_habits.
+            - counts (dict): The import counters to update.
+        """
+        task = row["task"]
+        if not isinstance(task, str) or not task.strip():
+            raise ValueError("missing task")
+        kind = row.get("type")
+        if kind == "habit":
+            periodicity = row.get("periodicity")
+            if periodicity not in PERIODICITIES:
+                raise ValueError(f"unknown periodicity {periodicity!r}")
+            if self.get_habit(task) is not None:
+                counts["duplicates"] += 1
+                return
+            created_at = parse_time(row.get("created_at"))
+            self._commit({"op": "create", "task": task, "periodicity": periodicity,
+                          "created_at": created_at if created_at is not None else int(datetime.now().timestamp())})
+            counts["habits"] += 1
+        elif kind == "completion":
+            habit = self.get_habit(task)
+            if habit is None:
+                raise ValueError(f"unknown habit {task!r}")
+            timestamp = parse_time(row.get("completed_at"))
+            if timestamp is None:
+                raise ValueError("missing completed_at")
+            history = habit.completed_at
+            index = bisect.bisect_left(history, timestamp)
+            if index < len(history) and history[index] == timestamp:
+                counts["duplicates"] += 1
+                return
+            self._commit({"op": "complete", "task": task, "ts": timestamp})
+            counts["completions"] += 1
+        else:
+            raise ValueError(f"unknown row type {kind!r}")
+
+    def _refresh_streaks(self, habits):
+        """
+        Recomputes the streaks of habits whose history was backfilled out of order.
+
+        Parameters:
+            - habits (dict): The habits keyed by lower-cased name.
+        """
+        for key, habit in habits.items():
+            if self.habits.get(key) is habit:
+                habit.streak, habit.longest_streak = compute_streaks(habit.completed_at, habit.periodicity)
+                self._update_indexes(key, habit)
+
+    def export_rows(self):
+        """
+        Streams all habits and their completions as rows for export.
+
+        Each habit row is followed by its completion rows, in the format read by import_habits.
+
+        Returns:
+            Generator of row dicts.
+        """
+        with self._lock:
+            habits = list(self.habits.values())
+        for habit in habits:
+            with self._lock:
+                history = array("q", habit.completed_at)
+            yield {"type": "habit", "task": habit.task, "periodicity": str(habit.periodicity),
+                   "created_at": format_timestamp(habit.created_at)}
+            for timestamp in history:
+                yield {"type": "completion", "task": habit.task, "completed_at": format_timestamp(timestamp)}
+
+    def export_habits(self, path, format=None):
+        """
+        Exports all habits and completions to an NDJSON or CSV file, streaming one row at a time.
+
+        Parameters:
+            - path (str): The file to write; .ndjson and .jsonl files are NDJSON, .csv files CSV.
+            - format (str): "ndjson" or "csv", overriding the file extension (optional).
+
+        Returns:
+            int: The number of rows written.
+        """
+        return write_rows(path, self.export_rows(), format)
+
+    def get_habit(self, task):
+        """
+        Retrieves a habit by name, ignoring case.
+
+        Parameters:
+            - task (str): The name of the habit.
+
+        Returns:
+            Habit: The habit, or None if no habit has that name.
+        """
+        return self.habits.get(task.lower())
 
     def get_all_habits(self):
         """
         Retrieves a list of all habits.
+
+        The Habit records can be read like the dicts habits used to be (habit["task"]), and
+        habit.as_dict() gives a plain dict with the creation time formatted.
+        """
+        return list(self.habits.values())
+
+    def snapshot(self):
         """
-        return self.habits
+        Takes a read-only view of the habits as they are now.
+
+        The snapshot has the tracker's read methods and works with Analytics, on its own copies
+        of the habits: it can be read from any thread without locking the tracker, and doesn't
+        change while writers carry on. Consecutive snapshots share the copies of habits that
+        didn't change in between, so taking one costs O(changes) rather than O(habits); only the
+        first one, and the first after the habits were replaced wholesale (e.g. reloaded),
+        copies every habit. Without changes in between, the same snapshot is returned.
+
+        Example:
+            analytics = Analytics(tracker.snapshot())
+
+        Returns:
+            HabitSnapshot: The snapshot.
+        """
+        with self._lock:
+            previous = self._snapshot
+            if previous is not None and self._changed is not None:
+                if not self._changed:
+                    return previous
+                habits = previous.habits.evolve(self.habits, self._changed)
+            else:
+                habits = SnapshotHabits.build(self.habits)
+            self._snapshots += 1
+            self._snapshot = HabitSnapshot(self, habits, self._snapshots)
+            self._changed = {}
+            return self._snapshot
 
     def get_habits_by_periodicity(self, periodicity):
         """
@@ -100,7 +1157,39 @@ class HabitTracker:
         Returns:
             List of habits with the specified periodicity.
         """
-        return [habit for habit in self.habits if habit["periodicity"] == periodicity]
+        with self._lock:
+            storage = self._indexed_storage()
+            if storage is not None:
+                return [self.habits[key] for key in storage.get_habits_by_periodicity(periodicity)
+                        if key in self.habits]
+        return list(self._ensure_query_index().query(periodicity=periodicity))
+
+    def query(self, periodicity=None, created_between=None, last_completed_before=None, min_streak=None,
+              order_by=None, descending=False, limit=None, offset=0):
+        """
+        Finds habits matching all the given filters, using secondary indexes instead of a scan.
+
+        The indexes (a hash index on periodicity, sorted indexes on creation time, last completion
+        and current streak) are built on the first query and kept up to date as habits change.
+
+        Parameters:
+            - periodicity (str): Only habits with this periodicity (optional).
+            - created_between (tuple): (start, end) times, either may be None; only habits created
+              at or after start and before end (optional).
+            - last_completed_before (str, datetime or int): Only habits not completed at or after
+              this time, including those never completed (optional).
+            - min_streak (int): Only habits with at least this current streak (optional).
+            - order_by (str): "created_at", "last_completed" or "streak"; without it the order is
+              unspecified (optional).
+            - descending (bool): Reverse the order given by order_by (optional).
+            - limit (int): The most habits to return (optional).
+            - offset (int): The number of matching habits to skip (optional).
+
+        Returns:
+            Iterator of matching habits, produced lazily.
+        """
+        return self._ensure_query_index().query(periodicity, created_between, last_completed_before, min_streak,
+                                                order_by, descending, limit, offset)
 
     def get_longest_run_streak_for_habit(self, task):
         """
@@ -112,8 +1201,63 @@ class HabitTracker:
         Returns:
             int: The longest run streak for the specified habit.
         """
-        habit = next((habit for habit in self.habits if habit["task"].lower() == task.lower()), None)
-        return habit.get("streak", 0)
+        habit = self.get_habit(task)
+        return habit.longest_streak if habit else 0
+
+    def get_top_streaks(self, n=10):
+        """
+        Retrieves the habits with the longest run streaks from the leaderboard.
+
+        Only the top entries of the leaderboard heap, or of the streak index of SQLite storage,
+        are visited, so the cost is O(n log N) rather than a scan over all habits. Habits of a
+        binary snapshot that didn't change since it was written come from its leaderboard order.
+
+        Parameters:
+            - n (int): The number of habits to return.
+
+        Returns:
+            List of (task, longest streak) tuples, longest first.
+        """
+        with self._lock:
+            storage = self._indexed_storage()
+            if storage is not None:
+                return [(self.habits[key].task, longest) for key, longest in storage.get_top_streaks(n)
+                        if key in self.habits]
+        self._ensure_indexes()
+        leaders = self._leaders
+        stored = self._table_leaders()
+        candidate = next(stored, None)
+        top = []
+        popped = []
+        while len(top) < n:
+            # Entries superseded by a newer one for the same habit, or of deleted habits, are dropped
+            while leaders and self._leader_entries.get(leaders[0][2]) != (-leaders[0][0], leaders[0][1]):
+                heapq.heappop(leaders)
+            if candidate is not None and (not leaders or candidate[1] >= -leaders[0][0]):
+                top.append(candidate)
+                candidate = next(stored, None)
+            elif leaders:
+                longest, entry, key = item = heapq.heappop(leaders)
+                popped.append(item)
+                top.append((key, -longest))
+            else:
+                break
+        for item in popped:
+            heapq.heappush(leaders, item)
+        return [(self.habits[key].task, longest) for key, longest in top]
+
+    def _table_leaders(self):
+        """
+        Yields (key, longest streak) of the habits the leaderboard leaves to the binary snapshot's
+        table, longest first: those not ranked in memory, whose longest streak didn't change.
+        """
+        if self._table is None:
+            return
+        for longest, key in self._table.leaders():
+            if key not in self._leader_entries:
+                habit = self._table.built(key)
+                if habit is None or habit.longest_streak == longest:
+                    yield key, longest
 
     def get_longest_run_streak_all(self):
         """
@@ -122,32 +1266,397 @@ class HabitTracker:
         Returns:
             str: The habit and streak with the longest run.
         """
-        all_streaks = [(habit["task"], habit.get("streak", 0)) for habit in self.habits]
-        longest_streak_habit, longest_streak = max(all_streaks, key=lambda x: x[1], default=(None, 0))
+        longest_streak_habit, longest_streak = next(iter(self.get_top_streaks(1)), (None, 0))
         return f"{longest_streak_habit}: {longest_streak}"
 
-    def get_broken_habits(self):
+    def get_broken_habits(self, as_of=None):
         """
         Retrieves habits that are considered broken (not completed within the expected timeframe).
 
+        Only deadlines that expired since the previous call are taken off the queue, so the cost
+        depends on the number of newly broken habits rather than on the number of habits. With
+        SQLite storage the deadline index of the database is used instead; habits of a binary
+        snapshot that didn't change since it was written come from its deadline order. Broken
+        habits get their current streak set to 0.
+
+        Parameters:
+            - as_of (str, datetime or int): Find the habits that were broken at this time instead
+              of now, by replaying their completions up to it; nothing is changed (optional).
+
         Returns:
             List of broken habits.
         """
-        current_datetime = datetime.now()
-        broken_habits = []
+        if as_of is not None:
+            with self._lock:
+                habits = list(self.habits.values())
+                engine = ReplayEngine(habits, PERIOD_DAYS)
+            _, columns = next(engine.snapshots([to_timestamp(as_of)]))
+            return [habit for habit, broken in zip(habits, columns["broken"]) if broken]
+        with self._lock:
+            storage = self._indexed_storage()
+            if storage is not None:
+                broken = []
+                for key in storage.get_broken_habits():
+                    habit = self.habits.get(key)
+                    if habit is not None:
+                        self._reset_streak(key, habit)
+                        broken.append(habit)
+                return broken
+        self._ensure_indexes()
+        now = datetime.now().timestamp()
+        deadlines = self._deadlines
+        expiry = self._table_expiry()
+
+        while True:
+            if deadlines and deadlines[0][0] <= now and (expiry is None or deadlines[0] <= expiry):
+                deadline, key = heapq.heappop(deadlines)
+                if self._due.get(key) != deadline:  # The entry was superseded by a later completion
+                    continue
+                del self._due[key]
+            elif expiry is not None and expiry[0] <= now:
+                deadline, key = expiry
+                self._table_expired += 1
+                expiry = self._table_expiry()
+                if not self._expires_in_table(key, deadline):
+                    continue
+            else:
+                break
+            self._broken[key] = True
+            self._reset_streak(key, self.habits[key])
+
+        return [self.habits[key] for key in self._broken]
+
+    def _table_expiry(self):
+        """
+        Returns the next entry of the deadline order of the binary snapshot's table.
+
+        Returns:
+            tuple: (deadline, key), or None if there is no table or no more entries.
+        """
+        return self._table.expiry(self._table_expired) if self._table is not None else None
+
+    def _expires_in_table(self, key, deadline):
+        """
+        Checks whether an entry of the table's deadline order still holds: the habit wasn't
+        deleted, broken or scheduled in memory since, and its deadline didn't change.
+
+        Parameters:
+            - key (str): The lower-cased habit name.
+            - deadline (int): The deadline in the table.
+
+        Returns:
+            bool: True if the habit is broken at the deadline.
+        """
+        if key in self._due or key in self._broken or not self._table.from_table(key):
+            return False
+        habit = self._table.built(key)
+        return habit is None or self._deadline(habit) == deadline
+
+    def _reset_streak(self, key, habit):
+        """
+        Sets the current streak of a broken habit to 0.
+
+        Parameters:
+            - key (str): The lower-cased name of the habit.
+            - habit (Habit): The habit.
+        """
+        habit.streak = 0
+        if self._query_index is not None:
+            self._query_index.add(key, habit)
+        if self._changed is not None:
+            self._changed.setdefault(key, False)
+
+    def rebuild_rollups(self):
+        """
+        Rebuilds the completion rollups from the completion histories.
+
+        Rollups are built on first use and then updated with every completion, so this is only
+        needed to rebuild them ahead of time, e.g. before a dashboard starts querying.
+
+        Returns:
+            int: The number of habits with completions.
+        """
+        with self._lock:
+            self._rollups = Rollups(PERIOD_DAYS)
+            for key, habit in self.habits.items():
+                self._rollups.add_habit(key, habit)
+            return len(self._rollups)
+
+    def _ensure_rollups(self):
+        """
+        Builds the completion rollups, if not built yet.
 
-        for habit in self.habits:
-            if habit["completed_at"]:
-                completed_at = datetime.strptime(habit["completed_at"], "%Y-%m-%d %H:%M:%S")
-                days_since_completion = (current_datetime - completed_at).days
+        Returns:
+            Rollups: The rollups.
+        """
+        with self._lock:
+            if self._rollups is None:
+                self.rebuild_rollups()
+            return self._rollups
 
-                if (days_since_completion > 1 and habit["periodicity"] == "daily") or (
-                        days_since_completion > 7 and habit["periodicity"] == "weekly"
-                ):
-                    broken_habits.append(habit)
-                    habit["streak"] = 0
+    def get_rollups(self, task, granularity="week", start=None, end=None):
+        """
+        Summarizes a habit per day, ISO week or month from the rollups, in O(buckets).
 
-        return broken_habits
+        Parameters:
+            - task (str): The name of the habit.
+            - granularity (str): "day", "week" or "month" (optional).
+            - start (str, datetime or int): A time in the first bucket, defaults to the habit's
+              creation or first completion, whichever is earlier (optional).
+            - end (str, datetime or int): A time in the last bucket, defaults to now (optional).
+
+        Returns:
+            List of dicts with the bucket label ("2023-12-01", "2023-W48" or "2023-12"), the
+            number of completions, and the periods of the habit that were expected, hit and missed
+            in the bucket. Empty if there is no such habit.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity {granularity!r}, expected one of {', '.join(GRANULARITIES)}")
+        today = day_number(int(datetime.now().timestamp()))
+        with self._lock:
+            habit = self.get_habit(task)
+            if habit is None:
+                return []
+            rollups = self._ensure_rollups()
+            if start is None:
+                first_day = day_number(habit.created_at)
+                if habit.completed_at:
+                    first_day = min(first_day, day_number(habit.completed_at[0]))
+            else:
+                first_day = day_number(to_timestamp(start))
+            last_day = today if end is None else day_number(to_timestamp(end))
+            return rollups.buckets(task.lower(), habit, granularity, first_day, last_day, today)
+
+    def get_heatmap(self, task=None, start=None, end=None):
+        """
+        Counts completions per day for a calendar heatmap, from the rollups.
+
+        Parameters:
+            - task (str): The name of the habit, or None for all habits (optional).
+            - start (str, datetime or int): The first day, defaults to a year before end (optional).
+            - end (str, datetime or int): The last day, defaults to today (optional).
+
+        Returns:
+            List of ("%Y-%m-%d" date, completions) tuples, one per day. Empty if there is no such habit.
+        """
+        last_day = day_number(int(datetime.now().timestamp()) if end is None else to_timestamp(end))
+        first_day = last_day - 364 if start is None else day_number(to_timestamp(start))
+        with self._lock:
+            if task is not None and self.get_habit(task) is None:
+                return []
+            return self._ensure_rollups().heatmap(None if task is None else task.lower(), first_day, last_day)
+
+    def get_habit_stats(self, as_of=None, engine=None):
+        """
+        Computes the streaks, broken status and completion ratio of every habit at once.
+
+        Only completions up to as_of count. A habit is broken if a whole period passed after its
+        last completion without completing it, and its current streak is then 0. The completion
+        ratio is the share of its periods since its creation (or first completion, if earlier)
+        with at least one completion.
+
+        The NumPy engine keeps all completions in contiguous arrays, rebuilt on the first call
+        after a change, and gives exactly the same results as the pure-Python loop. The
+        "processes" engine runs the pure-Python loop on partitions of the habits in a pool of
+        analytics_workers processes, which read the histories from shared memory; it pays off
+        for large datasets on several cores.
+
+        Parameters:
+            - as_of (str, datetime or int): The time to compute the statistics at, defaults to now (optional).
+            - engine (str): "numpy", "python" or "processes"; defaults to NumPy when it is installed (optional).
+
+        Returns:
+            dict: Columns keyed by name ("task", "streak", "longest_streak", "broken", "hits",
+            "expected" and "ratio"), each a sequence with one entry per habit in creation order.
+        """
+        as_of = int(datetime.now().timestamp()) if as_of is None else to_timestamp(as_of)
+        engine = self._stats_engine(engine)
+        if engine == "processes":
+            return self._parallel_stats(as_of)
+        with self._lock:
+            if engine == "numpy":
+                if self._vectors is None:
+                    self._vectors = VectorEngine(list(self.habits.values()), PERIOD_DAYS)
+                vectors = self._vectors
+            else:
+                return self._habit_stats(as_of)
+        return vectors.stats(as_of)
+
+    def replay_stats(self, times):
+        """
+        Computes the statistics of every habit as they were at each of a series of times, e.g.
+        for backtesting or reports over years of history.
+
+        The completions are replayed once in time order, instead of recomputing every habit's
+        history for each time, and the habits are left untouched. Each snapshot equals
+        get_habit_stats(as_of=time).
+
+        Parameters:
+            - times (iterable): Times (str, datetime or int) in ascending order.
+
+        Returns:
+            Iterator of (timestamp, columns) tuples, with the columns of get_habit_stats.
+        """
+        with self._lock:
+            engine = ReplayEngine(list(self.habits.values()), PERIOD_DAYS)
+        return engine.snapshots(to_timestamp(value) for value in times)
+
+    def get_period_snapshots(self, start, end, periodicity="daily"):
+        """
+        Computes the statistics of every habit at the end of each day or week between two
+        times, see replay_stats.
+
+        Parameters:
+            - start (str, datetime or int): A time in the first period.
+            - end (str, datetime or int): A time in the last period.
+            - periodicity (str): "daily" or "weekly" (optional).
+
+        Returns:
+            Iterator of (timestamp, columns) tuples, one per period, taken at its last second.
+        """
+        first, last = period_index(to_timestamp(start), periodicity), period_index(to_timestamp(end), periodicity)
+        return self.replay_stats(period_start(index + 1, periodicity) - 1 for index in range(first, last + 1))
+
+    def get_stats_summary(self, as_of=None, n=10, engine=None):
+        """
+        Sums up the statistics of all habits: how many there are, which are broken, the longest
+        streaks and the overall completion ratio.
+
+        With the "processes" engine every worker reduces its own partition and only the partial
+        summaries are merged, instead of sending every habit's statistics back.
+
+        Parameters:
+            - as_of (str, datetime or int): The time to compute the statistics at, defaults to now (optional).
+            - n (int): The number of longest streaks to return (optional).
+            - engine (str): "numpy", "python" or "processes", see get_habit_stats (optional).
+
+        Returns:
+            dict: "habits" (count), "broken" (tasks in creation order), "top_streaks" ((task,
+            longest streak) pairs, longest first and ties in creation order), "hits", "expected"
+            and "ratio" (hits / expected over all habits).
+        """
+        if self._stats_engine(engine) == "processes":
+            as_of = int(datetime.now().timestamp()) if as_of is None else to_timestamp(as_of)
+            return self._parallel_stats(as_of, n)
+        return summarize_stats(self.get_habit_stats(as_of, engine), n)
+
+    @staticmethod
+    def _stats_engine(engine):
+        """
+        Checks the name of an analytics engine, picking the default for None.
+        """
+        if engine is None:
+            engine = "python" if np is None else "numpy"
+        if engine not in ("numpy", "python", "processes"):
+            raise ValueError(f"Unknown analytics engine {engine!r}, expected 'numpy', 'python' or 'processes'")
+        return engine
+
+    def _parallel_stats(self, as_of, top=None):
+        """
+        Computes get_habit_stats, or the summary of get_stats_summary, in the analytics worker processes.
+
+        The histories are copied into shared memory while holding the tracker's lock, and the
+        workers run after releasing it.
+        """
+        with self._lock:
+            habits = list(self.habits.values())
+            executor = self._analytics_pool()
+            shared = SharedHistories(habits)
+        try:
+            partitions = (self.analytics_workers or os.cpu_count()) * PARTITIONS_PER_WORKER
+            return parallel_stats(executor, [habit.task for habit in habits], shared, as_of, partitions, top)
+        finally:
+            shared.close()
+
+    def _analytics_pool(self):
+        """
+        Returns the pool of analytics worker processes, starting it on first use. Must be called
+        holding the lock.
+        """
+        if self._executor is None:
+            self._executor = create_pool(self.analytics_workers)
+        return self._executor
+
+    def _habit_stats(self, as_of):
+        """
+        Computes get_habit_stats one habit at a time, in pure Python.
+
+        Parameters:
+            - as_of (int): Seconds since the epoch.
+
+        Returns:
+            dict: The columns, see get_habit_stats.
+        """
+        columns = {name: [] for name in STATS_COLUMNS}
+        for habit in self.habits.values():
+            values = habit_stats(habit.periodicity, habit.created_at, habit.completed_at, as_of)
+            for name, value in zip(STATS_COLUMNS, (habit.task,) + values):
+                columns[name].append(value)
+        return columns
+
+
+class HabitSnapshot(HabitTracker):
+    def __init__(self, tracker, habits, version):
+        """
+        Initializes a HabitSnapshot, a read-only view of a tracker's habits at one point in time,
+        see HabitTracker.snapshot.
+
+        Queries, statistics and rollups work as on the tracker, with indexes of their own built on
+        first use. Anything that would change the habits raises ValueError.
+
+        Parameters:
+            - tracker (HabitTracker): The tracker the snapshot was taken from.
+            - habits (SnapshotHabits): The copied habits.
+            - version (int): The number of the snapshot; later snapshots have higher numbers.
+        """
+        self.data_file = tracker.data_file
+        self.storage = None
+        self.hot_days = None
+        self._init_state()
+        self.habits = habits
+        self.version = version
+        self.analytics_workers = tracker.analytics_workers
+        self._tracker = tracker
+        self._writer = None
+
+    def _read_only(self, *args, **kwargs):
+        raise ValueError("Snapshots are read-only; make changes through the tracker.")
+
+    load_data = save_data = archive_history = sync = compact = enable_metrics = subscribe = _read_only
+    batch = reset_data = create_habit = delete_habit = complete_task = create_habits = complete_tasks = _read_only
+    import_habits = _read_only
+
+    def close(self):
+        """
+        Does nothing: the analytics worker processes belong to the tracker.
+        """
+
+    def get_broken_habits(self, as_of=None):
+        """
+        Retrieves the habits whose deadline has passed, in the order their deadlines passed.
+
+        Unlike HabitTracker.get_broken_habits, their streaks are left as they are.
+
+        Parameters:
+            - as_of (str, datetime or int): Find the habits that were broken at this time instead of now (optional).
+
+        Returns:
+            List of broken habits.
+        """
+        if as_of is not None:
+            return super().get_broken_habits(as_of)
+        now = datetime.now().timestamp()
+        broken = []
+        for key, habit in self.habits.items():
+            deadline = self._deadline(habit)
+            if deadline is not None and deadline <= now:
+                broken.append((deadline, key))
+        broken.sort()
+        return [self.habits[key] for _, key in broken]
+
+    def _analytics_pool(self):
+        with self._tracker._lock:
+            return self._tracker._analytics_pool()
 
 
 class Analytics:
@@ -159,6 +1668,8 @@ class Analytics:
             - habit_tracker (HabitTracker): The HabitTracker instance to perform analytics on.
         """
         self.habit_tracker = habit_tracker
+        if habit_tracker._metrics is not None:
+            instrument(self, ANALYTICS_METHODS, habit_tracker._metrics, "Analytics.")
 
     def get_all_tracked_habits(self):
         """
@@ -181,6 +1692,98 @@ class Analytics:
         """
         return self.habit_tracker.get_habits_by_periodicity(periodicity)
 
+    def get_habit_stats(self, as_of=None, engine=None):
+        """
+        Computes the streaks, broken status and completion ratio of every habit at once, see
+        HabitTracker.get_habit_stats.
+
+        Returns:
+            dict: Columns keyed by name, each with one entry per habit.
+        """
+        return self.habit_tracker.get_habit_stats(as_of, engine)
+
+    def get_stats_summary(self, as_of=None, n=10, engine=None):
+        """
+        Sums up the statistics of all habits, see HabitTracker.get_stats_summary.
+
+        Example:
+            # Full-population pass on all cores
+            summary = analytics.get_stats_summary(engine="processes")
+
+        Returns:
+            dict: The number of habits, broken habits, longest streaks and overall completion ratio.
+        """
+        return self.habit_tracker.get_stats_summary(as_of, n, engine)
+
+    def get_rollups(self, task, granularity="week", start=None, end=None):
+        """
+        Summarizes a habit per day, ISO week or month, see HabitTracker.get_rollups.
+
+        Example:
+            # Completion rate per week over the last year
+            for week in analytics.get_rollups("Reading", "week", start=datetime.now() - timedelta(days=365)):
+                rate = week["hits"] / week["expected"] if week["expected"] else None
+
+        Returns:
+            List of dicts with the bucket label and its completions, expected, hit and missed periods.
+        """
+        return self.habit_tracker.get_rollups(task, granularity, start, end)
+
+    def get_heatmap(self, task=None, start=None, end=None):
+        """
+        Counts completions per day for a calendar heatmap, see HabitTracker.get_heatmap.
+
+        Returns:
+            List of ("%Y-%m-%d" date, completions) tuples, one per day.
+        """
+        return self.habit_tracker.get_heatmap(task, start, end)
+
+    def rebuild_rollups(self):
+        """
+        Rebuilds the completion rollups from the completion histories, see HabitTracker.rebuild_rollups.
+
+        Returns:
+            int: The number of habits with completions.
+        """
+        return self.habit_tracker.rebuild_rollups()
+
+    def export_rollups(self, path, granularity="week", start=None, end=None, format=None):
+        """
+        Writes the rollups of every habit to an NDJSON or CSV file, one row per habit and bucket.
+
+        Parameters:
+            - path (str): The file to write; .ndjson and .jsonl files are NDJSON, .csv files CSV.
+            - granularity (str): "day", "week" or "month" (optional).
+            - start (str, datetime or int): A time in the first bucket, see get_rollups (optional).
+            - end (str, datetime or int): A time in the last bucket, defaults to now (optional).
+            - format (str): "ndjson" or "csv", overriding the file extension (optional).
+
+        Returns:
+            int: The number of rows written.
+        """
+        def rows():
+            for habit in self.get_all_tracked_habits():
+                for bucket in self.get_rollups(habit.task, granularity, start, end):
+                    yield dict(bucket, task=habit.task)
+
+        return write_rows(path, rows(), format, ROLLUP_COLUMNS)
+
+    def query(self, periodicity=None, created_between=None, last_completed_before=None, min_streak=None,
+              order_by=None, descending=False, limit=None, offset=0):
+        """
+        Finds habits matching all the given filters, see HabitTracker.query.
+
+        Example:
+            # The ten longest current streaks among daily habits not completed in 2024 yet
+            analytics.query(periodicity="daily", last_completed_before="2024-01-01 00:00:00",
+                            order_by="streak", descending=True, limit=10)
+
+        Returns:
+            Iterator of matching habits, produced lazily.
+        """
+        return self.habit_tracker.query(periodicity, created_between, last_completed_before, min_streak,
+                                        order_by, descending, limit, offset)
+
     def get_longest_run_streak_all(self):
         """
         Retrieves the longest run streak across all habits.
@@ -190,14 +1793,41 @@ class Analytics:
         """
         return self.habit_tracker.get_longest_run_streak_all()
 
-    def get_broken_habits(self):
+    def get_broken_habits(self, as_of=None):
         """
-        Retrieves habits that are considered broken (not completed within the expected timeframe).
+        Retrieves habits that are considered broken (not completed within the expected timeframe),
+        now or at a past time, see HabitTracker.get_broken_habits.
 
         Returns:
             List of broken habits.
         """
-        return self.habit_tracker.get_broken_habits()
+        return self.habit_tracker.get_broken_habits(as_of)
+
+    def replay_stats(self, times):
+        """
+        Computes the statistics of every habit at each of a series of past times in one pass,
+        see HabitTracker.replay_stats.
+
+        Returns:
+            Iterator of (timestamp, columns) tuples.
+        """
+        return self.habit_tracker.replay_stats(times)
+
+    def get_period_snapshots(self, start, end, periodicity="daily"):
+        """
+        Computes the statistics of every habit at the end of each day or week between two times,
+        see HabitTracker.get_period_snapshots.
+
+        Example:
+            # Broken habits at the end of every week of 2023
+            for timestamp, stats in analytics.get_period_snapshots("2023-01-02 00:00:00", "2023-12-31 00:00:00",
+                                                                   "weekly"):
+                broken = [task for task, flag in zip(stats["task"], stats["broken"]) if flag]
+
+        Returns:
+            Iterator of (timestamp, columns) tuples, one per period.
+        """
+        return self.habit_tracker.get_period_snapshots(start, end, periodicity)
 
 
 # Example Usage
@@ -205,27 +1835,30 @@ if __name__ == "__main__":
     tracker = HabitTracker()
 
     # Create habits
-    tracker.create_habit("Exercise", "daily")
-    tracker.create_habit("Reading", "daily")
-    tracker.create_habit("Meditation", "daily")
-    tracker.create_habit("Running", "weekly")
-    tracker.create_habit("Coding", "weekly")
-
-    # Simulate completing tasks
-    tracker.complete_task("Exercise")
-    tracker.complete_task("Reading")
-    tracker.complete_task("Meditation")
-    tracker.complete_task("Running")
-    tracker.complete_task("Coding")
-
-    # Simulate completing tasks for 4 weeks
-    for _ in range(4):
+    tracker.create_habits([
+        ("Exercise", "daily"),
+        ("Reading", "daily"),
+        ("Meditation", "daily"),
+        ("Running", "weekly"),
+        ("Coding", "weekly"),
+    ])
+
+    # Simulate completing tasks, saving once at the end
+    with tracker.batch():
         tracker.complete_task("Exercise")
         tracker.complete_task("Reading")
         tracker.complete_task("Meditation")
         tracker.complete_task("Running")
         tracker.complete_task("Coding")
 
+        # Simulate completing tasks for 4 weeks
+        for _ in range(4):
+            tracker.complete_task("Exercise")
+            tracker.complete_task("Reading")
+            tracker.complete_task("Meditation")
+            tracker.complete_task("Running")
+            tracker.complete_task("Coding")
+
     # Print habits
     print("All Habits:")
     for habit in tracker.get_all_habits():
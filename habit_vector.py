@@ -0,0 +1,176 @@
+import time
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without NumPy, analytics use the pure-Python path
+    np = None
+
+# Columns of the per-habit statistics, in order
+STATS_COLUMNS = ("task", "streak", "longest_streak", "broken", "hits", "expected", "ratio")
+
+# Ordinal of 1970-01-01, the day epoch day 0 falls on
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+SECONDS_PER_DAY = 86400
+
+
+def utc_offset(timestamp):
+    """
+    Returns the local UTC offset in effect at a timestamp.
+
+    Parameters:
+        - timestamp (int): Seconds since the epoch.
+
+    Returns:
+        int: The offset in seconds.
+    """
+    return time.localtime(timestamp).tm_gmtoff
+
+
+def local_days(timestamps):
+    """
+    Numbers the local days timestamps fall in, like date.fromtimestamp(timestamp).toordinal().
+
+    The UTC offset only changes at daylight saving transitions, so it is looked up once per day
+    of the covered range, and transitions are located to the second by bisection. This assumes
+    at most one transition per day.
+
+    Parameters:
+        - timestamps (ndarray): Seconds since the epoch, as int64.
+
+    Returns:
+        ndarray: The day ordinals, as int64.
+    """
+    if not len(timestamps):
+        return np.zeros(0, dtype=np.int64)
+    low, high = int(timestamps.min()), int(timestamps.max())
+    edges, offsets = [low], [utc_offset(low)]
+    current = low
+    while current < high:
+        following = min(current + SECONDS_PER_DAY, high)
+        offset = utc_offset(following)
+        if offset != offsets[-1]:
+            before, after = current, following
+            while after - before > 1:
+                middle = (before + after) // 2
+                if utc_offset(middle) == offsets[-1]:
+                    before = middle
+                else:
+                    after = middle
+            edges.append(after)
+            offsets.append(offset)
+        current = following
+    if len(offsets) == 1:
+        shifted = timestamps + offsets[0]
+    else:
+        shifted = timestamps + np.array(offsets, dtype=np.int64)[np.searchsorted(edges, timestamps, "right") - 1]
+    return shifted // SECONDS_PER_DAY + EPOCH_ORDINAL
+
+
+def history_array(history):
+    """
+    Views a completion history as an int64 array, without copying it where possible.
+
+    Parameters:
+        - history (array or LazyHistory): Sorted completion timestamps.
+
+    Returns:
+        ndarray: The timestamps.
+    """
+    if not len(history):
+        return np.zeros(0, dtype=np.int64)
+    if hasattr(type(history), "raw"):
+        raw = history.raw()
+        if raw is not None:
+            # A history still in a binary snapshot is read without building an array('q')
+            return np.frombuffer(raw, dtype="<i8")
+        history = history.load()
+    return np.frombuffer(history, dtype=np.int64)
+
+
+class VectorEngine:
+    def __init__(self, habits, period_days):
+        """
+        Initializes a VectorEngine, which computes statistics for all habits at once.
+
+        All completions are converted once into contiguous arrays sorted by habit and time: one
+        entry per distinct period of each habit, with the habit id, the period number and the
+        first completion in the period (which decides whether the period counts as of a time).
+        Every statistic is then a handful of whole-array operations instead of a Python loop per
+        habit.
+
+        Parameters:
+            - habits (list): The habits, in the order of the results.
+            - period_days (dict): The length in days of each periodicity that can be broken.
+        """
+        if np is None:
+            raise ImportError("The vectorized analytics engine requires NumPy")
+        count = len(habits)
+        self.tasks = [habit.task for habit in habits]
+        self.lengths = np.array([period_days.get(habit.periodicity, 1) for habit in habits], dtype=np.int64)
+        self.breakable = np.array([habit.periodicity in period_days for habit in habits], dtype=bool)
+        self.created_days = local_days(np.array([habit.created_at for habit in habits], dtype=np.int64))
+        histories = [history_array(habit.completed_at) for habit in habits]
+        counts = np.array([len(history) for history in histories], dtype=np.int64)
+        timestamps = np.concatenate(histories) if histories else np.zeros(0, dtype=np.int64)
+        ids = np.repeat(np.arange(count, dtype=np.int32), counts)
+        periods = (local_days(timestamps) - 1) // self.lengths[ids]
+        distinct = np.ones(len(ids), dtype=bool)
+        distinct[1:] = (ids[1:] != ids[:-1]) | (periods[1:] != periods[:-1])
+        self.ids, self.periods, self.firsts = ids[distinct], periods[distinct], timestamps[distinct]
+        self.latest = int(self.firsts.max()) if len(self.firsts) else None
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def stats(self, as_of):
+        """
+        Computes the statistics of every habit from its completions up to a time.
+
+        Parameters:
+            - as_of (int): Seconds since the epoch; later completions are ignored.
+
+        Returns:
+            dict: The columns of STATS_COLUMNS, each with one entry per habit.
+        """
+        count = len(self.tasks)
+        ids, periods = self.ids, self.periods
+        if self.latest is not None and self.latest > as_of:
+            keep = self.firsts <= as_of
+            ids, periods = ids[keep], periods[keep]
+        new_habit = np.ones(len(ids), dtype=bool)
+        new_habit[1:] = ids[1:] != ids[:-1]
+
+        # Runs of consecutive periods; a habit's first period always starts a run
+        run_start = new_habit.copy()
+        run_start[1:] |= periods[1:] != periods[:-1] + 1
+        runs = np.flatnonzero(run_start)
+        run_lengths = np.diff(np.append(runs, len(periods)))
+        first_runs = np.flatnonzero(new_habit[runs])
+        completed = ids[runs[first_runs]]
+        last_runs = np.append(first_runs[1:], len(runs)) - 1
+        firsts = np.flatnonzero(new_habit)
+        lasts = np.append(firsts[1:], len(periods)) - 1
+
+        streak = np.zeros(count, dtype=np.int64)
+        longest = np.zeros(count, dtype=np.int64)
+        first_period = np.zeros(count, dtype=np.int64)
+        last_period = np.zeros(count, dtype=np.int64)
+        has_completions = np.zeros(count, dtype=bool)
+        if len(runs):
+            streak[completed] = run_lengths[last_runs]
+            longest[completed] = np.maximum.reduceat(run_lengths, first_runs)
+            first_period[completed] = periods[firsts]
+            last_period[completed] = periods[lasts]
+            has_completions[completed] = True
+        hits = np.bincount(ids, minlength=count)
+
+        current_period = (date.fromtimestamp(as_of).toordinal() - 1) // self.lengths
+        broken = has_completions & self.breakable & (current_period >= last_period + 2)
+        start_period = (self.created_days - 1) // self.lengths
+        start_period = np.where(has_completions, np.minimum(start_period, first_period), start_period)
+        expected = np.maximum(current_period - start_period + 1, 0)
+        ratio = np.divide(hits, expected, out=np.zeros(count), where=expected > 0)
+        return {"task": self.tasks, "streak": np.where(broken, 0, streak), "longest_streak": longest,
+                "broken": broken, "hits": hits, "expected": expected, "ratio": ratio}
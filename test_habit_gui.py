@@ -0,0 +1,78 @@
+import unittest
+import os
+from habit_tracker import HabitTracker
+from habit_gui import HabitListModel
+
+class TestHabitListModel(unittest.TestCase):
+    """
+    Unit tests for the model behind the virtualized habit list and the habit pickers.
+    """
+
+    def setUp(self):
+        """
+        Set up the test environment.
+
+        Creates a HabitTracker with a few habits and a HabitListModel over it.
+        """
+        self.data_file = "test_habit_data.json"
+        self.tracker = HabitTracker(data_file=self.data_file)
+        self.tracker.create_habits([("Reading", "daily"), ("Running", "weekly"), ("Coding", "daily")])
+        self.model = HabitListModel(self.tracker)
+
+    def tearDown(self):
+        """
+        Clean up the test environment.
+
+        Removes the temporary data file created during testing.
+        """
+        for path in (self.data_file, self.data_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_rows_follow_sorting_and_changes(self):
+        """
+        Test the display order of the habit list.
+
+        Verifies that rows are sliced in sort order and that creates, completions and deletes
+        are patched into place.
+        """
+        self.assertEqual([habit.task for habit in self.model.rows(0, 2)], ["Coding", "Reading"])
+
+        self.model.sort("streak")
+        self.model.sort("streak")
+        self.tracker.complete_task("Running")
+        self.model.update("running")
+        self.tracker.create_habit("Writing", "daily")
+        self.model.add("writing")
+        self.assertEqual([habit.task for habit in self.model.rows(0, 2)], ["Running", "Writing"])
+        self.assertEqual([habit.task for habit in self.model.rows(3, 15)], ["Coding"])
+
+        self.tracker.delete_habit("Running")
+        self.model.remove("running")
+        self.assertEqual(len(self.model), 3)
+        self.assertEqual(self.model.rows(0, 1)[0].task, "Writing")
+
+    def test_match_by_prefix(self):
+        """
+        Test the habit picker suggestions.
+
+        Verifies that names are matched by prefix, ignoring case, up to the limit.
+        """
+        self.assertEqual(self.model.match("r"), ["Reading", "Running"])
+        self.assertEqual(self.model.match("RU"), ["Running"])
+        self.assertEqual(self.model.match("", limit=2), ["Coding", "Reading"])
+        self.assertEqual(self.model.match("x"), [])
+
+    def test_habits_gone_before_rebuild(self):
+        """
+        Test serving rows after the tracker lost habits the model still lists.
+
+        Verifies that rows and matches skip habits removed behind the model's back, e.g. by a
+        reload, instead of raising KeyError.
+        """
+        del self.tracker.habits["reading"]
+        self.assertEqual([habit.task for habit in self.model.rows(0, 3)], ["Coding", "Running"])
+        self.assertEqual(self.model.match("r"), ["Running"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import os
+import shutil
+import threading
+from unittest import mock
+from habit_pool import TrackerPool
+
+class TestTrackerPool(unittest.TestCase):
+    """
+    Unit tests for the pool of per-user trackers.
+    """
+
+    def setUp(self):
+        """
+        Set up the test environment.
+
+        Creates a TrackerPool over a temporary directory that keeps at most two trackers.
+        """
+        self.directory = "test_habit_pool"
+        self.pool = TrackerPool(self.directory, max_trackers=2, journal=True)
+
+    def tearDown(self):
+        """
+        Clean up the test environment.
+
+        Closes the pool and removes the temporary directory created during testing.
+        """
+        self.pool.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_trackers_are_sharded_and_evicted(self):
+        """
+        Test routing users to their trackers.
+
+        Verifies that every user gets a data file in a shard directory, that the least recently
+        used tracker not in use is evicted with its journal compacted, and that an evicted user's
+        habits are loaded again.
+        """
+        for user_id in ("alice", "bob", "carol/eve"):
+            with self.pool.tracker(user_id) as tracker:
+                tracker.create_habit("Reading", "daily")
+                tracker.complete_task("Reading", custom_completed_at="2023-12-01 08:00:00")
+            self.assertTrue(os.path.dirname(self.pool.data_file(user_id)).startswith(self.directory))
+        self.assertEqual(len(self.pool), 2)
+        self.assertEqual(sorted(self.pool.users()), ["alice", "bob", "carol/eve"])
+        journal_file = self.pool.data_file("alice") + ".journal"
+        self.assertFalse(os.path.exists(journal_file) and os.path.getsize(journal_file))
+
+        with self.pool.tracker("bob") as bob:
+            with self.pool.tracker("alice") as alice:
+                with self.pool.tracker("dave"):
+                    self.assertEqual(len(self.pool), 3)  # All pinned, so nothing can be evicted
+                self.assertEqual(len(alice.get_habit("Reading").completed_at), 1)
+            bob.create_habit("Running", "weekly")
+        self.assertEqual(len(self.pool), 2)
+        self.assertEqual(self.pool.resident_bytes, sum(400 + 8 * len(habit.completed_at)
+                                                       for habit in alice.get_all_habits() + bob.get_all_habits()))
+
+    def test_slow_load_does_not_block_other_users(self):
+        """
+        Test loading a tracker while other users are served.
+
+        Verifies that a slow cold load doesn't hold up lookups of other users, and that a second
+        request for the user being loaded waits for that load instead of loading again.
+        """
+        with self.pool.tracker("alice") as tracker:
+            tracker.create_habit("Reading", "daily")
+        load = self.pool._load
+        loading, release = threading.Event(), threading.Event()
+        loads = []
+
+        def slow_load(user_id):
+            loads.append(user_id)
+            loading.set()
+            release.wait(5)
+            return load(user_id)
+
+        def lookup(user_id, results):
+            with self.pool.tracker(user_id) as tracker:
+                results.append(tracker)
+
+        bob, alice = [], []
+        with mock.patch.object(self.pool, "_load", slow_load):
+            threads = [threading.Thread(target=lookup, args=("bob", bob), daemon=True) for _ in range(2)]
+            threads[0].start()
+            self.assertTrue(loading.wait(5))
+            threads[1].start()
+            hot = threading.Thread(target=lookup, args=("alice", alice), daemon=True)
+            hot.start()
+            hot.join(5)
+            self.assertFalse(hot.is_alive())
+            self.assertEqual(bob, [])
+            release.set()
+            for thread in threads:
+                thread.join(5)
+        self.assertEqual(loads, ["bob"])
+        self.assertIs(bob[0], bob[1])
+        self.assertEqual(len(alice[0].get_all_habits()), 1)
+
+    def test_byte_limit_and_aggregates(self):
+        """
+        Test bounding the pool by size and querying all users.
+
+        Verifies that trackers are evicted once their estimated size exceeds max_bytes, and that
+        map_users and get_broken_habits visit every user without making them resident.
+        """
+        self.pool.max_trackers, self.pool.max_bytes = 10, 1000
+        for number in range(4):
+            with self.pool.tracker(f"user{number}") as tracker:
+                tracker.create_habits([("Reading", "daily"), ("Running", "weekly")])
+                tracker.complete_task("Reading", custom_completed_at="2023-12-01 08:00:00")
+                tracker.complete_task("Reading", custom_completed_at="2023-12-02 08:00:00")
+        self.assertEqual(len(self.pool), 1)
+        self.assertLessEqual(self.pool.resident_bytes, 1000)
+
+        counts = dict(self.pool.map_users(lambda tracker: len(tracker.get_all_habits())))
+        self.assertEqual(counts, {f"user{number}": 2 for number in range(4)})
+        self.assertEqual(len(self.pool), 1)
+        broken = dict(self.pool.get_broken_habits())
+        self.assertEqual(sorted(broken), [f"user{number}" for number in range(4)])
+        self.assertEqual([habit.task for habit in broken["user0"]], ["Reading"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import asyncio
+import json
+import os
+from unittest import mock
+from habit_tracker import HabitTracker
+from habit_service import HabitService
+
+async def call(port, method, path, payload=None):
+    """
+    Sends one request to a local service on a new connection.
+
+    Returns:
+        tuple: The status code and the parsed JSON body.
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+                 .encode("latin-1") + body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+class TestHabitService(unittest.TestCase):
+    """
+    Unit tests for the HTTP/JSON service.
+    """
+
+    def setUp(self):
+        """
+        Set up the test environment.
+
+        Creates a HabitTracker in journal and write-behind mode backed by a temporary data file.
+        """
+        self.data_file = "test_habit_data.json"
+        self.tracker = HabitTracker(data_file=self.data_file, journal=True, write_behind=True, flush_delay=60)
+
+    def tearDown(self):
+        """
+        Clean up the test environment.
+
+        Closes the tracker and removes the temporary files created during testing.
+        """
+        self.tracker.close()
+        for path in (self.data_file, self.data_file + ".journal", self.data_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def serve(self, scenario):
+        """
+        Runs a scenario against a service listening on a free port.
+        """
+        async def run():
+            # A generous window, so concurrent requests land in one batch even on a slow machine
+            server = await HabitService(self.tracker, batch_window=0.05).start(port=0)
+            async with server:
+                return await scenario(server.sockets[0].getsockname()[1])
+        return asyncio.run(run())
+
+    def test_endpoints(self):
+        """
+        Test the endpoints over HTTP.
+
+        Verifies that habits are created, completed, listed, looked up and deleted, and that
+        invalid requests get error statuses.
+        """
+        async def scenario(port):
+            self.assertEqual((await call(port, "POST", "/habits", {"task": "Morning Run", "periodicity": "daily"}))[0], 201)
+            self.assertEqual((await call(port, "POST", "/habits", {"task": "morning run", "periodicity": "daily"}))[0], 409)
+            self.assertEqual((await call(port, "POST", "/habits", {"task": "Reading", "periodicity": "hourly"}))[0], 400)
+            status, habit = await call(port, "POST", "/habits/Morning%20Run/complete",
+                                       {"completed_at": "2023-12-01 08:00:00"})
+            self.assertEqual((status, habit["completions"], habit["last_completed"]), (200, 1, "2023-12-01 08:00:00"))
+            self.assertEqual((await call(port, "POST", "/habits/Morning%20Run/complete", {"completed_at": "soon"}))[0], 400)
+            self.assertEqual((await call(port, "POST", "/habits/Missing/complete"))[0], 404)
+            self.assertEqual(await call(port, "GET", "/habits/Morning%20Run/streak"),
+                             (200, {"task": "Morning Run", "streak": 1, "longest_streak": 1}))
+            self.assertEqual((await call(port, "GET", "/habits/Morning%20Run"))[1]["completed_at"], ["2023-12-01 08:00:00"])
+            self.assertEqual([habit["task"] for habit in (await call(port, "GET", "/habits?periodicity=daily"))[1]],
+                             ["Morning Run"])
+            self.assertEqual([habit["task"] for habit in (await call(port, "GET", "/broken"))[1]], ["Morning Run"])
+            self.assertEqual((await call(port, "PUT", "/habits"))[0], 405)
+            self.assertEqual((await call(port, "GET", "/nowhere"))[0], 404)
+            self.assertEqual((await call(port, "DELETE", "/habits/Morning%20Run"))[0], 200)
+            self.assertEqual(await call(port, "GET", "/habits"), (200, []))
+
+        self.serve(scenario)
+
+    def test_writes_are_persisted_in_batches(self):
+        """
+        Test concurrent writes.
+
+        Verifies that writes arriving together are persisted with one journal append.
+        """
+        self.tracker.create_habit("Reading", "daily")
+        self.tracker.flush()
+
+        async def scenario(port):
+            with mock.patch.object(self.tracker.storage, "append", wraps=self.tracker.storage.append) as append:
+                results = await asyncio.gather(*(call(port, "POST", "/habits/Reading/complete",
+                                                      {"completed_at": f"2023-12-{day:02d} 08:00:00"})
+                                                 for day in range(1, 21)))
+                self.assertEqual(append.call_count, 1)
+            self.assertEqual({status for status, _ in results}, {200})
+
+        self.serve(scenario)
+        self.assertEqual(len(HabitTracker(data_file=self.data_file, journal=True).get_habit("Reading").completed_at), 20)
+
+if __name__ == "__main__":
+    unittest.main()
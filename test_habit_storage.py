@@ -0,0 +1,315 @@
+import unittest
+import multiprocessing
+import os
+from datetime import datetime, timedelta
+from habit_tracker import HabitTracker
+from habit_storage import BinaryStorage, LazyHistory, SqliteStorage, migrate_json_to_sqlite, to_timestamp
+
+def complete_in_process(data_file, journal, worker, count, compact_every=0):
+    """
+    Completes the shared habit count times from a separate process, at times no other worker uses.
+
+    Parameters:
+        - data_file (str): The data file shared by all workers.
+        - journal (bool): Whether to use journal mode.
+        - worker (int): The worker number.
+        - count (int): The number of completions.
+        - compact_every (int): Compact the journal after this many completions, 0 for never (optional).
+    """
+    tracker = HabitTracker(data_file=data_file, journal=journal)
+    start = datetime(2023, 12, 1) + timedelta(minutes=worker * count)
+    for number in range(count):
+        tracker.complete_task("Shared", custom_completed_at=(start + timedelta(minutes=number)).strftime("%Y-%m-%d %H:%M:%S"))
+        if compact_every and number % compact_every == compact_every - 1:
+            tracker.compact()
+    tracker.close()
+
+class TestSqliteStorage(unittest.TestCase):
+    """
+    Unit tests for the SQLite storage backend.
+    """
+
+    def setUp(self):
+        """
+        Set up the test environment.
+
+        Creates a HabitTracker backed by a temporary SQLite database.
+        """
+        self.data_file = "test_habit_data.db"
+        self.json_file = "test_habit_data.json"
+        self.tracker = HabitTracker(data_file=self.data_file)
+
+    def tearDown(self):
+        """
+        Clean up the test environment.
+
+        Closes the database and removes the temporary files created during testing.
+        """
+        self.tracker.close()
+        for path in (self.data_file, self.data_file + "-wal", self.data_file + "-shm", self.data_file + ".lock",
+                     self.json_file, self.json_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_mutations_are_persisted(self):
+        """
+        Test persisting mutations to SQLite.
+
+        Verifies that creates, completions, deletes and batches survive reopening the database.
+        """
+        self.tracker.create_habit("TestHabit1", "daily")
+        self.tracker.create_habit("TestHabit2", "weekly")
+        with self.tracker.batch():
+            self.tracker.complete_task("TestHabit1", custom_completed_at="2023-12-01 08:00:00")
+            self.tracker.complete_task("TestHabit1", custom_completed_at="2023-12-02 08:00:00")
+            self.tracker.delete_habit("TestHabit2")
+
+        reopened = HabitTracker(data_file=self.data_file)
+        habits = reopened.get_all_habits()
+        reopened.close()
+        self.assertEqual([habit["task"] for habit in habits], ["TestHabit1"])
+        self.assertEqual(list(habits[0]["completed_at"]),
+                         [to_timestamp("2023-12-01 08:00:00"), to_timestamp("2023-12-02 08:00:00")])
+        self.assertEqual(habits[0]["longest_streak"], 2)
+
+    def test_indexed_queries(self):
+        """
+        Test the indexed SQL queries.
+
+        Verifies that periodicity, broken habit and streak queries of the tracker are answered by
+        SQLite with the tracker's own habits, and from memory while changes are not written yet.
+        """
+        self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly"), ("TestHabit3", "daily")])
+        self.tracker.complete_tasks([
+            ("TestHabit1", datetime.now() - timedelta(days=4)),
+            ("TestHabit1", datetime.now() - timedelta(days=3)),
+            ("TestHabit2", datetime.now() - timedelta(days=2)),
+            ("TestHabit3", datetime.now()),
+        ])
+
+        storage = self.tracker.storage
+        self.assertEqual(storage.get_habits_by_periodicity("daily"), ["testhabit1", "testhabit3"])
+        self.assertEqual(storage.get_broken_habits(), ["testhabit1"])
+        self.assertEqual(storage.get_top_streaks(2), [("testhabit1", 2), ("testhabit2", 1)])
+
+        self.assertEqual(self.tracker.get_habits_by_periodicity("daily"),
+                         [self.tracker.habits["testhabit1"], self.tracker.habits["testhabit3"]])
+        self.assertEqual(self.tracker.get_top_streaks(2), [("TestHabit1", 2), ("TestHabit2", 1)])
+        broken = self.tracker.get_broken_habits()
+        self.assertEqual(broken, [self.tracker.habits["testhabit1"]])
+        self.assertEqual(broken[0].streak, 0)
+
+        with self.tracker.batch():
+            self.tracker.create_habit("TestHabit4", "daily")
+            self.assertEqual(len(self.tracker.get_habits_by_periodicity("daily")), 3)
+        self.assertEqual(len(self.tracker.get_habits_by_periodicity("daily")), 3)
+
+    def test_migrate_json_to_sqlite(self):
+        """
+        Test migrating a JSON data file to SQLite.
+
+        Verifies that every habit and completion is copied.
+        """
+        json_tracker = HabitTracker(data_file=self.json_file, journal=True)
+        json_tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly")])
+        json_tracker.complete_task("TestHabit2", custom_completed_at="2023-12-09 12:00:00")
+
+        self.assertEqual(migrate_json_to_sqlite(self.json_file, self.data_file), 2)
+        storage = SqliteStorage(self.data_file)
+        habits = storage.load()
+        storage.close()
+        self.assertEqual([habit["task"] for habit in habits], ["TestHabit1", "TestHabit2"])
+        self.assertEqual(list(habits[1]["completed_at"]), [to_timestamp("2023-12-09 12:00:00")])
+        os.remove(self.json_file + ".journal")
+
+class TestBinaryStorage(unittest.TestCase):
+    """
+    Unit tests for the memory-mapped binary snapshot storage.
+    """
+
+    def setUp(self):
+        """
+        Set up the test environment.
+
+        Creates a HabitTracker backed by a temporary binary snapshot in journal mode.
+        """
+        self.data_file = "test_habit_data.habits"
+        self.tracker = HabitTracker(data_file=self.data_file, journal=True)
+
+    def tearDown(self):
+        """
+        Clean up the test environment.
+
+        Removes the temporary files created during testing.
+        """
+        for path in (self.data_file, self.data_file + ".journal", self.data_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_snapshot_round_trip(self):
+        """
+        Test writing and reading a binary snapshot.
+
+        Verifies that habits, streaks and histories survive a compaction, including journaled
+        changes made on top of a snapshot.
+        """
+        self.assertIsInstance(self.tracker.storage, BinaryStorage)
+        self.tracker.create_habits([("TestHabit1", "daily"), ("Ünïcode", "weekly"), ("TestHabit3", "monthly")])
+        self.tracker.complete_tasks([("TestHabit1", "2023-12-01 08:00:00"), ("TestHabit1", "2023-12-02 08:00:00")])
+        self.tracker.compact()
+
+        reopened = HabitTracker(data_file=self.data_file, journal=True)
+        reopened.complete_task("TestHabit1", custom_completed_at="2023-12-03 08:00:00")
+        reopened.compact()
+
+        habits = HabitTracker(data_file=self.data_file).get_all_habits()
+        self.assertEqual([(habit.task, str(habit.periodicity)) for habit in habits],
+                         [("TestHabit1", "daily"), ("Ünïcode", "weekly"), ("TestHabit3", "monthly")])
+        self.assertEqual(list(habits[0].completed_at),
+                         [to_timestamp(f"2023-12-0{day} 08:00:00") for day in (1, 2, 3)])
+        self.assertEqual((habits[0].streak, habits[0].longest_streak), (3, 3))
+        self.assertEqual(len(habits[1].completed_at), 0)
+
+    def test_histories_are_paged_in_lazily(self):
+        """
+        Test lazy history loading.
+
+        Verifies that opening a snapshot reads no history, that deadlines only need the last
+        completion, and that a history is paged in when it is used.
+        """
+        self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "daily")])
+        self.tracker.complete_tasks([("TestHabit1", "2023-12-01 08:00:00"), ("TestHabit2", "2023-12-02 08:00:00")])
+        self.tracker.compact()
+
+        reopened = HabitTracker(data_file=self.data_file)
+        histories = [habit.completed_at for habit in reopened.get_all_habits()]
+        self.assertTrue(all(isinstance(history, LazyHistory) and history._array is None for history in histories))
+        self.assertEqual([habit.task for habit in reopened.get_broken_habits()], ["TestHabit1", "TestHabit2"])
+        self.assertIsNone(histories[0]._array)
+
+        self.assertEqual(list(histories[0]), [to_timestamp("2023-12-01 08:00:00")])
+        self.assertIsNotNone(histories[0]._array)
+        self.assertIsNone(histories[1]._array)
+
+    def test_habits_are_built_lazily(self):
+        """
+        Test opening a snapshot without building its habits.
+
+        Verifies that no habit is built on opening, that lookups, the broken habits and the top
+        streaks are answered from the table building only the habits they return, and that
+        habits changed, deleted or created again in memory take precedence over the table.
+        """
+        self.tracker.create_habits([("Stale", "daily"), ("Fresh", "daily"), ("Gone", "daily"), ("Never", "weekly")])
+        self.tracker.complete_tasks([("Stale", "2023-12-01 08:00:00"), ("Stale", "2023-12-02 08:00:00"),
+                                     ("Fresh", "2023-12-01 08:00:00"), ("Gone", "2023-11-01 08:00:00")])
+        self.tracker.compact()
+
+        reopened = HabitTracker(data_file=self.data_file, journal=True)
+        habits = reopened.habits
+        self.assertEqual(habits.loaded_items(), [])
+        self.assertEqual(len(habits), 4)
+        self.assertIn("never", habits)
+        self.assertNotIn("missing", habits)
+        self.assertEqual(reopened.get_top_streaks(1), [("Stale", 2)])
+        self.assertEqual([key for key, _ in habits.loaded_items()], ["stale"])
+
+        reopened.complete_task("Fresh", custom_completed_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        reopened.delete_habit("Gone")
+        reopened.create_habit("Gone", "weekly")
+        self.assertEqual([habit.task for habit in reopened.get_broken_habits()], ["Stale"])
+        self.assertEqual(reopened.get_habit("Stale").streak, 0)
+        self.assertEqual(reopened.get_top_streaks(2), [("Stale", 2), ("Fresh", 1)])
+        self.assertEqual([key for key, _ in habits.loaded_items()], ["stale", "fresh", "gone"])
+        self.assertEqual(list(habits), ["stale", "fresh", "never", "gone"])
+
+        reopened.compact()
+        self.assertEqual([habit.task for habit in HabitTracker(data_file=self.data_file).get_all_habits()],
+                         ["Stale", "Fresh", "Never", "Gone"])
+
+    def test_rejects_other_files(self):
+        """
+        Test opening a file that is not a binary snapshot.
+
+        Verifies that a ValueError is raised.
+        """
+        with open(self.data_file, "wb") as file:
+            file.write(b"not a snapshot" * 4)
+        with self.assertRaises(ValueError):
+            HabitTracker(data_file=self.data_file)
+
+class TestConcurrentAccess(unittest.TestCase):
+    """
+    Unit tests for several trackers and processes sharing one data file.
+    """
+
+    def setUp(self):
+        """
+        Set up the test environment.
+
+        Names a temporary data file shared by the trackers of a test.
+        """
+        self.data_file = "test_habit_data.json"
+
+    def tearDown(self):
+        """
+        Clean up the test environment.
+
+        Removes the temporary files created during testing.
+        """
+        for path in (self.data_file, self.data_file + ".journal", self.data_file + ".lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_sync_picks_up_other_trackers(self):
+        """
+        Test two trackers sharing a data file.
+
+        Verifies that sync applies the other tracker's journal records and reloads a rewritten
+        data file, and that whole-file saves merge instead of overwriting each other's changes.
+        """
+        for journal in (True, False):
+            first = HabitTracker(data_file=self.data_file, journal=journal)
+            second = HabitTracker(data_file=self.data_file, journal=journal)
+            first.create_habit("Reading", "daily")
+            self.assertIsNone(second.get_habit("Reading"))
+            self.assertTrue(second.sync())
+            self.assertFalse(second.sync())
+            second.complete_task("Reading", custom_completed_at="2023-12-01 08:00:00")
+            first.complete_task("Reading", custom_completed_at="2023-12-02 08:00:00")
+            self.assertEqual(len(first.get_habit("Reading").completed_at), 2)
+            first.compact()
+            second.create_habit("Running", "weekly")
+            for tracker in (first, second, HabitTracker(data_file=self.data_file)):
+                tracker.sync()
+                self.assertEqual(sorted(habit.task for habit in tracker.get_all_habits()), ["Reading", "Running"])
+                self.assertEqual(tracker.get_habit("Reading").longest_streak, 2)
+            first.close()
+            second.close()
+            self.tearDown()
+
+    def test_concurrent_processes_lose_no_completions(self):
+        """
+        Test several processes completing the same habit at once.
+
+        Verifies that every completion survives, in journal mode with one process compacting
+        the journal meanwhile and with whole-file saves.
+        """
+        context = multiprocessing.get_context("spawn")
+        workers, count = 4, 25
+        for journal in (True, False):
+            HabitTracker(data_file=self.data_file, journal=journal).create_habit("Shared", "daily")
+            processes = [context.Process(target=complete_in_process,
+                                         args=(self.data_file, journal, worker, count, 10 if worker == 0 else 0))
+                         for worker in range(workers)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+            habit = HabitTracker(data_file=self.data_file, journal=journal).get_habit("Shared")
+            self.assertEqual(len(habit.completed_at), workers * count)
+            self.assertEqual(len(set(habit.completed_at)), workers * count)
+            self.tearDown()
+
+if __name__ == "__main__":
+    unittest.main()
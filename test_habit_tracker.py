@@ -1,8 +1,14 @@
 import unittest
 import json
 import os
+import threading
+import time
+from unittest import mock
 from datetime import datetime, timedelta
-from habit_tracker import HabitTracker
+from habit_tracker import HabitTracker, Analytics
+from habit_model import Periodicity, format_timestamp
+from habit_storage import pack_timestamps, to_timestamp
+from habit_vector import np
 
 class TestHabitTracker(unittest.TestCase):
     """
@@ -26,8 +32,10 @@ class TestHabitTracker(unittest.TestCase):
 
         Removes the temporary data file created during testing.
         """
-        if os.path.exists(self.data_file):
-            os.remove(self.data_file)
+        for path in (self.data_file, self.data_file + ".journal", self.data_file + ".lock",
+                     self.data_file + ".archive"):
+            if os.path.exists(path):
+                os.remove(path)
 
     def test_create_habit(self):
         """
@@ -69,7 +77,7 @@ class TestHabitTracker(unittest.TestCase):
         Verifies that the correct longest run streak is returned for a specific habit.
         """
         self.tracker.create_habit("TestHabit", "daily")
-        self.tracker.complete_task("TestHabit")
+        self.tracker.complete_task("TestHabit", custom_completed_at=datetime.now() - timedelta(days=1))
         self.tracker.complete_task("TestHabit")
         streak = self.tracker.get_longest_run_streak_for_habit("TestHabit")
         self.assertEqual(streak, 2)
@@ -83,8 +91,8 @@ class TestHabitTracker(unittest.TestCase):
         self.tracker.create_habit("TestHabit1", "daily")
         self.tracker.create_habit("TestHabit2", "daily")
 
-        for _ in range(3):
-            self.tracker.complete_task("TestHabit1")
+        for days_ago in range(3):
+            self.tracker.complete_task("TestHabit1", custom_completed_at=datetime.now() - timedelta(days=days_ago))
 
         streak = self.tracker.get_longest_run_streak_all()
         self.assertEqual(streak, "TestHabit1: 3")
@@ -100,7 +108,7 @@ class TestHabitTracker(unittest.TestCase):
 
         # Simulate completing tasks
         self.tracker.complete_task("TestHabit1", custom_completed_at="2023-01-01 12:00:00")
-        self.tracker.complete_task("TestHabit2", custom_completed_at="2023-12-09 12:00:00")
+        self.tracker.complete_task("TestHabit2", custom_completed_at=datetime.now() - timedelta(days=2))
 
         # Simulate breaking habit streaks
         broken_habits = self.tracker.get_broken_habits()
@@ -122,5 +130,755 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(daily_habits[0]["task"], "TestHabit1")
         self.assertEqual(daily_habits[1]["task"], "TestHabit3")
 
+    def test_query_with_secondary_indexes(self):
+        """
+        Test querying habits through Analytics.
+
+        Verifies that filters, ordering and pagination give the same answers as a scan, and that
+        the indexes follow completions, deletes and rolled back batches.
+        """
+        analytics = Analytics(self.tracker)
+        self.tracker.create_habits([(f"TestHabit{number}", "daily" if number % 2 else "weekly") for number in range(10)])
+        for number in range(10):
+            for day in range(number % 4):
+                self.tracker.complete_task(f"TestHabit{number}", custom_completed_at=f"2023-12-0{day + 1} 08:00:00")
+
+        def tasks(habits):
+            return [habit.task for habit in habits]
+
+        habits = self.tracker.get_all_habits()
+        results = analytics.query(periodicity="daily", min_streak=2, order_by="streak", descending=True)
+        self.assertNotIsInstance(results, list)
+        expected = sorted((habit for habit in habits if habit.periodicity == "daily" and habit.streak >= 2),
+                          key=lambda habit: (habit.streak, habit.task.lower()), reverse=True)
+        self.assertEqual(tasks(results), tasks(expected))
+        self.assertEqual(sorted(tasks(analytics.query(last_completed_before="2023-12-02 00:00:00"))),
+                         tasks(habit for habit in habits if len(habit.completed_at) < 2))
+        self.assertEqual(tasks(analytics.query(order_by="created_at", offset=3, limit=4)),
+                         tasks(sorted(habits, key=lambda habit: (habit.created_at, habit.task.lower()))[3:7]))
+        self.assertEqual(tasks(analytics.query(min_streak=1, order_by="last_completed", offset=1, limit=2)),
+                         ["TestHabit5", "TestHabit9"])
+        with self.assertRaises(ValueError):
+            analytics.query(order_by="task")
+
+        self.tracker.complete_task("TestHabit0", custom_completed_at="2023-12-01 08:00:00")
+        self.tracker.delete_habit("TestHabit3")
+        with self.assertRaises(RuntimeError):
+            with self.tracker.batch():
+                self.tracker.complete_task("TestHabit4", custom_completed_at="2023-12-01 08:00:00")
+                raise RuntimeError("import failed")
+        self.assertEqual(tasks(analytics.query(min_streak=3)), ["TestHabit7"])
+        self.assertEqual(tasks(analytics.query(min_streak=1, order_by="last_completed", limit=2)),
+                         ["TestHabit0", "TestHabit1"])
+        self.assertEqual(tasks(analytics.get_habits_by_periodicity("daily")),
+                         ["TestHabit1", "TestHabit5", "TestHabit7", "TestHabit9"])
+
+    def test_completion_rollups(self):
+        """
+        Test the day, week and month rollups.
+
+        Verifies that completions, expected, hit and missed periods per bucket and the heatmap are
+        updated incrementally, match a rebuild, and follow deletes and rolled back batches.
+        """
+        analytics = Analytics(self.tracker)
+        self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly")])
+        self.tracker.complete_task("TestHabit1", custom_completed_at="2023-12-01 08:00:00")
+        self.assertEqual(analytics.get_heatmap(start="2023-12-01 00:00:00", end="2023-12-02 00:00:00"),
+                         [("2023-12-01", 1), ("2023-12-02", 0)])
+        for day in ("2023-12-02", "2023-12-04", "2023-12-04"):
+            self.tracker.complete_task("TestHabit1", custom_completed_at=f"{day} 08:00:00")
+        self.tracker.complete_tasks([("TestHabit2", "2023-11-28 08:00:00"), ("TestHabit2", "2023-12-05 08:00:00")])
+        with self.assertRaises(RuntimeError):
+            with self.tracker.batch():
+                self.tracker.complete_task("TestHabit1", custom_completed_at="2023-12-03 08:00:00")
+                raise RuntimeError("import failed")
+
+        weeks = analytics.get_rollups("TestHabit1", "week", "2023-11-27 00:00:00", "2023-12-10 00:00:00")
+        self.assertEqual(weeks, [
+            {"bucket": "2023-W48", "completions": 2, "expected": 3, "hits": 2, "misses": 1},
+            {"bucket": "2023-W49", "completions": 2, "expected": 7, "hits": 1, "misses": 6},
+        ])
+        months = analytics.get_rollups("TestHabit2", "month", "2023-11-01 00:00:00", "2023-12-31 00:00:00")
+        self.assertEqual([(month["bucket"], month["expected"], month["hits"]) for month in months],
+                         [("2023-11", 1, 1), ("2023-12", 4, 1)])
+        self.assertEqual(analytics.get_heatmap(start="2023-12-03 00:00:00", end="2023-12-05 00:00:00"),
+                         [("2023-12-03", 0), ("2023-12-04", 2), ("2023-12-05", 1)])
+        incremental = analytics.get_rollups("TestHabit1", "day")
+        self.assertEqual(analytics.rebuild_rollups(), 2)
+        self.assertEqual(analytics.get_rollups("TestHabit1", "day"), incremental)
+
+        self.tracker.delete_habit("TestHabit2")
+        self.assertEqual(analytics.get_heatmap(end="2023-12-05 00:00:00")[-1], ("2023-12-05", 0))
+        self.assertEqual(analytics.get_rollups("TestHabit2"), [])
+        with self.assertRaises(ValueError):
+            analytics.get_rollups("TestHabit1", "year")
+
+    def test_habit_stats(self):
+        """
+        Test computing statistics for all habits at once.
+
+        Verifies the streaks, broken status and completion ratios as of a given time.
+        """
+        self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly"), ("TestHabit3", "daily")])
+        for day in (1, 2, 3, 5, 6):
+            self.tracker.complete_task("TestHabit1", custom_completed_at=f"2023-12-0{day} 08:00:00")
+        self.tracker.complete_tasks([("TestHabit2", "2023-11-28 08:00:00"), ("TestHabit2", "2023-12-05 08:00:00")])
+
+        stats = Analytics(self.tracker).get_habit_stats(as_of="2023-12-06 12:00:00", engine="python")
+        self.assertEqual(stats["task"], ["TestHabit1", "TestHabit2", "TestHabit3"])
+        self.assertEqual(list(stats["streak"]), [2, 2, 0])
+        self.assertEqual(list(stats["longest_streak"]), [3, 2, 0])
+        self.assertEqual(list(stats["hits"]), [5, 2, 0])
+        self.assertEqual(list(stats["expected"]), [6, 2, 0])
+        later = self.tracker.get_habit_stats(as_of="2023-12-05 12:00:00", engine="python")
+        self.assertEqual((later["streak"][0], later["hits"][0], later["ratio"][0]), (1, 4, 0.8))
+        broken = self.tracker.get_habit_stats(as_of="2023-12-20 12:00:00", engine="python")
+        self.assertEqual(list(broken["broken"]), [True, True, False])
+        self.assertEqual(list(broken["streak"]), [0, 0, 0])
+
+    @unittest.skipIf(np is None, "NumPy is not installed")
+    def test_vectorized_habit_stats_match(self):
+        """
+        Test the NumPy analytics engine.
+
+        Verifies that it gives exactly the same statistics as the pure-Python path, before and
+        after further changes.
+        """
+        tasks = [(f"TestHabit{number}", ("daily", "weekly", "monthly")[number % 3]) for number in range(30)]
+        self.tracker.create_habits(tasks)
+        start = to_timestamp("2023-10-01 00:00:00")
+        with self.tracker.batch():
+            for number in range(600):
+                self.tracker.complete_task(f"TestHabit{number * 7 % 29}", start + (number * 7919) % (90 * 86400))
+
+        for as_of in ("2023-10-15 12:00:00", "2023-12-01 00:00:00", None):
+            expected = self.tracker.get_habit_stats(as_of, engine="python")
+            self.assertEqual({name: list(column) for name, column in self.tracker.get_habit_stats(as_of, engine="numpy").items()},
+                             expected)
+        self.tracker.delete_habit("TestHabit1")
+        self.tracker.complete_task("TestHabit2", custom_completed_at="2023-10-02 08:00:00")
+        self.assertEqual({name: list(column) for name, column in self.tracker.get_habit_stats(engine="numpy").items()},
+                         self.tracker.get_habit_stats(engine="python"))
+
+    def test_parallel_habit_stats_match(self):
+        """
+        Test the process pool analytics engine.
+
+        Verifies that partitions computed in worker processes merge into the same statistics and
+        summary as the pure-Python path.
+        """
+        tasks = [(f"TestHabit{number}", ("daily", "weekly", "monthly")[number % 3]) for number in range(30)]
+        self.tracker.create_habits(tasks)
+        start = to_timestamp("2023-10-01 00:00:00")
+        with self.tracker.batch():
+            for number in range(600):
+                self.tracker.complete_task(f"TestHabit{number * 7 % 29}", start + (number * 7919) % (90 * 86400))
+        self.tracker.analytics_workers = 2
+
+        try:
+            for as_of in ("2023-10-15 12:00:00", None):
+                self.assertEqual(self.tracker.get_habit_stats(as_of, engine="processes"),
+                                 self.tracker.get_habit_stats(as_of, engine="python"))
+                summary = self.tracker.get_stats_summary(as_of, n=3, engine="processes")
+                self.assertEqual(summary, self.tracker.get_stats_summary(as_of, n=3, engine="python"))
+            self.assertEqual(summary["habits"], 30)
+            self.assertEqual(len(summary["top_streaks"]), 3)
+            stats = self.tracker.get_habit_stats(engine="python")
+            self.assertEqual(summary["broken"], [task for task, broken in zip(stats["task"], stats["broken"]) if broken])
+            with self.assertRaises(ValueError):
+                self.tracker.get_habit_stats(engine="threads")
+        finally:
+            self.tracker.close()
+
+    def test_archive_history(self):
+        """
+        Test moving older completions to the archive.
+
+        Verifies that only recent completions stay in memory, that streaks, statistics and
+        reloads still see the whole history, and that backfilling an archived day is persisted.
+        """
+        self.tracker.create_habit("TestHabit", "daily")
+        start = to_timestamp("2023-01-01 08:00:00")
+        with self.tracker.batch():
+            for day in range(100):
+                self.tracker.complete_task("TestHabit", start + day * 86400)
+        as_of = "2023-02-15 12:00:00"
+        stats = self.tracker.get_habit_stats(as_of, engine="python")
+        history = list(self.tracker.get_habit("TestHabit").completed_at)
+
+        self.assertEqual(self.tracker.archive_history("2023-03-15 00:00:00"), 73)
+        self.assertEqual(len(self.tracker.get_habit("TestHabit").completed_at.recent), 27)
+        tracker = HabitTracker(data_file=self.data_file)
+        habit = tracker.get_habit("TestHabit")
+        self.assertEqual((habit.completed_at.archived(), len(habit.completed_at)), (73, 100))
+        self.assertEqual(habit.longest_streak, 100)
+        self.assertEqual(list(habit.completed_at), history)
+        self.assertEqual(tracker.get_habit_stats(as_of, engine="python"), stats)
+
+        tracker.complete_task("TestHabit", "2022-12-31 08:00:00")
+        habit = HabitTracker(data_file=self.data_file).get_habit("TestHabit")
+        self.assertEqual((len(habit.completed_at), habit.longest_streak), (101, 101))
+        with self.assertRaises(ValueError):
+            HabitTracker(data_file=self.data_file, storage=mock.Mock(tiered=False), hot_days=30)
+
+    def test_snapshot_isolation(self):
+        """
+        Test point-in-time snapshots.
+
+        Verifies that a snapshot doesn't see later changes, that the next snapshot shares the
+        habits that didn't change, that Analytics works on snapshots, and that they are read-only.
+        """
+        for name in ("TestHabit1", "TestHabit2", "TestHabit3"):
+            self.tracker.create_habit(name, "daily")
+        self.tracker.complete_task("TestHabit1", "2023-12-01 08:00:00")
+        snapshot = self.tracker.snapshot()
+        self.assertIs(self.tracker.snapshot(), snapshot)
+
+        self.tracker.complete_task("TestHabit1", "2023-12-02 08:00:00")
+        self.tracker.delete_habit("TestHabit2")
+        self.tracker.create_habit("TestHabit2", "weekly")
+        self.assertEqual([habit.task for habit in snapshot.get_all_habits()], ["TestHabit1", "TestHabit2", "TestHabit3"])
+        self.assertEqual((snapshot.get_habit("testhabit1").streak, len(snapshot.get_habit("TestHabit1").completed_at)), (1, 1))
+        self.assertEqual(str(snapshot.get_habit("TestHabit2").periodicity), "daily")
+
+        later = self.tracker.snapshot()
+        self.assertGreater(later.version, snapshot.version)
+        self.assertEqual([habit.task for habit in later.get_all_habits()], ["TestHabit1", "TestHabit3", "TestHabit2"])
+        self.assertEqual(later.get_habit("TestHabit1").streak, 2)
+        self.assertIs(later.get_habit("TestHabit3"), snapshot.get_habit("TestHabit3"))
+        self.assertEqual(Analytics(later).get_habit_stats(engine="python"), self.tracker.get_habit_stats(engine="python"))
+        self.assertEqual([habit.task for habit in Analytics(later).get_broken_habits()], ["TestHabit1"])
+        self.assertEqual(later.get_habit("TestHabit1").streak, 2)
+        with self.assertRaises(ValueError):
+            later.complete_task("TestHabit1")
+
+        for _ in range(50):
+            first = self.tracker.get_all_habits()[0].task
+            self.tracker.delete_habit(first)
+            self.tracker.create_habit(first, "daily")
+            later = self.tracker.snapshot()
+            self.assertEqual([habit.task for habit in later.get_all_habits()],
+                             [habit.task for habit in self.tracker.get_all_habits()])
+        self.assertLessEqual(later.habits._next_order, 2 * len(later.habits))
+
+    def test_replay_stats_over_time(self):
+        """
+        Test replaying completions to compute past statistics.
+
+        Verifies that every snapshot of a single replay matches get_habit_stats at that time,
+        that period snapshots cover every day, and that finding past broken habits changes nothing.
+        """
+        tasks = [(f"TestHabit{number}", ("daily", "weekly", "monthly")[number % 3]) for number in range(30)]
+        self.tracker.create_habits(tasks)
+        start = to_timestamp("2023-10-01 00:00:00")
+        with self.tracker.batch():
+            for number in range(600):
+                self.tracker.complete_task(f"TestHabit{number * 7 % 29}", start + (number * 7919) % (90 * 86400))
+        streaks = [habit.streak for habit in self.tracker.get_all_habits()]
+
+        times = ["2023-09-01 00:00:00", "2023-10-15 12:00:00", "2023-11-02 08:00:00", "2023-12-01 00:00:00",
+                 int(datetime.now().timestamp())]
+        for (timestamp, stats), as_of in zip(self.tracker.replay_stats(times), times):
+            self.assertEqual(timestamp, to_timestamp(as_of))
+            self.assertEqual(stats, self.tracker.get_habit_stats(as_of, engine="python"))
+        snapshots = list(Analytics(self.tracker).get_period_snapshots("2023-10-01 12:00:00", "2023-10-31 12:00:00"))
+        self.assertEqual(len(snapshots), 31)
+        self.assertEqual(format_timestamp(snapshots[0][0]), "2023-10-01 23:59:59")
+        self.assertEqual(snapshots[-1][1], self.tracker.get_habit_stats("2023-10-31 23:59:59", engine="python"))
+        with self.assertRaises(ValueError):
+            list(self.tracker.replay_stats(["2023-12-01 00:00:00", "2023-11-01 00:00:00"]))
+
+        broken = self.tracker.get_broken_habits(as_of="2023-11-02 08:00:00")
+        stats = self.tracker.get_habit_stats("2023-11-02 08:00:00", engine="python")
+        self.assertEqual([habit.task for habit in broken],
+                         [task for task, flag in zip(stats["task"], stats["broken"]) if flag])
+        self.assertEqual([habit.streak for habit in self.tracker.get_all_habits()], streaks)
+
+    def test_journal_appends_without_rewriting_data_file(self):
+        """
+        Test journaled storage mode.
+
+        Verifies that mutations are appended to the journal and replayed when the data is loaded again.
+        """
+        tracker = HabitTracker(data_file=self.data_file, journal=True)
+        tracker.create_habit("TestHabit1", "daily")
+        tracker.create_habit("TestHabit2", "weekly")
+        tracker.complete_task("TestHabit1", custom_completed_at="2023-12-09 12:00:00")
+        tracker.delete_habit("TestHabit2")
+
+        self.assertFalse(os.path.exists(self.data_file))
+        with open(self.data_file + ".journal") as file:
+            self.assertEqual(len(file.readlines()), 4)
+
+        reloaded = HabitTracker(data_file=self.data_file)
+        habits = reloaded.get_all_habits()
+        self.assertEqual(len(habits), 1)
+        self.assertEqual(list(habits[0]["completed_at"]), [to_timestamp("2023-12-09 12:00:00")])
+        self.assertEqual(habits[0]["streak"], 1)
+
+    def test_compact_folds_journal_into_data_file(self):
+        """
+        Test journal compaction.
+
+        Verifies that compacting writes a new snapshot, removes the journal and preserves the habits.
+        """
+        tracker = HabitTracker(data_file=self.data_file, journal=True)
+        tracker.create_habit("TestHabit", "daily")
+        tracker.complete_task("TestHabit")
+        tracker.compact()
+
+        self.assertFalse(os.path.exists(self.data_file + ".journal"))
+        with open(self.data_file) as file:
+            self.assertEqual(json.load(file)["habits"][0]["task"], "TestHabit")
+
+        # A torn trailing record is ignored on replay
+        with open(self.data_file + ".journal", "w") as file:
+            file.write('{"op": "complete", "task": "TestHa')
+        reloaded = HabitTracker(data_file=self.data_file, journal=True)
+        self.assertEqual(reloaded.get_all_habits()[0]["streak"], 1)
+
+        # Records appended after the torn one survive the next reload
+        reloaded.create_habit("TestHabit2", "daily")
+        reloaded.complete_task("TestHabit", "2023-12-10 08:00:00")
+        reloaded = HabitTracker(data_file=self.data_file, journal=True)
+        self.assertEqual([habit.task for habit in reloaded.get_all_habits()], ["TestHabit", "TestHabit2"])
+        self.assertEqual(len(reloaded.get_habit("TestHabit").completed_at), 2)
+
+    def test_name_index_is_case_insensitive(self):
+        """
+        Test habit lookups through the name index.
+
+        Verifies that lookups, duplicate checks, completions and deletes ignore the case of the name.
+        """
+        self.tracker.create_habit("TestHabit", "daily")
+        self.tracker.create_habit("testhabit", "weekly")
+        self.assertEqual(len(self.tracker.get_all_habits()), 1)
+        self.assertEqual(self.tracker.get_habit("TESTHABIT")["periodicity"], "daily")
+
+        self.tracker.complete_task("testHabit")
+        self.assertEqual(self.tracker.get_longest_run_streak_for_habit("TestHabit"), 1)
+
+        self.tracker.delete_habit("TESTHABIT")
+        self.assertIsNone(self.tracker.get_habit("TestHabit"))
+        self.assertEqual(HabitTracker(data_file=self.data_file).get_all_habits(), [])
+
+    def test_completion_history_is_kept(self):
+        """
+        Test that every completion is recorded.
+
+        Verifies that completions are kept as sorted epoch timestamps and survive a reload.
+        """
+        self.tracker.create_habit("TestHabit", "daily")
+        self.tracker.complete_task("TestHabit", custom_completed_at="2023-12-03 08:00:00")
+        self.tracker.complete_task("TestHabit", custom_completed_at="2023-12-01 08:00:00")
+        self.tracker.complete_task("TestHabit", custom_completed_at=datetime(2023, 12, 2, 8))
+
+        expected = [to_timestamp(f"2023-12-0{day} 08:00:00") for day in (1, 2, 3)]
+        self.assertEqual(list(self.tracker.get_habit("TestHabit")["completed_at"]), expected)
+        reloaded = HabitTracker(data_file=self.data_file)
+        self.assertEqual(list(reloaded.get_habit("TestHabit")["completed_at"]), expected)
+
+    def test_version_1_file_is_upgraded_on_load(self):
+        """
+        Test loading a file written before completion history was kept.
+
+        Verifies that single completion strings and empty lists become timestamp histories.
+        """
+        with open(self.data_file, "w") as file:
+            json.dump([
+                {"task": "Old", "periodicity": "daily", "created_at": "2023-11-01 19:21:03",
+                 "completed_at": "2023-12-03 23:51:41", "streak": 3},
+                {"task": "New", "periodicity": "weekly", "created_at": "2023-12-09 20:43:44",
+                 "completed_at": [], "streak": 0, "all_streaks": []}
+            ], file)
+
+        tracker = HabitTracker(data_file=self.data_file)
+        self.assertEqual(list(tracker.get_habit("Old")["completed_at"]), [to_timestamp("2023-12-03 23:51:41")])
+        self.assertEqual(len(tracker.get_habit("New")["completed_at"]), 0)
+        self.assertNotIn("all_streaks", tracker.get_habit("New"))
+
+    def test_habits_are_compact_records(self):
+        """
+        Test the Habit record model.
+
+        Verifies that habits are slotted records with a shared periodicity and an epoch creation
+        time, that they still read like dicts, and that version 2 files with formatted times load.
+        """
+        self.tracker.create_habit("TestHabit", "daily")
+        habit = self.tracker.get_habit("TestHabit")
+        self.assertFalse(hasattr(habit, "__dict__"))
+        self.assertIs(habit.periodicity, Periodicity.DAILY)
+        self.assertIsInstance(habit.created_at, int)
+        self.assertEqual(habit["periodicity"], "daily")
+        self.assertEqual(habit.as_dict()["created_at"], format_timestamp(habit.created_at))
+        self.assertEqual(dict(habit)["task"], "TestHabit")
+
+        with open(self.data_file, "w") as file:
+            json.dump({"version": 2, "habits": [
+                {"task": "Old", "periodicity": "weekly", "created_at": "2023-11-01 19:21:03",
+                 "completed_at": pack_timestamps([to_timestamp("2023-12-03 23:51:41")]),
+                 "streak": 1, "longest_streak": 1}
+            ]}, file)
+        old = HabitTracker(data_file=self.data_file).get_habit("Old")
+        self.assertEqual(old.created_at, to_timestamp("2023-11-01 19:21:03"))
+        self.assertIs(old.periodicity, Periodicity.WEEKLY)
+
+    def test_packed_history_is_compact(self):
+        """
+        Test the on-disk encoding of completion history.
+
+        Verifies that three years of daily check-ins pack into a few KB.
+        """
+        start = to_timestamp("2021-01-01 07:30:00")
+        timestamps = [start + day * 86400 + (day % 5) * 60 for day in range(3 * 365)]
+        self.assertLess(len(pack_timestamps(timestamps)), 5000)
+
+    def test_batch_saves_once(self):
+        """
+        Test batched mutations.
+
+        Verifies that bulk creates and completions are applied in memory and written with a single save.
+        """
+        with mock.patch.object(self.tracker, "save_data", wraps=self.tracker.save_data) as save_data:
+            with self.tracker.batch():
+                self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly")])
+                self.tracker.complete_tasks([("TestHabit1", None), ("TestHabit2", "2023-12-09 12:00:00")])
+                self.assertEqual(len(self.tracker.get_all_habits()), 2)
+            self.assertEqual(save_data.call_count, 1)
+
+        reloaded = HabitTracker(data_file=self.data_file)
+        self.assertEqual(reloaded.get_longest_run_streak_for_habit("TestHabit2"), 1)
+
+    def test_batch_rolls_back_on_error(self):
+        """
+        Test rolling back a failed batch.
+
+        Verifies that every change made inside a failing batch is reverted and nothing is saved.
+        """
+        self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly"), ("TestHabit3", "daily")])
+        self.tracker.complete_task("TestHabit2", custom_completed_at="2023-12-09 12:00:00")
+
+        with self.assertRaises(RuntimeError):
+            with self.tracker.batch():
+                self.tracker.create_habit("TestHabit4", "daily")
+                self.tracker.complete_task("TestHabit2", custom_completed_at="2023-12-01 12:00:00")
+                self.tracker.delete_habit("TestHabit1")
+                self.tracker.reset_data()
+                raise RuntimeError("import failed")
+
+        habits = self.tracker.get_all_habits()
+        self.assertEqual([habit["task"] for habit in habits], ["TestHabit1", "TestHabit2", "TestHabit3"])
+        self.assertEqual(list(habits[1]["completed_at"]), [to_timestamp("2023-12-09 12:00:00")])
+        self.assertEqual(habits[1]["streak"], 1)
+        self.assertEqual(len(HabitTracker(data_file=self.data_file).get_all_habits()), 3)
+
+    def test_broken_habits_follow_completions(self):
+        """
+        Test that the broken habit queue tracks later changes.
+
+        Verifies that completing or deleting a broken habit takes it off the broken list.
+        """
+        self.tracker.create_habit("TestHabit1", "daily")
+        self.tracker.create_habit("TestHabit2", "weekly")
+        self.tracker.create_habit("TestHabit3", "daily")
+        self.tracker.complete_task("TestHabit1", custom_completed_at=datetime.now() - timedelta(days=3))
+        self.tracker.complete_task("TestHabit2", custom_completed_at=datetime.now() - timedelta(days=15))
+        self.tracker.complete_task("TestHabit3", custom_completed_at=datetime.now() - timedelta(hours=1))
+
+        broken = [habit["task"] for habit in self.tracker.get_broken_habits()]
+        self.assertEqual(sorted(broken), ["TestHabit1", "TestHabit2"])
+
+        self.tracker.complete_task("TestHabit1")
+        self.tracker.delete_habit("TestHabit2")
+        self.assertEqual(self.tracker.get_broken_habits(), [])
+
+        # An older completion does not move the deadline forward
+        self.tracker.create_habit("TestHabit2", "weekly")
+        self.tracker.complete_task("TestHabit2", custom_completed_at=datetime.now() - timedelta(days=15))
+        self.tracker.complete_task("TestHabit2", custom_completed_at=datetime.now() - timedelta(days=30))
+        self.assertEqual([habit["task"] for habit in self.tracker.get_broken_habits()], ["TestHabit2"])
+        self.assertEqual([habit["task"] for habit in HabitTracker(self.data_file).get_broken_habits()],
+                         ["TestHabit2"])
+
+    def test_streaks_count_consecutive_periods(self):
+        """
+        Test the streak engine.
+
+        Verifies that streaks count consecutive days or weeks, ignore repeat completions within a
+        period and are recomputed when an earlier completion fills a gap.
+        """
+        self.tracker.create_habit("Daily", "daily")
+        self.tracker.create_habit("Weekly", "weekly")
+        for completed_at in ("2023-12-01 08:00:00", "2023-12-01 20:00:00", "2023-12-02 08:00:00",
+                             "2023-12-04 08:00:00", "2023-12-05 08:00:00", "2023-12-06 08:00:00"):
+            self.tracker.complete_task("Daily", custom_completed_at=completed_at)
+        # Monday 2023-11-27 and Sunday 2023-12-17 are two weeks apart
+        for completed_at in ("2023-11-27 08:00:00", "2023-12-17 08:00:00"):
+            self.tracker.complete_task("Weekly", custom_completed_at=completed_at)
+
+        daily = self.tracker.get_habit("Daily")
+        self.assertEqual((daily["streak"], daily["longest_streak"]), (3, 3))
+        self.assertEqual(self.tracker.get_habit("Weekly")["longest_streak"], 1)
+
+        self.tracker.complete_task("Daily", custom_completed_at="2023-12-03 08:00:00")
+        self.tracker.complete_tasks([("Weekly", "2023-12-10 08:00:00"), ("Weekly", "2023-12-11 08:00:00")])
+        self.assertEqual((daily["streak"], daily["longest_streak"]), (6, 6))
+        self.assertEqual(self.tracker.get_longest_run_streak_for_habit("weekly"), 3)
+
+    def test_top_streaks_leaderboard(self):
+        """
+        Test the longest streak leaderboard.
+
+        Verifies that the top habits are returned in order and follow completions and deletes.
+        """
+        for task, days in (("One", 1), ("Three", 3), ("Two", 2), ("Four", 4)):
+            self.tracker.create_habit(task, "daily")
+            for day in range(days):
+                self.tracker.complete_task(task, custom_completed_at=f"2023-12-0{day + 1} 08:00:00")
+
+        self.assertEqual(self.tracker.get_top_streaks(3), [("Four", 4), ("Three", 3), ("Two", 2)])
+        self.tracker.delete_habit("Four")
+        self.tracker.complete_task("Two", custom_completed_at="2023-12-03 08:00:00")
+        self.tracker.complete_task("Two", custom_completed_at="2023-12-04 08:00:00")
+        self.assertEqual(self.tracker.get_top_streaks(2), [("Two", 4), ("Three", 3)])
+        self.assertEqual(self.tracker.get_longest_run_streak_all(), "Two: 4")
+        self.assertEqual(HabitTracker(data_file=self.data_file).get_top_streaks(2), [("Two", 4), ("Three", 3)])
+
+    def test_write_behind_coalesces_writes(self):
+        """
+        Test write-behind persistence.
+
+        Verifies that a burst of mutations is written by the background thread in a single write.
+        """
+        tracker = HabitTracker(data_file=self.data_file, write_behind=True, flush_delay=60)
+        with mock.patch.object(tracker.storage, "write", wraps=tracker.storage.write) as write:
+            tracker.create_habit("TestHabit", "daily")
+            for day in range(1, 8):
+                tracker.complete_task("TestHabit", custom_completed_at=f"2023-12-0{day} 08:00:00")
+            self.assertFalse(os.path.exists(self.data_file))
+            self.assertEqual(tracker.get_longest_run_streak_for_habit("TestHabit"), 7)
+
+            tracker.flush()
+            self.assertEqual(write.call_count, 1)
+        tracker.close()
+        self.assertEqual(HabitTracker(data_file=self.data_file).get_longest_run_streak_for_habit("TestHabit"), 7)
+
+    def test_write_behind_threshold_and_close(self):
+        """
+        Test the write-behind durability bounds.
+
+        Verifies that reaching the threshold triggers a write and closing flushes the remaining mutations.
+        """
+        tracker = HabitTracker(data_file=self.data_file, journal=True, write_behind=True, flush_delay=60,
+                               flush_threshold=3)
+        tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "daily"), ("TestHabit3", "daily")])
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.data_file + ".journal") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(HabitTracker(data_file=self.data_file).get_all_habits()), 3)
+
+        tracker.delete_habit("TestHabit2")
+        tracker.close()
+        self.assertFalse(tracker._writer._thread.is_alive())
+        self.assertEqual(len(HabitTracker(data_file=self.data_file).get_all_habits()), 2)
+
+    def test_write_behind_flush_delay(self):
+        """
+        Test the write-behind time bound.
+
+        Verifies that a mutation below the threshold is written once flush_delay has passed,
+        without flushing or closing.
+        """
+        tracker = HabitTracker(data_file=self.data_file, journal=True, write_behind=True, flush_delay=0.1)
+        tracker.create_habit("TestHabit", "daily")
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.data_file + ".journal") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(HabitTracker(data_file=self.data_file).get_all_habits()), 1)
+        tracker.close()
+
+    def test_sync_during_write_behind_flush(self):
+        """
+        Test catching up with other processes while a write-behind flush is in progress.
+
+        Verifies that sync() waits for the write to finish, and that no thread waits for the
+        tracker's lock while holding the data file lock, which could deadlock the two.
+        """
+        tracker = HabitTracker(data_file=self.data_file, write_behind=True, flush_delay=60)
+        tracker.create_habit("TestHabit", "daily")
+        held = threading.local()
+        reversed_order = []
+        writing = threading.Event()
+        file_lock = tracker.storage.lock()
+        acquire_file, release_file, write = file_lock.acquire, file_lock.release, tracker.storage.write
+
+        class CheckedLock:
+            def __init__(self, lock):
+                self.lock = lock
+
+            def acquire(self):
+                if getattr(held, "file", 0) and not getattr(held, "tracker", 0):
+                    reversed_order.append(threading.current_thread().name)
+                self.lock.acquire()
+                held.tracker = getattr(held, "tracker", 0) + 1
+                return True
+
+            def release(self):
+                held.tracker -= 1
+                self.lock.release()
+
+            __enter__ = acquire
+
+            def __exit__(self, *exc_info):
+                self.release()
+
+        def checked_acquire_file():
+            acquire_file()
+            held.file = getattr(held, "file", 0) + 1
+
+        def checked_release_file():
+            held.file -= 1
+            release_file()
+
+        def slow_write(data):
+            writing.set()
+            time.sleep(0.2)  # Let sync() start waiting while the data file is written
+            write(data)
+
+        tracker._lock = CheckedLock(tracker._lock)
+        with mock.patch.object(file_lock, "acquire", checked_acquire_file), \
+                mock.patch.object(file_lock, "release", checked_release_file), \
+                mock.patch.object(tracker.storage, "write", slow_write):
+            flusher = threading.Thread(target=tracker.flush, daemon=True)
+            flusher.start()
+            self.assertTrue(writing.wait(5))
+            syncer = threading.Thread(target=tracker.sync, daemon=True)
+            syncer.start()
+            for thread in (flusher, syncer):
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+        self.assertEqual(reversed_order, [])
+        tracker.close()
+        self.assertEqual(len(HabitTracker(data_file=self.data_file).get_all_habits()), 1)
+
+    def test_change_events(self):
+        """
+        Test change notifications.
+
+        Verifies that subscribers are told about every change, that batched changes are announced
+        when the batch commits and never if it rolls back, and that unsubscribing stops them.
+        """
+        events = []
+
+        def callback(event, habit):
+            events.append((event, habit and habit.task))
+
+        self.tracker.subscribe(callback)
+        self.tracker.create_habit("TestHabit1", "daily")
+        self.tracker.complete_task("TestHabit1")
+        self.tracker.delete_habit("TestHabit1")
+        self.tracker.reset_data()
+        self.assertEqual(events, [("habit_created", "TestHabit1"), ("habit_completed", "TestHabit1"),
+                                  ("habit_deleted", "TestHabit1"), ("reset", None)])
+
+        events.clear()
+        with self.tracker.batch():
+            self.tracker.create_habits([("TestHabit2", "daily"), ("TestHabit3", "weekly")])
+            self.assertEqual(events, [])
+        self.assertEqual(events, [("habit_created", "TestHabit2"), ("habit_created", "TestHabit3")])
+
+        events.clear()
+        with self.assertRaises(RuntimeError):
+            with self.tracker.batch():
+                self.tracker.delete_habit("TestHabit2")
+                raise RuntimeError("import failed")
+        self.tracker.load_data()
+        self.assertEqual(events, [("reload", None)])
+
+        self.tracker.unsubscribe(callback)
+        self.tracker.complete_task("TestHabit2")
+        self.assertEqual(len(events), 1)
+
+    def test_import_export_round_trip(self):
+        """
+        Test streaming export and import.
+
+        Verifies that habits and completions exported to NDJSON and CSV import into an empty
+        tracker unchanged, and that importing them again only finds duplicates.
+        """
+        self.tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly")])
+        self.tracker.complete_tasks([("TestHabit1", "2023-12-01 08:00:00"), ("TestHabit1", "2023-12-02 08:00:00"),
+                                     ("TestHabit2", "2023-12-09 12:00:00")])
+
+        for rows_file in ("test_export.ndjson", "test_export.csv"):
+            self.assertEqual(self.tracker.export_habits(rows_file), 5)
+            imported = HabitTracker(data_file=self.data_file + ".import", journal=True)
+            self.assertEqual(imported.import_habits(rows_file, chunk_size=2),
+                             {"habits": 2, "completions": 3, "duplicates": 0, "invalid": 0})
+            self.assertEqual(imported.import_habits(rows_file)["duplicates"], 5)
+            self.assertEqual([(habit.task, str(habit.periodicity), list(habit.completed_at), habit.longest_streak)
+                              for habit in HabitTracker(data_file=self.data_file + ".import").get_all_habits()],
+                             [(habit.task, str(habit.periodicity), list(habit.completed_at), habit.longest_streak)
+                              for habit in self.tracker.get_all_habits()])
+            for path in (rows_file, self.data_file + ".import.journal", self.data_file + ".import.lock"):
+                os.remove(path)
+
+    def test_import_validates_rows_in_chunks(self):
+        """
+        Test importing rows from a generator.
+
+        Verifies that completions may arrive out of order, that invalid rows are reported or
+        counted, that a failing chunk is rolled back and that a whole-file data file is saved once.
+        """
+        def rows():
+            yield {"type": "habit", "task": "TestHabit", "periodicity": "daily", "created_at": "2023-11-01 08:00:00"}
+            for day in (3, 1, 2):
+                yield {"type": "completion", "task": "TestHabit", "completed_at": f"2023-12-0{day} 08:00:00"}
+            yield {"type": "completion", "task": "Missing", "completed_at": "2023-12-01 08:00:00"}
+            yield {"type": "habit", "task": "Other", "periodicity": "monthly"}
+
+        with mock.patch.object(self.tracker, "save_data", wraps=self.tracker.save_data) as save_data:
+            counts = self.tracker.import_habits(rows(), chunk_size=2, skip_invalid=True)
+            self.assertEqual(save_data.call_count, 1)
+        self.assertEqual(counts, {"habits": 1, "completions": 3, "duplicates": 0, "invalid": 2})
+        habit = self.tracker.get_habit("TestHabit")
+        self.assertEqual((habit.streak, habit.longest_streak), (3, 3))
+        self.assertEqual(habit.created_at, to_timestamp("2023-11-01 08:00:00"))
+
+        self.tracker.reset_data()
+        with self.assertRaises(ValueError):
+            self.tracker.import_habits(rows(), chunk_size=4)
+        self.assertEqual(len(self.tracker.get_habit("TestHabit").completed_at), 3)
+        self.assertEqual(HabitTracker(data_file=self.data_file).get_longest_run_streak_for_habit("TestHabit"), 3)
+
+    def test_metrics(self):
+        """
+        Test the opt-in instrumentation.
+
+        Verifies that nothing is wrapped while metrics are disabled, and that calls, latencies and
+        bytes written are collected and dumped once they are enabled.
+        """
+        self.assertIsNone(self.tracker.metrics())
+        self.assertNotIn("create_habit", vars(self.tracker))
+
+        metrics_file = self.data_file + ".metrics"
+        tracker = HabitTracker(data_file=self.data_file, metrics=True)
+        tracker.enable_metrics(dump_file=metrics_file, dump_interval=60)
+        tracker.create_habits([("TestHabit1", "daily"), ("TestHabit2", "weekly")])
+        tracker.complete_task("TestHabit1")
+        Analytics(tracker).get_broken_habits()
+        tracker.close()
+
+        metrics = tracker.metrics()
+        self.assertEqual(metrics["calls"]["HabitTracker.create_habit"]["count"], 2)
+        self.assertEqual(metrics["calls"]["HabitTracker.complete_task"]["count"], 1)
+        self.assertEqual(metrics["calls"]["Analytics.get_broken_habits"]["count"], 1)
+        self.assertEqual(metrics["calls"]["JsonStorage.save"]["count"], 2)
+        self.assertEqual(metrics["io"]["JsonStorage.write"]["count"], 2)
+        self.assertGreater(metrics["io"]["JsonStorage.write"]["bytes_written"], os.path.getsize(self.data_file))
+        with open(metrics_file) as file:
+            self.assertIn("HabitTracker.load_data", json.load(file)["calls"])
+        os.remove(metrics_file)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file